@@ -1,15 +1,38 @@
 from __future__ import annotations
 
+import os
 import time
 from pathlib import Path
 
 import streamlit as st
 
 from src.mrc.auth import require_login
-from src.mrc.ingest import load_uploaded_files, load_corpus_folder, chunk_documents
-from src.mrc.store import rebuild_store, clear_store, retrieve
-from src.mrc.llm import generate_answer
+from src.mrc.client import get_service_client
+from src.mrc.ingest import (
+    chunk_documents,
+    load_corpus_folder,
+    load_uploaded_files,
+    parse_corpus_folder,
+    parse_uploaded_files,
+)
+from src.mrc.store import (
+    clear_store,
+    embed_query,
+    get_chunk_store,
+    index_version,
+    rebuild_store,
+    retrieve,
+    rollback,
+    update_store,
+)
+from src.mrc.answer_cache import answer_cache
+from src.mrc.dedup import DedupStats, dedup_chunks
+from src.mrc.embeddings import warmup
+from src.mrc.lang import detect_language
+from src.mrc.hedge import HEDGE_ENABLED
+from src.mrc.llm import stream_answer
 from src.mrc.telemetry import mlflow_log_chat, mlflow_log_index
+from src.mrc.tracing import stage
 
 
 st.set_page_config(page_title="Multilingual RAG Copilot", page_icon="🌍", layout="wide")
@@ -27,20 +50,117 @@ with st.sidebar:
     groq_model = st.text_input("Groq model", value="openai/gpt-oss-20b")
     ollama_base_url = st.text_input("Ollama base URL", value="http://localhost:11434")
     ollama_model = st.text_input("Ollama model", value="llama3.1")
+    hedge = st.checkbox(
+        "Hedge with the other backend",
+        value=HEDGE_ENABLED,
+        help="If the backend is slow to start answering (or failing), also ask the other "
+        "one and keep whichever answers first.",
+    )
+
+    st.subheader("Service (optional)")
+    service_url = st.text_input(
+        "Retrieval service URL",
+        value=os.getenv("MRC_SERVICE_URL", ""),
+        help="Answer questions through a running `python -m src.mrc.service` "
+        "instead of loading the embedding model in the app.",
+    )
+    service = get_service_client(service_url) if service_url else None
+    if service is not None:
+        embed_fn, retrieve_fn = service.embed_query, service.retrieve
+        answer_fn, version_fn = service.stream_answer, service.index_version
+    else:
+        embed_fn, retrieve_fn = embed_query, retrieve
+        answer_fn, version_fn = stream_answer, index_version
 
     st.subheader("Embeddings")
     embedding_model = st.text_input(
         "Embedding model",
         value="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
     )
+    if service is not None:
+        try:
+            status = service.status()
+            if status.get("ready"):
+                st.caption(f"Service ready · {status['embedding_model']}")
+            else:
+                st.warning(f"Service not ready: {status.get('error') or 'loading model'}")
+        except Exception as e:
+            st.error(f"Could not reach the service: {e}")
+    else:
+        try:
+            with st.spinner("Loading embedding model…"):
+                model_info = warmup(embedding_model)
+            st.caption(
+                f"Loaded in {model_info.load_s:.1f}s · "
+                f"{model_info.resident_bytes / 1e6:.0f} MB resident · {model_info.runtime}"
+            )
+            if model_info.fallback:
+                st.warning(f"ONNX runtime unavailable, using PyTorch: {model_info.fallback}")
+        except Exception as e:
+            st.error(f"Could not load embedding model: {e}")
 
     st.subheader("Chunking / Retrieval")
     chunk_size = st.slider("Chunk size (chars)", 400, 2000, 900, 50)
     overlap = st.slider("Overlap (chars)", 0, 400, 150, 10)
     top_k = st.slider("Top-k chunks", 2, 12, 6, 1)
+    vector_backend = st.selectbox(
+        "Vector store",
+        ["chroma", "numpy"],
+        index=0,
+        help="numpy: exact search over a memory-mapped matrix, fast for mid-size corpora.",
+    )
+    retrieval_mode = st.selectbox(
+        "Retrieval mode",
+        ["hybrid", "dense", "lexical"],
+        index=0,
+        help="hybrid: dense + BM25 merged by reciprocal rank fusion (catches exact codes and ids).",
+    )
+    lang_mode = st.selectbox(
+        "Language filter",
+        ["off", "filter", "prefer"],
+        index=0,
+        help="filter: only search documents in the question's language; "
+        "prefer: same, but search everything if too little matches.",
+    )
+    context_tokens = st.number_input(
+        "Context token budget",
+        min_value=0,
+        max_value=32000,
+        value=0,
+        step=500,
+        help="Prompt context size; 0 uses the default for the selected LLM model.",
+    )
+    show_neighbours = st.checkbox("Show neighbouring chunks in sources", value=False)
+    parse_workers = st.slider(
+        "Parse workers",
+        0,
+        os.cpu_count() or 1,
+        0,
+        1,
+        help="Parse files in a process pool (0 = parse in the app process).",
+    )
+    incremental = st.checkbox(
+        "Incremental indexing",
+        value=True,
+        help="Only embed new or changed chunks; removes chunks of files no longer present.",
+    )
+    dedup = st.checkbox(
+        "Skip near-duplicate chunks",
+        value=True,
+        help="Embed one copy of near-identical chunks (e.g. document versions); "
+        "the other copies are still cited.",
+    )
+
+    st.subheader("Answer cache")
+    use_answer_cache = st.checkbox("Reuse answers to similar questions", value=True)
+    cache_threshold = st.slider("Similarity threshold", 0.80, 0.99, 0.92, 0.01)
 
-    #st.subheader("Observability (optional)")
-    #enable_mlflow = st.checkbox("Enable MLflow logging", value=False)
+    st.subheader("Observability (optional)")
+    enable_mlflow = st.checkbox(
+        "Enable MLflow logging",
+        value=False,
+        help="Events are queued and written to MLflow in batches by a background thread.",
+    )
 
     st.divider()
     col1, col2 = st.columns(2)
@@ -51,6 +171,13 @@ with st.sidebar:
     if col2.button("🔄 Reset chat", use_container_width=True):
         st.session_state.messages = []
         st.toast("Chat reset.")
+    st.caption(f"Live index version: {version_fn(vector_backend)}")
+    if st.button("⏪ Roll back index", use_container_width=True):
+        previous = rollback(vector_backend)
+        if previous:
+            st.toast(f"Rolled back to index version {previous}.")
+        else:
+            st.toast("No older index version to roll back to.")
 
     st.markdown("")  # small spacing before logout
 
@@ -79,41 +206,102 @@ if "index_ready" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+
+def _index_progress(last=None):
+    bar = st.progress(0.0, text="Embedding chunks…")
+
+    def _update(done, total, rate):
+        if last is not None:
+            last["rate"] = rate
+        frac = min(done / total, 1.0) if total else 0.0
+        bar.progress(frac, text=f"Embedded {done}/{total or '?'} chunks · {rate:.0f} chunks/s")
+
+    return _update
+
+
+def _docs_from(results):
+    failed = [r for r in results if r.error]
+    for r in failed:
+        st.warning(f"Skipped {r.source}: {r.error}")
+    with st.expander(f"Parse timings ({len(results)} files, {len(failed)} failed)"):
+        for r in sorted(results, key=lambda r: r.seconds, reverse=True):
+            st.caption(f"{r.source}: {r.seconds:.2f}s" + (" (cached)" if r.cached else ""))
+    docs = [r.doc for r in results if r.doc is not None and r.doc.text]
+    return docs, {r.source for r in failed}
+
+
+def _build_index(chunks, failed=()):
+    dedup_stats = DedupStats()
+    last = {"rate": 0.0}
+    if dedup:
+        chunks = list(dedup_chunks(chunks, stats=dedup_stats))
+    if incremental:
+        diff = update_store(
+            chunks,
+            embedding_model=embedding_model,
+            progress=_index_progress(last),
+            backend=vector_backend,
+            keep=failed,
+        )
+        detail = "full rebuild" if diff.full_rebuild else diff.summary()
+    else:
+        rebuild_store(
+            chunks,
+            embedding_model=embedding_model,
+            progress=_index_progress(last),
+            backend=vector_backend,
+        )
+        detail = "full rebuild"
+    if dedup_stats.duplicates:
+        detail += (
+            f"; {dedup_stats.duplicates} near-duplicates kept as aliases, "
+            f"~{dedup_stats.embed_s_saved(last['rate']):.1f}s of embedding saved"
+        )
+    st.session_state.index_ready = True
+    index_msg.success(f"Index ready: {len(chunks)} chunks ({detail}).")
+
+
 if btn_col1.button("📚 Build index from uploads", type="primary", use_container_width=True):
     if not uploads:
         st.warning("Upload at least one document.")
     else:
         t0 = time.time()
-        docs = load_uploaded_files(uploads)
-        chunks = chunk_documents(docs, chunk_size=chunk_size, overlap=overlap)
-        rebuild_store(chunks, embedding_model=embedding_model)
-        st.session_state.index_ready = True
-        index_msg.success(f"Index ready: {len(chunks)} chunks.")
-        #if enable_mlflow:
-        #    mlflow_log_index(
-        #        doc_count=len(docs),
-        #        chunk_count=len(chunks),
-        #        embedding_model=embedding_model,
-        #        elapsed_s=time.time() - t0,
-        #    )
+        with stage("index", backend=vector_backend, incremental=incremental):
+            failed = set()
+            if parse_workers:
+                docs, failed = _docs_from(parse_uploaded_files(uploads, workers=parse_workers))
+            else:
+                docs = load_uploaded_files(uploads)
+            chunks = chunk_documents(docs, chunk_size=chunk_size, overlap=overlap)
+            _build_index(chunks, failed)
+        if enable_mlflow:
+            mlflow_log_index(
+                doc_count=len(docs),
+                chunk_count=len(chunks),
+                embedding_model=embedding_model,
+                elapsed_s=time.time() - t0,
+            )
 
 if btn_col2.button("📁 Index corpus folder", use_container_width=True):
     t0 = time.time()
-    docs = load_corpus_folder(Path("corpus"))
-    if not docs:
-        st.warning("No documents found in ./corpus. Add files or use uploads.")
-    else:
-        chunks = chunk_documents(docs, chunk_size=chunk_size, overlap=overlap)
-        rebuild_store(chunks, embedding_model=embedding_model)
-        st.session_state.index_ready = True
-        index_msg.success(f"Index ready: {len(chunks)} chunks.")
-        #if enable_mlflow:
-        #    mlflow_log_index(
-        #        doc_count=len(docs),
-        #        chunk_count=len(chunks),
-        #        embedding_model=embedding_model,
-        #        elapsed_s=time.time() - t0,
-        #    )
+    with stage("index", backend=vector_backend, incremental=incremental):
+        failed = set()
+        if parse_workers:
+            docs, failed = _docs_from(parse_corpus_folder(Path("corpus"), workers=parse_workers))
+        else:
+            docs = load_corpus_folder(Path("corpus"))
+        if not docs:
+            st.warning("No documents found in ./corpus. Add files or use uploads.")
+        else:
+            chunks = chunk_documents(docs, chunk_size=chunk_size, overlap=overlap)
+            _build_index(chunks, failed)
+            if enable_mlflow:
+                mlflow_log_index(
+                    doc_count=len(docs),
+                    chunk_count=len(chunks),
+                    embedding_model=embedding_model,
+                    elapsed_s=time.time() - t0,
+                )
 
 st.divider()
 st.subheader("Ask questions")
@@ -128,6 +316,8 @@ for m in st.session_state.messages:
             with st.expander("Sources"):
                 for s in m["sources"]:
                     st.markdown(f"- **{s['source']}** (chunk {s['chunk_id']}, score={s['score']:.3f})")
+                    if s.get("aliases"):
+                        st.caption("Also in: " + ", ".join(s["aliases"]))
                     st.caption(s["snippet"])
 
 question = st.chat_input("Ask something about your documents…")
@@ -136,21 +326,79 @@ if question:
     with st.chat_message("user"):
         st.markdown(question)
 
-    with st.chat_message("assistant"):
+    with stage("chat", backend=backend, mode=retrieval_mode), st.chat_message("assistant"):
         try:
             t0 = time.time()
-            contexts = retrieve(question, embedding_model=embedding_model, top_k=top_k)
-            answer = generate_answer(
-                backend=backend,
-                question=question,
-                contexts=contexts,
-                groq_model=groq_model,
-                ollama_base_url=ollama_base_url,
-                ollama_model=ollama_model,
+            llm_model = groq_model if backend == "groq" else ollama_model
+            cache_key = (
+                backend,
+                llm_model,
+                # Question vectors only compare within one embedding model.
+                embedding_model,
+                top_k,
+                f"{vector_backend}:{retrieval_mode}:{lang_mode}:{version_fn(vector_backend)}",
+                # Multilingual embeddings put translations close together.
+                detect_language(question),
+            )
+            q_emb = embed_fn(question, embedding_model)
+            cached = (
+                answer_cache.lookup(q_emb, cache_key, threshold=cache_threshold)
+                if use_answer_cache
+                else None
             )
+            answer_stream = None
+            timings = {}
+            if cached is not None:
+                contexts = cached.sources
+                answer = cached.answer
+                st.markdown(answer)
+                st.caption(
+                    f"Cached answer (similarity {cached.similarity:.3f} to “{cached.question}”)"
+                )
+            else:
+                contexts = retrieve_fn(
+                    question,
+                    embedding_model=embedding_model,
+                    top_k=top_k,
+                    query_embedding=q_emb,
+                    backend=vector_backend,
+                    mode=retrieval_mode,
+                    timings=timings,
+                    lang_mode=lang_mode,
+                )
+                answer_stream = answer_fn(
+                    backend=backend,
+                    question=question,
+                    contexts=contexts,
+                    groq_model=groq_model,
+                    ollama_base_url=ollama_base_url,
+                    ollama_model=ollama_model,
+                    context_tokens=context_tokens or None,
+                    hedge=hedge,
+                )
+                st.write_stream(answer_stream)
+                answer = answer_stream.text
+                if use_answer_cache and answer:
+                    answer_cache.store(q_emb, cache_key, question, answer, contexts)
             elapsed = time.time() - t0
-
-            st.markdown(answer)
+            if answer_stream is not None and answer_stream.ttft_s is not None:
+                st.caption(
+                    f"First token {answer_stream.ttft_s:.2f}s · "
+                    f"generation {answer_stream.total_s:.2f}s · total {elapsed:.2f}s"
+                    + (f" · answered by {answer_stream.backend}" if hedge else "")
+                )
+            if answer_stream is not None and answer_stream.context is not None:
+                packed = answer_stream.context
+                st.caption(
+                    f"Context: {packed.tokens_out}/{packed.budget} tokens · "
+                    f"saved {packed.tokens_saved} "
+                    f"({packed.duplicates} duplicate, {packed.dropped} dropped chunks)"
+                )
+            if timings:
+                st.caption(
+                    "Retrieval: "
+                    + " · ".join(f"{k[:-2]} {v * 1000:.0f} ms" for k, v in timings.items())
+                )
             sources = []
             with st.expander("Sources"):
                 for c in contexts:
@@ -160,13 +408,25 @@ if question:
                     st.markdown(
                         f"- **{c['source']}** (chunk {c['chunk_id']}, score={c['score']:.3f})"
                     )
+                    aliases = [
+                        f"{a['source']} (chunk {a['chunk_id']})" for a in c.get("aliases") or []
+                    ]
+                    if aliases:
+                        st.caption("Also in: " + ", ".join(aliases))
                     st.caption(snippet)
+                    if show_neighbours and service is None:
+                        with get_chunk_store(vector_backend, c.get("shard")) as chunk_store:
+                            around = chunk_store.neighbours(c["source"], c["chunk_id"], window=1)
+                        for n in around:
+                            if n["chunk_id"] != c["chunk_id"]:
+                                st.caption(f"↳ chunk {n['chunk_id']}: {n['text'][:260]}…")
                     sources.append(
                         {
                             "source": c["source"],
                             "chunk_id": c["chunk_id"],
                             "score": c["score"],
                             "snippet": snippet,
+                            "aliases": aliases,
                         }
                     )
 
@@ -174,14 +434,15 @@ if question:
                 {"role": "assistant", "content": answer, "sources": sources}
             )
 
-            #if enable_mlflow:
-            #    mlflow_log_chat(
-            #        backend=backend,
-            #        model=groq_model if backend == "groq" else ollama_model,
-            #        top_k=top_k,
-            #        latency_s=elapsed,
-            #        retrieved=len(contexts),
-            #    )
+            if enable_mlflow:
+                mlflow_log_chat(
+                    backend=backend,
+                    model=llm_model,
+                    top_k=top_k,
+                    latency_s=elapsed,
+                    retrieved=len(contexts),
+                    ttft_s=answer_stream.ttft_s if answer_stream else None,
+                )
 
         except Exception as e:
             st.error(f"Error: {e}")
@@ -11,7 +11,7 @@ with DAG(
     start_date=datetime(2025, 1, 1),
     schedule="@daily",
     catchup=False,
-    description="Rebuild Chroma index from ./corpus daily",
+    description="Incrementally sync the index with ./corpus daily (new version swapped in when complete)",
 ) as dag:
     rebuild = BashOperator(
         task_id="rebuild_index",
@@ -21,12 +21,12 @@ with DAG(
             ". .venv/bin/activate && "
             "pip install -U pip && "
             "pip install -e . && "
-            "python -c \"from src.mrc.ingest import load_corpus_folder, chunk_documents; "
-            "from src.mrc.store import rebuild_store; "
-            "from pathlib import Path; "
-            "docs=load_corpus_folder(Path('corpus')); "
-            "chunks=chunk_documents(docs); "
-            "rebuild_store(chunks, embedding_model='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'); "
-            "print('indexed', len(chunks))\""
+            "python -c \"from pathlib import Path; "
+            "from src.mrc.pipeline import index_corpus; "
+            "diff, stats = index_corpus(Path('corpus'), "
+            "embedding_model='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'); "
+            "print('indexed', stats.chunks, 'chunks from', stats.files, 'files -', diff.summary()); "
+            "print('near-duplicates', stats.duplicates, 'embedding s saved', round(stats.embed_s_saved, 1)); "
+            "[print('skipped', name, err) for name, err in stats.failed]\""
         ),
     )
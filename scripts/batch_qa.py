@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.mrc.batch import DEFAULT_CONCURRENCY, BatchConfig, run_batch  # noqa: E402
+from src.mrc.store import LANG_MODES, RETRIEVAL_MODES  # noqa: E402
+from src.mrc.stubserver import StubLLMServer  # noqa: E402
+from src.mrc.vectorstore import BACKENDS  # noqa: E402
+
+
+def main() -> None:
+    defaults = BatchConfig()
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of questions against the live index."
+    )
+    parser.add_argument("questions", type=Path, help='JSONL: {"id": ..., "question": ...} per line')
+    parser.add_argument("-o", "--out", type=Path, default=Path("answers.jsonl"))
+    parser.add_argument("--backend", choices=["groq", "ollama"], default=defaults.backend)
+    parser.add_argument("--groq-model", default=defaults.groq_model)
+    parser.add_argument("--ollama-url", default=defaults.ollama_base_url)
+    parser.add_argument("--ollama-model", default=defaults.ollama_model)
+    parser.add_argument("--embedding-model", default=defaults.embedding_model)
+    parser.add_argument("--vector-backend", choices=sorted(BACKENDS), default=None)
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, default=defaults.mode)
+    parser.add_argument(
+        "--lang-mode",
+        choices=LANG_MODES,
+        default=defaults.lang_mode,
+        help="search only chunks in the question's language (prefer: widen if too few)",
+    )
+    parser.add_argument("--top-k", type=int, default=defaults.top_k)
+    parser.add_argument("--context-tokens", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="also send slow requests to the other LLM backend and keep the first answer",
+    )
+    parser.add_argument(
+        "--stub",
+        action="store_true",
+        help="answer with a local stub LLM server (offline runs; see src/mrc/stubserver.py)",
+    )
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    cfg = BatchConfig(
+        backend=args.backend,
+        groq_model=args.groq_model,
+        ollama_base_url=args.ollama_url,
+        ollama_model=args.ollama_model,
+        embedding_model=args.embedding_model,
+        vector_backend=args.vector_backend,
+        mode=args.mode,
+        lang_mode=args.lang_mode,
+        top_k=args.top_k,
+        context_tokens=args.context_tokens,
+        concurrency=args.concurrency,
+        hedge=args.hedge,
+    )
+    stub = None
+    if args.stub:
+        stub = StubLLMServer(latency_s=args.stub_latency_ms / 1000).start()
+        cfg.ollama_base_url = stub.url
+        os.environ["GROQ_BASE_URL"] = stub.url
+        os.environ.setdefault("GROQ_API_KEY", "stub")
+    try:
+        summary = run_batch(args.questions, args.out, cfg)
+    finally:
+        if stub is not None:
+            stub.stop()
+    print(json.dumps(summary.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
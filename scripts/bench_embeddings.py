@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.mrc.embeddings import PARITY_TEXTS, RUNTIMES, registry  # noqa: E402
+
+WORDS = (
+    "rapport contrat facture livraison garantie délai client service réseau serveur "
+    "report contract invoice delivery warranty deadline customer network server "
+    "Vertrag Rechnung Lieferung Frist Kunde servidor contrato factura entrega plazo"
+).split()
+
+
+def _texts(rng: np.random.Generator, n: int, words: int) -> list:
+    return [" ".join(rng.choice(WORDS, size=words)) + "." for _ in range(n)]
+
+
+def _percentiles(samples):
+    a = np.asarray(samples) * 1000.0
+    return {"p50_ms": float(np.percentile(a, 50)), "p95_ms": float(np.percentile(a, 95))}
+
+
+def bench(model, passages, queries, batch_size):
+    model.encode(passages[:batch_size], batch_size=batch_size, normalize_embeddings=True)
+
+    t0 = time.perf_counter()
+    embs = model.encode(passages, batch_size=batch_size, normalize_embeddings=True)
+    encode_s = time.perf_counter() - t0
+
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        model.encode(q, normalize_embeddings=True)
+        lat.append(time.perf_counter() - t0)
+
+    return embs, {"passages_per_s": len(passages) / encode_s, **_percentiles(lat)}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Compare PyTorch and ONNX embedding runtimes.")
+    ap.add_argument(
+        "--model", default="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    )
+    ap.add_argument("--runtimes", nargs="+", default=list(RUNTIMES), choices=RUNTIMES)
+    ap.add_argument("--passages", type=int, default=2000, help="texts in the batch encode")
+    ap.add_argument("--words", type=int, default=120, help="words per passage")
+    ap.add_argument("--queries", type=int, default=200, help="single-query encodes")
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    passages = _texts(rng, args.passages, args.words)
+    queries = _texts(rng, args.queries, 8) + list(PARITY_TEXTS)
+
+    results = {"model": args.model, "passages": args.passages, "runtimes": {}}
+    reference = None
+    for runtime in args.runtimes:
+        model = registry.get(args.model, runtime)
+        info = registry.info(args.model, runtime)
+        embs, stats = bench(model, passages, queries, args.batch_size)
+        row = {
+            "loaded_as": info.runtime,
+            "fallback": info.fallback,
+            "load_s": info.load_s,
+            "model_bytes": info.resident_bytes,
+            **stats,
+        }
+        if reference is None:
+            reference = embs
+        else:
+            # Cosine to the first runtime's embeddings (unit vectors).
+            cos = np.sum(reference * embs, axis=1)
+            row["min_cosine"] = float(cos.min())
+            row["mean_cosine"] = float(cos.mean())
+        results["runtimes"][runtime] = row
+        registry.unload(args.model, runtime)
+
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
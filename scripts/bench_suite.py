@@ -0,0 +1,463 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Measure real parsing and embedding, not the on-disk caches.
+os.environ.setdefault("MRC_TEXT_CACHE", "0")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from docx import Document as DocxDocument  # noqa: E402
+
+from src.mrc.embeddings import get_model  # noqa: E402
+from src.mrc.ingest import chunk_documents, load_corpus_folder  # noqa: E402
+from src.mrc.llm import generate_answer  # noqa: E402
+from src.mrc.store import (  # noqa: E402
+    EMBED_BATCH_SIZE,
+    RETRIEVAL_MODES,
+    clear_store,
+    rebuild_store,
+    retrieve,
+)
+from src.mrc.stubserver import StubLLMServer  # noqa: E402
+from src.mrc.vectorstore import BACKENDS  # noqa: E402
+
+# Offline benchmark of the whole pipeline on synthetic multilingual corpora:
+# parse, chunk and embed throughput with peak RSS, index build time,
+# retrieval latency per top_k and mode, and end-to-end answer latency
+# against the stub LLM server. Everything runs in a temporary directory;
+# the JSON report goes to stdout (and --out) for comparing runs.
+
+SCHEMA_VERSION = 1
+FORMATS = ("pdf", "docx", "txt", "html")
+
+# Per language: sentence templates and the nouns / adjectives filling them.
+LANGUAGES: Dict[str, Tuple[List[str], List[str], List[str]]] = {
+    "en": (
+        [
+            "The {n} of the {n} is {a} according to the annual report.",
+            "Each {n} must be approved by the {n} before the deadline.",
+            "We reviewed the {a} {n} and updated the {n} accordingly.",
+            "Questions about the {n} should be sent to the {n} team.",
+        ],
+        "contract invoice delivery warranty customer supplier network server "
+        "budget schedule audit policy incident request release".split(),
+        "late urgent complete annual internal new critical pending".split(),
+    ),
+    "fr": (
+        [
+            "Le {n} du {n} est {a} selon le rapport annuel.",
+            "Chaque {n} doit être validé par le {n} avant la date limite.",
+            "Nous avons revu le {n} {a} et mis à jour le {n} en conséquence.",
+            "Les questions sur le {n} sont à envoyer à l'équipe du {n}.",
+        ],
+        "contrat devis bon fournisseur client serveur réseau budget calendrier "
+        "audit incident projet service dossier".split(),
+        "urgent complet annuel interne nouveau critique prioritaire signé".split(),
+    ),
+    "de": (
+        [
+            "Der {n} für den {n} ist laut Jahresbericht {a}.",
+            "Jeder {n} muss vor der Frist von dem {n} genehmigt werden.",
+            "Wir haben den {a} {n} geprüft und den {n} angepasst.",
+            "Fragen zu dem {n} gehen an das Team für den {n}.",
+        ],
+        "Vertrag Auftrag Kunde Lieferant Server Haushalt Zeitplan Bericht "
+        "Vorfall Antrag Dienst Standort Prozess".split(),
+        "dringend vollständig jährlich intern neu kritisch offen".split(),
+    ),
+    "es": (
+        [
+            "El {n} del {n} es {a} según el informe anual.",
+            "Cada {n} debe ser aprobado por el {n} antes del plazo.",
+            "Revisamos el {n} {a} y actualizamos el {n} en consecuencia.",
+            "Las preguntas sobre el {n} se envían al equipo del {n}.",
+        ],
+        "contrato pedido cliente proveedor servidor presupuesto calendario "
+        "informe incidente proyecto servicio expediente".split(),
+        "urgente completo anual interno nuevo crítico pendiente".split(),
+    ),
+    "ru": (
+        [
+            "{n} для {n} является {a} согласно годовому отчёту.",
+            "Каждый {n} должен быть одобрен до срока.",
+            "Мы проверили {a} {n} и обновили {n}.",
+        ],
+        "договор счёт клиент поставщик сервер бюджет график отчёт проект".split(),
+        "срочный полный годовой внутренний новый критический".split(),
+    ),
+}
+QUESTIONS = {
+    "en": "What is the status of the {n} for the {n}?",
+    "fr": "Quel est le statut du {n} pour le {n} ?",
+    "de": "Wie ist der Stand des {n} für den {n}?",
+    "es": "¿Cuál es el estado del {n} para el {n}?",
+    "ru": "Каков статус {n} для {n}?",
+}
+PDF_LINES_PER_PAGE = 50
+
+
+# -- synthetic corpus --
+
+
+def _paragraphs(rng: np.random.Generator, lang: str, words: int) -> List[str]:
+    templates, nouns, adjectives = LANGUAGES[lang]
+    paras, para, count = [], [], 0
+    while count < words:
+        t = templates[rng.integers(len(templates))]
+        while "{n}" in t or "{a}" in t:
+            t = t.replace("{n}", nouns[rng.integers(len(nouns))], 1)
+            t = t.replace("{a}", adjectives[rng.integers(len(adjectives))], 1)
+        # Codes and numbers, which BM25 should find verbatim.
+        if rng.random() < 0.1:
+            t += f" REF-{rng.integers(10000):04d}."
+        para.append(t)
+        count += len(t.split())
+        if len(para) >= 5:
+            paras.append(" ".join(para))
+            para = []
+    if para:
+        paras.append(" ".join(para))
+    return paras
+
+
+def _pdf_bytes(paras: List[str]) -> bytes:
+    """Minimal text PDF (Helvetica, WinAnsi encoding) that pypdf can extract."""
+
+    def esc(line: str) -> str:
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    lines: List[str] = []
+    for p in paras:
+        lines.extend(textwrap.wrap(p, 95) + [""])
+    pages = [lines[i : i + PDF_LINES_PER_PAGE] for i in range(0, len(lines), PDF_LINES_PER_PAGE)]
+    # Objects 1-3 are the catalog, page tree and font; then content + page pairs.
+    font = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", font]
+    kids = []
+    for page in pages:
+        body = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({esc(x)}) '" for x in page) + " ET"
+        data = body.encode("cp1252")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{k} 0 R" for k in kids).encode(),
+        len(kids),
+    )
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
+
+
+def _write_doc(path: Path, fmt: str, title: str, paras: List[str]) -> Path:
+    path = path.with_suffix(f".{fmt}")
+    if fmt == "pdf":
+        path.write_bytes(_pdf_bytes([title] + paras))
+    elif fmt == "docx":
+        doc = DocxDocument()
+        doc.add_heading(title, level=1)
+        for p in paras:
+            doc.add_paragraph(p)
+        doc.save(str(path))
+    elif fmt == "html":
+        body = "".join(f"<p>{p}</p>\n" for p in paras)
+        path.write_text(
+            f"<html><head><title>{title}</title><style>p {{margin: 0}}</style></head>"
+            f"<body><h1>{title}</h1>\n{body}<script>var x = 1;</script></body></html>",
+            encoding="utf-8",
+        )
+    else:
+        path.write_text(title + "\n\n" + "\n\n".join(paras), encoding="utf-8")
+    return path
+
+
+def make_corpus(folder: Path, docs: int, words: int, seed: int) -> Dict[str, Any]:
+    """Write `docs` documents cycling through FORMATS and LANGUAGES into `folder`."""
+    rng = np.random.default_rng(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    langs = list(LANGUAGES)
+    by_format: Dict[str, int] = {}
+    by_lang: Dict[str, int] = {}
+    for i in range(docs):
+        lang = langs[i % len(langs)]
+        fmt = FORMATS[i % len(FORMATS)]
+        if fmt == "pdf" and lang == "ru":  # the standard PDF fonts have no Cyrillic
+            fmt = "docx"
+        paras = _paragraphs(rng, lang, int(rng.integers(words // 2, words * 3 // 2 + 1)))
+        _write_doc(folder / f"doc-{i:05d}-{lang}", fmt, f"Document {i} ({lang})", paras)
+        by_format[fmt] = by_format.get(fmt, 0) + 1
+        by_lang[lang] = by_lang.get(lang, 0) + 1
+    size = sum(p.stat().st_size for p in folder.iterdir())
+    return {"docs": docs, "bytes": size, "formats": by_format, "languages": by_lang}
+
+
+def make_questions(n: int, seed: int) -> List[str]:
+    rng = np.random.default_rng(seed + 1)
+    langs = list(QUESTIONS)
+    out = []
+    for i in range(n):
+        lang = langs[i % len(langs)]
+        nouns = LANGUAGES[lang][1]
+        q = QUESTIONS[lang]
+        while "{n}" in q:
+            q = q.replace("{n}", nouns[rng.integers(len(nouns))], 1)
+        out.append(q)
+    return out
+
+
+# -- measurement --
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS counter (Linux); False if unsupported."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _status_mb(field: str) -> Optional[float]:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb() -> float:
+    peak = _status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    # Peak since process start (KiB on Linux, bytes on macOS).
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0)
+
+
+def _phase(fn: Callable[[], Any]) -> Tuple[Any, Dict[str, Any]]:
+    """Run `fn`, returning its result, wall time and peak RSS during the call."""
+    per_phase = _reset_peak_rss()
+    rss = _status_mb("VmRSS")
+    t0 = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t0
+    stats: Dict[str, Any] = {"seconds": seconds, "peak_rss_mb": _peak_rss_mb()}
+    if rss is not None:
+        stats["start_rss_mb"] = rss
+    if not per_phase:
+        stats["peak_rss_since_start"] = True
+    return result, stats
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    a = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(a, 50)),
+        "p95_ms": float(np.percentile(a, 95)),
+        "p99_ms": float(np.percentile(a, 99)),
+        "mean_ms": float(a.mean()),
+    }
+
+
+def _latencies(fn: Callable[[str], Dict[str, float]], questions: List[str], warmup: int):
+    for q in questions[:warmup]:
+        fn(q)
+    lat, stages = [], {}
+    for q in questions:
+        t0 = time.perf_counter()
+        timings = fn(q)
+        lat.append(time.perf_counter() - t0)
+        for k, v in timings.items():
+            stages.setdefault(k, []).append(v)
+    out = _percentiles(lat)
+    out["stages_p50_ms"] = {
+        k.removesuffix("_s"): float(np.median(v) * 1000.0) for k, v in sorted(stages.items())
+    }
+    return out
+
+
+def bench_size(args: argparse.Namespace, work: Path, docs: int) -> Dict[str, Any]:
+    folder = work / f"corpus-{docs}"
+    # A seed per size, so no chunk is already in the embedding cache.
+    row: Dict[str, Any] = {"corpus": make_corpus(folder, docs, args.words, args.seed + docs)}
+
+    parsed, stats = _phase(lambda: load_corpus_folder(folder, workers=args.parse_workers))
+    chars = sum(len(d.text) for d in parsed)
+    row["parse"] = {
+        **stats,
+        "docs": len(parsed),
+        "docs_per_s": len(parsed) / stats["seconds"],
+        "mb_per_s": row["corpus"]["bytes"] / 1e6 / stats["seconds"],
+        "chars": chars,
+    }
+
+    chunks, stats = _phase(lambda: chunk_documents(parsed, args.chunk_size, args.overlap))
+    row["chunk"] = {**stats, "chunks": len(chunks), "chunks_per_s": len(chunks) / stats["seconds"]}
+
+    model = get_model(args.embedding_model)
+    texts = [c["text"] for c in chunks]
+    _, stats = _phase(
+        lambda: model.encode(texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True)
+    )
+    row["embed"] = {**stats, "chunks_per_s": len(texts) / stats["seconds"]}
+
+    # Cold: embeds every chunk again. Warm: embeddings come from the
+    # embedding cache the cold build filled, leaving the indexing cost.
+    row["index"] = {}
+    for label in ("cold", "warm"):
+        _, stats = _phase(
+            lambda: rebuild_store(chunks, args.embedding_model, backend=args.vector_backend)
+        )
+        row["index"][label] = {**stats, "chunks_per_s": len(chunks) / stats["seconds"]}
+
+    questions = make_questions(args.queries, args.seed)
+
+    def _retrieve(q: str, k: int, mode: str) -> Dict[str, float]:
+        timings: Dict[str, float] = {}
+        retrieve(
+            q,
+            args.embedding_model,
+            top_k=k,
+            backend=args.vector_backend,
+            mode=mode,
+            timings=timings,
+        )
+        return timings
+
+    row["retrieval"] = {
+        mode: {
+            str(k): _latencies(lambda q: _retrieve(q, k, mode), questions, args.warmup)
+            for k in args.top_k
+        }
+        for mode in args.modes
+    }
+
+    with StubLLMServer(latency_s=args.stub_latency_ms / 1000) as stub:
+
+        def _answer(q: str) -> Dict[str, float]:
+            t0 = time.perf_counter()
+            contexts = retrieve(
+                q,
+                args.embedding_model,
+                top_k=args.top_k[0],
+                backend=args.vector_backend,
+                mode=args.modes[0],
+            )
+            timings = {"retrieve_s": time.perf_counter() - t0}
+            t0 = time.perf_counter()
+            generate_answer(
+                backend="ollama",
+                question=q,
+                contexts=contexts,
+                groq_model="",
+                ollama_base_url=stub.url,
+                ollama_model="stub",
+            )
+            timings["generate_s"] = time.perf_counter() - t0
+            return timings
+
+        row["end_to_end"] = {
+            "top_k": args.top_k[0],
+            "mode": args.modes[0],
+            **_latencies(_answer, questions, args.warmup),
+        }
+    clear_store()
+    shutil.rmtree(folder, ignore_errors=True)
+    return row
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        )
+        return out.stdout.strip()
+    except OSError:
+        return ""
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description="Offline benchmark of ingest, indexing, retrieval and end-to-end answers."
+    )
+    ap.add_argument("--sizes", type=int, nargs="+", default=[50, 200], help="documents per corpus")
+    ap.add_argument("--words", type=int, default=600, help="mean words per document")
+    ap.add_argument("--top-k", type=int, nargs="+", default=[3, 6, 12])
+    ap.add_argument("--modes", nargs="+", choices=RETRIEVAL_MODES, default=["dense", "hybrid"])
+    ap.add_argument("--queries", type=int, default=100, help="timed queries per setting")
+    ap.add_argument("--warmup", type=int, default=5, help="untimed queries per setting")
+    ap.add_argument("--chunk-size", type=int, default=900)
+    ap.add_argument("--overlap", type=int, default=150)
+    ap.add_argument("--parse-workers", type=int, default=0)
+    ap.add_argument(
+        "--embedding-model", default="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    )
+    ap.add_argument("--vector-backend", choices=sorted(BACKENDS), default=None)
+    ap.add_argument("--stub-latency-ms", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("-o", "--out", type=Path, default=None, help="also write the JSON report here")
+    args = ap.parse_args()
+
+    results: Dict[str, Any] = {
+        "schema": SCHEMA_VERSION,
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        "sizes": {},
+    }
+    # The index, embedding cache and text cache live under ./storage.
+    cwd = os.getcwd()
+    work = Path(tempfile.mkdtemp(prefix="mrc-bench-suite-"))
+    try:
+        os.chdir(work)
+        get_model(args.embedding_model).encode(["warm-up"], normalize_embeddings=True)
+        for docs in args.sizes:
+            results["sizes"][str(docs)] = bench_size(args, work, docs)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+    report = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.out is not None:
+        args.out.write_text(report + "\n", encoding="utf-8")
+    print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
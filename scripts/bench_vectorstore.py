@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.mrc.vectorstore import ChromaStore, NumpyStore  # noqa: E402
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _clustered(rng: np.random.Generator, centers: np.ndarray, n: int, noise: float) -> np.ndarray:
+    # Sentence embeddings are far from uniform: sample around topic centers.
+    picks = rng.integers(0, len(centers), size=n)
+    return _unit(centers[picks] + noise * rng.standard_normal((n, centers.shape[1])))
+
+
+def _percentiles(samples):
+    a = np.asarray(samples) * 1000.0
+    return {"p50_ms": float(np.percentile(a, 50)), "p95_ms": float(np.percentile(a, 95))}
+
+
+def bench(make_store, vectors, queries, k, exact_top, batch):
+    ids = [f"doc::{i}" for i in range(len(vectors))]
+    metas = [{"source": "doc", "chunk_id": i} for i in range(len(vectors))]
+
+    t0 = time.perf_counter()
+    store = make_store()
+    for start in range(0, len(vectors), batch):
+        stop = start + batch
+        store.upsert(ids[start:stop], vectors[start:stop], metas[start:stop])
+    store.flush()
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    store = make_store()
+    store.query(queries[:1], k)
+    open_s = time.perf_counter() - t0
+
+    lat, recall = [], []
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        hits = store.query(q[None, :], k)[0]
+        lat.append(time.perf_counter() - t0)
+        got = {int(h[0].split("::")[1]) for h in hits}
+        recall.append(len(got & exact_top[i]) / k)
+
+    return {
+        "build_s": build_s,
+        "open_and_first_query_s": open_s,
+        **_percentiles(lat),
+        f"recall@{k}": float(np.mean(recall)),
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Compare Chroma and NumPy vector store backends.")
+    ap.add_argument("--n", type=int, default=50_000, help="number of vectors")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=6)
+    ap.add_argument("--batch", type=int, default=2048, help="vectors per upsert call")
+    ap.add_argument("--topics", type=int, default=200, help="cluster centers")
+    ap.add_argument("--noise", type=float, default=0.08, help="per-dimension noise around centers")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = _unit(rng.standard_normal((args.topics, args.dim)))
+    vectors = _clustered(rng, centers, args.n, args.noise)
+    queries = _clustered(rng, centers, args.queries, args.noise)
+    exact = queries @ vectors.T
+    exact_top = [set(np.argsort(-row)[: args.k].tolist()) for row in exact]
+
+    results = {"n": args.n, "dim": args.dim, "k": args.k, "backends": {}}
+    tmp = Path(tempfile.mkdtemp(prefix="mrc-bench-"))
+    try:
+        results["backends"]["chroma"] = bench(
+            lambda: ChromaStore(tmp / "chroma"), vectors, queries, args.k, exact_top, args.batch
+        )
+        for dtype in ("float32", "float16", "int8"):
+            results["backends"][f"numpy-{dtype}"] = bench(
+                lambda: NumpyStore(tmp / f"numpy-{dtype}", dtype=dtype),
+                vectors,
+                queries,
+                args.k,
+                exact_top,
+                args.batch,
+            )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_TTL_S = 6 * 3600.0
+DEFAULT_MAX_ENTRIES = 2048
+
+# (backend, llm model, embedding model, top_k, index version, question language)
+CacheKey = Tuple[str, str, str, int, str, str]
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    sources: List[Dict]
+    embedding: np.ndarray
+    created: float
+    similarity: float = 1.0
+
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers.
+
+    Entries are grouped by CacheKey; a lookup compares the (normalized)
+    question embedding with every live entry of its group and returns the
+    best one at or above `threshold`; entries whose embedding has another
+    shape (another embedding model) never match. Entries expire after `ttl_s`, and the
+    least recently used entry is evicted past `max_entries`. Because the
+    index version is part of the key, a rebuild makes older entries
+    unreachable; they then age out through TTL/LRU.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        ttl_s: float = DEFAULT_TTL_S,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[CacheKey, CachedAnswer]]" = OrderedDict()
+        self._groups: Dict[CacheKey, List[int]] = {}
+        self._next_id = 0
+
+    def _drop(self, entry_id: int) -> None:
+        key, _ = self._entries.pop(entry_id)
+        group = self._groups[key]
+        group.remove(entry_id)
+        if not group:
+            del self._groups[key]
+
+    def lookup(
+        self,
+        embedding: np.ndarray,
+        key: CacheKey,
+        threshold: Optional[float] = None,
+    ) -> Optional[CachedAnswer]:
+        threshold = self.threshold if threshold is None else threshold
+        now = time.time()
+        with self._lock:
+            expired = [
+                i for i in self._groups.get(key, []) if now - self._entries[i][1].created > self.ttl_s
+            ]
+            for entry_id in expired:
+                self._drop(entry_id)
+            embedding = np.asarray(embedding, dtype=np.float32)
+            ids = [
+                i
+                for i in self._groups.get(key, [])
+                if self._entries[i][1].embedding.shape == embedding.shape
+            ]
+            if not ids:
+                self.misses += 1
+                return None
+
+            mat = np.stack([self._entries[i][1].embedding for i in ids])
+            sims = mat @ embedding
+            best = int(np.argmax(sims))
+            if float(sims[best]) < threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(ids[best])
+            hit = self._entries[ids[best]][1]
+            return CachedAnswer(
+                question=hit.question,
+                answer=hit.answer,
+                sources=list(hit.sources),
+                embedding=hit.embedding,
+                created=hit.created,
+                similarity=float(sims[best]),
+            )
+
+    def store(
+        self,
+        embedding: np.ndarray,
+        key: CacheKey,
+        question: str,
+        answer: str,
+        sources: List[Dict],
+    ) -> None:
+        entry = CachedAnswer(
+            question=question,
+            answer=answer,
+            sources=list(sources),
+            embedding=np.asarray(embedding, dtype=np.float32),
+            created=time.time(),
+        )
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, entry)
+            self._groups.setdefault(key, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .hedge import health_stats
+from .llm import generate_answer
+from .store import retrieve_many
+from .tracing import flush, stage
+
+# Questions retrieved together: one batched encode and one multi-query
+# vector search each. Bounds the (queries x chunks) score matrix.
+RETRIEVE_BATCH = 64
+DEFAULT_CONCURRENCY = 8
+
+
+@dataclass
+class BatchConfig:
+    backend: str = "groq"
+    groq_model: str = "openai/gpt-oss-20b"
+    ollama_base_url: str = "http://localhost:11434"
+    ollama_model: str = "llama3.1"
+    embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    vector_backend: Optional[str] = None
+    mode: str = "hybrid"
+    # Restrict retrieval to the question's language (see store.LANG_MODES).
+    lang_mode: str = "off"
+    top_k: int = 6
+    context_tokens: Optional[int] = None
+    # Answers generated at the same time (LLM requests in flight).
+    concurrency: int = DEFAULT_CONCURRENCY
+    # Race the other LLM backend when this one is slow (see hedge.py).
+    hedge: bool = False
+
+
+@dataclass
+class BatchSummary:
+    questions: int = 0
+    errors: int = 0
+    wall_s: float = 0.0
+    # Summed per-stage retrieval times over all retrieve batches.
+    retrieval: Dict[str, float] = field(default_factory=dict)
+    generate_p50_s: float = 0.0
+    generate_p95_s: float = 0.0
+    # Per-LLM-backend latencies, hedges and breaker state (hedged runs).
+    backends: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def read_questions(path: Path) -> List[Dict[str, Any]]:
+    """
+    Questions from a JSONL file: objects with a "question" (and optional
+    "id", kept as-is) or bare JSON strings. Ids default to the line number.
+    """
+    out: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            if not item.get("question"):
+                raise ValueError(f"{path}:{n}: missing 'question'")
+            item.setdefault("id", n)
+            out.append(item)
+    return out
+
+
+def _source(c: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "source": c["source"],
+        "chunk_id": c["chunk_id"],
+        "score": c["score"],
+        "aliases": c.get("aliases") or [],
+    }
+
+
+def _answer(
+    item: Dict[str, Any],
+    contexts: List[Dict],
+    cfg: BatchConfig,
+    retrieve_s: float,
+    t_ready: float,
+    t0: float,
+) -> Dict[str, Any]:
+    t_start = time.perf_counter()
+    record: Dict[str, Any] = {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": None,
+        "error": None,
+        "sources": [_source(c) for c in contexts],
+    }
+    context_stats: Dict[str, Any] = {}
+    try:
+        record["answer"] = generate_answer(
+            backend=cfg.backend,
+            question=item["question"],
+            contexts=contexts,
+            groq_model=cfg.groq_model,
+            ollama_base_url=cfg.ollama_base_url,
+            ollama_model=cfg.ollama_model,
+            context_tokens=cfg.context_tokens,
+            context_stats=context_stats,
+            hedge=cfg.hedge,
+        )
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    done = time.perf_counter()
+    record["context"] = context_stats
+    record["timings"] = {
+        "retrieve_s": retrieve_s,
+        "queue_s": t_start - t_ready,
+        "generate_s": done - t_start,
+        "total_s": done - t0,
+    }
+    return record
+
+
+def answer_questions(
+    questions: List[Dict[str, Any]],
+    cfg: BatchConfig,
+    summary: Optional[BatchSummary] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Answer `questions` (see read_questions), yielding one record per
+    question as answers complete (not in input order).
+
+    Questions are retrieved RETRIEVE_BATCH at a time with retrieve_many,
+    and their answers are generated by up to `cfg.concurrency` concurrent
+    generate_answer calls while the next batch is retrieved. Each record
+    has the answer (or error), sources, packed-context stats and timings:
+    `retrieve_s` is the question's share of its batch, `queue_s` the wait
+    for a free worker, `total_s` the time since the run started.
+    """
+    summary = summary if summary is not None else BatchSummary()
+    summary.questions = len(questions)
+    t0 = time.perf_counter()
+    pending: List[Future] = []
+    gen_s: List[float] = []
+    with ThreadPoolExecutor(max_workers=max(1, cfg.concurrency)) as pool:
+        for start in range(0, len(questions), RETRIEVE_BATCH):
+            batch = questions[start : start + RETRIEVE_BATCH]
+            timings: Dict[str, float] = {}
+            results = retrieve_many(
+                [q["question"] for q in batch],
+                embedding_model=cfg.embedding_model,
+                top_k=cfg.top_k,
+                backend=cfg.vector_backend,
+                mode=cfg.mode,
+                timings=timings,
+                lang_mode=cfg.lang_mode,
+            )
+            for k, v in timings.items():
+                summary.retrieval[k] = summary.retrieval.get(k, 0.0) + v
+            t_ready = time.perf_counter()
+            share = timings.get("total_s", 0.0) / len(batch)
+            for item, contexts in zip(batch, results):
+                # copy_context keeps the LLM spans under the batch span.
+                pending.append(
+                    pool.submit(
+                        contextvars.copy_context().run,
+                        _answer,
+                        item,
+                        contexts,
+                        cfg,
+                        share,
+                        t_ready,
+                        t0,
+                    )
+                )
+            # Hand back what finished while this batch was retrieved.
+            still = []
+            for fut in pending:
+                if fut.done():
+                    yield _finish(fut, summary, gen_s)
+                else:
+                    still.append(fut)
+            pending = still
+        for fut in as_completed(pending):
+            yield _finish(fut, summary, gen_s)
+    summary.wall_s = time.perf_counter() - t0
+    if gen_s:
+        summary.generate_p50_s = float(np.percentile(gen_s, 50))
+        summary.generate_p95_s = float(np.percentile(gen_s, 95))
+    if cfg.hedge:
+        summary.backends = health_stats()
+
+
+def _finish(fut: Future, summary: BatchSummary, gen_s: List[float]) -> Dict[str, Any]:
+    record = fut.result()
+    gen_s.append(record["timings"]["generate_s"])
+    if record["error"]:
+        summary.errors += 1
+    return record
+
+
+def run_batch(in_path: Path, out_path: Path, cfg: BatchConfig) -> BatchSummary:
+    """Answer the questions in `in_path`, writing one JSON record per line to `out_path`."""
+    questions = read_questions(in_path)
+    summary = BatchSummary()
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with stage("batch_qa", questions=len(questions), backend=cfg.backend, mode=cfg.mode):
+        with open(out_path, "w", encoding="utf-8") as f:
+            for record in answer_questions(questions, cfg, summary):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    flush()
+    return summary
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    uid TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    lang TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS chunks_by_source ON chunks (source, chunk_id);
+CREATE TABLE IF NOT EXISTS aliases (
+    uid TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    rep_uid TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aliases_by_rep ON aliases (rep_uid);
+"""
+
+# SQLite caps the number of host parameters per statement.
+_MAX_PARAMS = 500
+
+
+def _row(r: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "uid": r["uid"],
+        "source": r["source"],
+        "chunk_id": r["chunk_id"],
+        "text": r["text"],
+        # Read-only stores are not migrated (see ChunkStore.__init__).
+        "lang": r["lang"] if "lang" in r.keys() else "",
+    }
+
+
+class ChunkStore:
+    """
+    Chunk metadata and text in a single SQLite file.
+
+    Lookups by uid or by (source, chunk_id) hit an index, so callers can
+    fetch a chunk or its neighbours without loading the whole corpus.
+    With `readonly`, an existing file is opened as is (no directory, schema
+    or migration), which is cheap enough to keep open per index version.
+    """
+
+    def __init__(self, path: Path, readonly: bool = False) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        if readonly:
+            uri = f"{self.path.resolve().as_uri()}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "lang" not in columns:  # created before chunks had a language
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN lang TEXT NOT NULL DEFAULT ''")
+
+    def backup(self, dest: Path) -> None:
+        """Consistent copy of the database to `dest` (safe while others read)."""
+        Path(dest).parent.mkdir(parents=True, exist_ok=True)
+        target = sqlite3.connect(str(dest))
+        try:
+            with self._lock:
+                self._conn.backup(target)
+        finally:
+            target.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def upsert(self, chunks: Iterable[Dict[str, Any]]) -> None:
+        rows = [
+            (c["uid"], c["source"], int(c["chunk_id"]), c["text"], c.get("lang") or "")
+            for c in chunks
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (uid, source, chunk_id, text, lang) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def upsert_aliases(self, chunks: Iterable[Dict[str, Any]]) -> None:
+        """Record near-duplicate chunks (with `duplicate_of`) as aliases of their representative."""
+        rows = [(c["uid"], c["source"], int(c["chunk_id"]), c["duplicate_of"]) for c in chunks]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO aliases (uid, source, chunk_id, rep_uid) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete(self, uids: Iterable[str]) -> None:
+        """Delete chunks and aliases by uid."""
+        uids = list(uids)
+        with self._lock, self._conn:
+            for i in range(0, len(uids), _MAX_PARAMS):
+                batch = uids[i : i + _MAX_PARAMS]
+                marks = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM chunks WHERE uid IN ({marks})", batch)
+                self._conn.execute(f"DELETE FROM aliases WHERE uid IN ({marks})", batch)
+
+    def get(self, uid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            r = self._conn.execute("SELECT * FROM chunks WHERE uid = ?", (uid,)).fetchone()
+        return _row(r) if r is not None else None
+
+    def get_many(self, uids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Chunks for `uids`, in the same order (None where missing)."""
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for i in range(0, len(uids), _MAX_PARAMS):
+                batch = uids[i : i + _MAX_PARAMS]
+                cur = self._conn.execute(
+                    f"SELECT * FROM chunks WHERE uid IN ({','.join('?' * len(batch))})", batch
+                )
+                found.update((r["uid"], _row(r)) for r in cur)
+        return [found.get(u) for u in uids]
+
+    def aliases_of(self, uids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Other (source, chunk_id) locations of each chunk in `uids`, by uid."""
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for i in range(0, len(uids), _MAX_PARAMS):
+                batch = uids[i : i + _MAX_PARAMS]
+                cur = self._conn.execute(
+                    "SELECT rep_uid, source, chunk_id FROM aliases "
+                    f"WHERE rep_uid IN ({','.join('?' * len(batch))}) ORDER BY source, chunk_id",
+                    batch,
+                )
+                for r in cur:
+                    out.setdefault(r[0], []).append({"source": r[1], "chunk_id": r[2]})
+        return out
+
+    def list_source(self, source: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT * FROM chunks WHERE source = ? ORDER BY chunk_id", (source,)
+            )
+            return [_row(r) for r in cur]
+
+    def neighbours(self, source: str, chunk_id: int, window: int = 1) -> List[Dict[str, Any]]:
+        """Chunks of `source` within `window` positions of `chunk_id` (inclusive)."""
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT * FROM chunks WHERE source = ? AND chunk_id BETWEEN ? AND ? "
+                "ORDER BY chunk_id",
+                (source, chunk_id - window, chunk_id + window),
+            )
+            return [_row(r) for r in cur]
+
+    def iter_texts(self, batch_size: int = 1000) -> Iterator[Tuple[str, str, str]]:
+        """All (uid, text, lang) rows in uid order, fetched `batch_size` rows at a time."""
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT uid, text, lang FROM chunks WHERE uid > ? ORDER BY uid LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield from ((r[0], r[1], r[2]) for r in rows)
+            last = rows[-1][0]
+
+    def languages(self) -> Dict[str, int]:
+        """Chunk count per language."""
+        with self._lock:
+            cur = self._conn.execute("SELECT lang, COUNT(*) FROM chunks GROUP BY lang")
+            return {r[0]: int(r[1]) for r in cur}
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            cur = self._conn.execute("SELECT DISTINCT source FROM chunks ORDER BY source")
+            return [r[0] for r in cur]
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0])
+
+    def alias_count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM aliases").fetchone()[0])
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from .context import PackedContext
+from .llm import CONNECT_TIMEOUT_S, POOL_MAXSIZE, READ_TIMEOUT_S, AnswerStream
+
+
+class ServiceClient:
+    """
+    Client for the retrieval service (service.py).
+
+    Mirrors embed_query / retrieve / stream_answer so the app can use the
+    service in place of a local model and store; the service's own
+    embedding model is used, whatever `embedding_model` is passed.
+    """
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip("/")
+        self._http = requests.Session()
+        self._http.mount("http://", HTTPAdapter(pool_maxsize=POOL_MAXSIZE))
+        self._http.mount("https://", HTTPAdapter(pool_maxsize=POOL_MAXSIZE))
+
+    def _post(self, path: str, payload: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        r = self._http.post(
+            self.base_url + path,
+            json=payload,
+            timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S),
+            **kwargs,
+        )
+        if r.status_code != 200:
+            try:
+                detail = r.json().get("error")
+            except ValueError:
+                detail = r.text[:200]
+            raise RuntimeError(f"Service error {r.status_code} on {path}: {detail}")
+        return r
+
+    def status(self) -> Dict[str, Any]:
+        """The service's /readyz payload ("ready", model, index versions)."""
+        r = self._http.get(self.base_url + "/readyz", timeout=CONNECT_TIMEOUT_S)
+        return r.json()
+
+    def index_version(self, backend: str) -> str:
+        return self.status().get("index_versions", {}).get(backend, "0")
+
+    def embed_query(self, query: str, embedding_model: Optional[str] = None) -> np.ndarray:
+        r = self._post("/embed", {"text": query})
+        return np.asarray(r.json()["embedding"], dtype=np.float32)
+
+    def retrieve(
+        self,
+        query: str,
+        embedding_model: Optional[str] = None,
+        top_k: int = 6,
+        query_embedding=None,
+        backend: Optional[str] = None,
+        mode: str = "dense",
+        timings: Optional[Dict[str, float]] = None,
+        lang_mode: str = "off",
+        lang: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        payload: Dict[str, Any] = {
+            "query": query,
+            "top_k": top_k,
+            "mode": mode,
+            "vector_backend": backend,
+            "lang_mode": lang_mode,
+            "lang": lang,
+        }
+        if query_embedding is not None:
+            payload["embedding"] = np.asarray(query_embedding).tolist()
+        data = self._post("/retrieve", payload).json()
+        if timings is not None:
+            timings.update(data.get("timings") or {})
+        return data["contexts"]
+
+    def stream_answer(
+        self,
+        backend: str,
+        question: str,
+        contexts: List[Dict],
+        groq_model: str,
+        ollama_base_url: str,
+        ollama_model: str,
+        context_tokens: Optional[int] = None,
+        hedge: Optional[bool] = None,
+    ) -> AnswerStream:
+        r = self._post(
+            "/answer",
+            {
+                "question": question,
+                "contexts": contexts,
+                "stream": True,
+                "backend": backend,
+                "groq_model": groq_model,
+                "ollama_base_url": ollama_base_url,
+                "ollama_model": ollama_model,
+                "context_tokens": context_tokens,
+                "hedge": hedge,
+            },
+            stream=True,
+        )
+        lines = (json.loads(line) for line in r.iter_lines() if line)
+        head = next(lines, {})
+        stats = head.get("context") or {}
+        packed = PackedContext(
+            budget=stats.get("budget", 0),
+            tokens_in=stats.get("tokens_in", 0),
+            tokens_out=stats.get("tokens_out", 0),
+            chunks_in=stats.get("chunks_in", 0),
+            duplicates=stats.get("duplicates", 0),
+            dropped=stats.get("dropped", 0),
+        )
+
+        def tokens() -> Iterator[str]:
+            with r:
+                for line in lines:
+                    if line.get("error"):
+                        raise RuntimeError(f"Service error: {line['error']}")
+                    if "token" in line:
+                        yield line["token"]
+                    elif line.get("done"):
+                        answer.backend = line.get("backend")
+
+        answer = AnswerStream(tokens(), context=packed, backend=None if hedge else backend)
+        return answer
+
+
+_clients: Dict[str, ServiceClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_service_client(base_url: str) -> ServiceClient:
+    """One client (and keep-alive pool) per service URL, shared by all sessions."""
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = ServiceClient(base_url)
+        return client
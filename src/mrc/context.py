@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Context tokens per LLM model; anything else gets DEFAULT_CONTEXT_TOKENS.
+# Overridable globally with MRC_CONTEXT_TOKENS.
+CONTEXT_TOKEN_BUDGETS: Dict[str, int] = {
+    "openai/gpt-oss-20b": 6000,
+    "openai/gpt-oss-120b": 6000,
+    "llama3.1": 4000,
+}
+DEFAULT_CONTEXT_TOKENS = 3000
+# A block is cut to fit the budget only if at least this much room is left.
+MIN_PARTIAL_TOKENS = 64
+# Overlaps shorter than this are treated as coincidence, not chunk overlap.
+MIN_OVERLAP_CHARS = 16
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+_WS_RE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough LLM token count without a tokenizer: ~4 characters per token for
+    alphabetic scripts, one token per CJK/Hangul character.
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def context_budget(model: str) -> int:
+    env = os.getenv("MRC_CONTEXT_TOKENS")
+    if env:
+        return int(env)
+    return CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+
+def label(source: str, chunk_ids: List[int], aliases: Optional[List[Dict]] = None) -> str:
+    where = (
+        f"chunk {chunk_ids[0]}" if len(chunk_ids) == 1 else f"chunks {chunk_ids[0]}-{chunk_ids[-1]}"
+    )
+    also = ""
+    if aliases:
+        # Near-duplicate copies of the text (see dedup.py) are cited too.
+        also = " | also in: " + ", ".join(f"{a['source']} (chunk {a['chunk_id']})" for a in aliases)
+    return f"[Source: {source} | {where}{also}]"
+
+
+@dataclass
+class ContextBlock:
+    source: str
+    chunk_ids: List[int]
+    text: str
+    truncated: bool = False
+    aliases: List[Dict] = field(default_factory=list)
+
+    def render(self) -> str:
+        return f"{label(self.source, self.chunk_ids, self.aliases)}\n{self.text}"
+
+
+@dataclass
+class PackedContext:
+    blocks: List[ContextBlock] = field(default_factory=list)
+    budget: int = 0
+    # Tokens of the chunks pasted verbatim vs. of the packed context.
+    tokens_in: int = 0
+    tokens_out: int = 0
+    chunks_in: int = 0
+    duplicates: int = 0
+    dropped: int = 0
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(b.render() for b in self.blocks)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_in - self.tokens_out)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "budget": self.budget,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "tokens_saved": self.tokens_saved,
+            "chunks_in": self.chunks_in,
+            "blocks": len(self.blocks),
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+        }
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b`."""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def _merge_runs(contexts: List[Dict]) -> List[ContextBlock]:
+    """
+    Join chunks of the same source with consecutive chunk ids into one
+    block, dropping the overlapping span between them. Blocks come out in
+    the rank order of their best chunk.
+    """
+    texts: Dict[str, Dict[int, Dict]] = {}
+    for c in contexts:
+        texts.setdefault(c["source"], {}).setdefault(int(c["chunk_id"]), c)
+    block_of: Dict[tuple, ContextBlock] = {}
+    for source, chunks in texts.items():
+        block: Optional[ContextBlock] = None
+        for cid in sorted(chunks):
+            text = chunks[cid]["text"]
+            if block is not None and cid == block.chunk_ids[-1] + 1:
+                block.text += text[_overlap(block.text, text) :]
+                block.chunk_ids.append(cid)
+            else:
+                block = ContextBlock(source=source, chunk_ids=[cid], text=text)
+            block.aliases.extend(chunks[cid].get("aliases") or [])
+            block_of[(source, cid)] = block
+    out: List[ContextBlock] = []
+    for c in contexts:
+        block = block_of[(c["source"], int(c["chunk_id"]))]
+        if not any(b is block for b in out):
+            out.append(block)
+    return out
+
+
+def _cut(text: str, max_tokens: int) -> str:
+    """Prefix of `text` within `max_tokens`, cut at a sentence or word boundary."""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    head = text[:lo]
+    for sep in (". ", "。", "\n", " "):
+        cut = head.rfind(sep)
+        if cut > len(head) // 2:
+            return head[: cut + len(sep)].rstrip() + " …"
+    return head.rstrip() + " …"
+
+
+def pack_context(contexts: List[Dict], budget_tokens: int) -> PackedContext:
+    """
+    Fit retrieved chunks into `budget_tokens` of prompt context.
+
+    Adjacent or overlapping chunks of a source are merged, blocks whose
+    text already appears in a higher-ranked block are dropped, and blocks
+    are added in rank order until the budget is spent (the block that
+    overflows is cut, if enough room is left). Citation labels are kept,
+    with a chunk range for merged blocks.
+    """
+    packed = PackedContext(budget=budget_tokens, chunks_in=len(contexts))
+    packed.tokens_in = estimate_tokens(
+        "\n\n".join(
+            f"{label(c['source'], [int(c['chunk_id'])], c.get('aliases'))}\n{c['text']}"
+            for c in contexts
+        )
+    )
+    seen: List[str] = []
+    used = 0
+    full = False
+    for block in _merge_runs(contexts):
+        norm = _WS_RE.sub(" ", block.text).strip()
+        if not norm or any(norm in s for s in seen):
+            packed.duplicates += len(block.chunk_ids)
+            continue
+        if full:
+            packed.dropped += len(block.chunk_ids)
+            continue
+        # "\n\n" between blocks is about one token.
+        cost = estimate_tokens(block.render()) + (1 if packed.blocks else 0)
+        if used + cost > budget_tokens:
+            full = True
+            head = estimate_tokens(label(block.source, block.chunk_ids, block.aliases))
+            room = budget_tokens - used - head - 2
+            if room < MIN_PARTIAL_TOKENS:
+                packed.dropped += len(block.chunk_ids)
+                continue
+            block.text = _cut(block.text, room)
+            block.truncated = True
+            cost = estimate_tokens(block.render()) + (1 if packed.blocks else 0)
+        seen.append(norm)
+        packed.blocks.append(block)
+        used += cost
+    packed.tokens_out = estimate_tokens(packed.text)
+    return packed
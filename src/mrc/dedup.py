@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .store import chunk_uid
+
+# Estimated Jaccard similarity (5-character shingles) at or above which a
+# chunk is treated as a copy of an earlier one.
+DEFAULT_THRESHOLD = 0.85
+SHINGLE_CHARS = 5
+NUM_PERM = 64
+# LSH banding: 8 bands of 8 rows puts the candidate threshold near 0.77,
+# below DEFAULT_THRESHOLD, so few true duplicates are missed; candidates
+# are then checked against the full signature.
+BANDS = 8
+
+_rng = np.random.default_rng(0x5EED)
+# Multiply-shift hashes (odd multipliers), fixed so results are stable
+# across runs: chunk uids depend on dedup decisions.
+_A = _rng.integers(1, 2**63, size=(NUM_PERM, 1), dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, size=(NUM_PERM, 1), dtype=np.uint64)
+_P = np.uint64(1_000_003)
+
+
+def _shingles(text: str) -> np.ndarray:
+    """Hashes of the normalized text's character shingles (uint64, unique)."""
+    norm = " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+    cps = np.frombuffer(norm.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(cps) == 0:
+        return np.zeros(1, dtype=np.uint64)
+    k = min(SHINGLE_CHARS, len(cps))
+    n = len(cps) - k + 1
+    h = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        h = h * _P + cps[j : j + n]
+    return np.unique(h)
+
+
+def minhash(text: str) -> np.ndarray:
+    """NUM_PERM-value MinHash signature of `text` (uint32)."""
+    x = _shingles(text)[None, :]
+    return ((_A * x + _B) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+@dataclass
+class DedupStats:
+    chunks_in: int = 0
+    duplicates: int = 0
+
+    def embed_s_saved(self, chunks_per_s: float) -> float:
+        """Embedding time the skipped duplicates would have cost at `chunks_per_s`."""
+        return self.duplicates / chunks_per_s if chunks_per_s > 0 else 0.0
+
+
+class NearDuplicateIndex:
+    """
+    MinHash + LSH index of representative chunks.
+
+    Only representatives are inserted, so memory is one signature per
+    unique chunk; each band maps its slice of the signature to the
+    representatives sharing it.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._rows = NUM_PERM // BANDS
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(BANDS)]
+        self._sigs: List[np.ndarray] = []
+        self._keys: List[str] = []
+
+    def _bands(self, sig: np.ndarray) -> List[bytes]:
+        return [sig[b * self._rows : (b + 1) * self._rows].tobytes() for b in range(BANDS)]
+
+    def match(self, sig: np.ndarray) -> Optional[str]:
+        """Key of the most similar representative at or above the threshold."""
+        candidates = set()
+        for bucket, band in zip(self._buckets, self._bands(sig)):
+            candidates.update(bucket.get(band, ()))
+        best, best_sim = None, self.threshold
+        for i in candidates:
+            sim = float(np.mean(self._sigs[i] == sig))
+            if sim >= best_sim:
+                best, best_sim = i, sim
+        return None if best is None else self._keys[best]
+
+    def add(self, sig: np.ndarray, key: str) -> None:
+        i = len(self._sigs)
+        self._sigs.append(sig)
+        self._keys.append(key)
+        for bucket, band in zip(self._buckets, self._bands(sig)):
+            bucket.setdefault(band, []).append(i)
+
+
+def dedup_chunks(
+    chunks: Iterable[Dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD,
+    stats: Optional[DedupStats] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Mark near-duplicate chunks in a chunk stream.
+
+    The first chunk of each near-duplicate group is the representative;
+    later ones are yielded with `duplicate_of` set to its uid. The store
+    keeps them as aliases of the representative instead of embedding
+    them, so citations can still list every source.
+    """
+    stats = stats if stats is not None else DedupStats()
+    index = NearDuplicateIndex(threshold)
+    for c in chunks:
+        stats.chunks_in += 1
+        sig = minhash(c["text"])
+        rep = index.match(sig)
+        if rep is None:
+            index.add(sig, chunk_uid(c))
+            yield c
+        else:
+            stats.duplicates += 1
+            yield {**c, "duplicate_of": rep}
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .filelock import file_lock
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# After eviction the cache is trimmed to this fraction of max_bytes, so the
+# next few writes don't trigger another compaction right away.
+EVICT_TO = 0.8
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "__", name).strip("_") or "model"
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache for one embedding model, keyed by chunk SHA-256.
+
+    Layout (one directory per model):
+      - vectors-<id>.bin: raw row-major float16/float32 matrix, memory-mapped
+      - index.npz: row keys (32-byte digests), last-use ticks, dim, dtype and
+        the name of the live vectors file
+      - .lock: held by writers (see filelock.py)
+
+    Several processes may share a directory (the app and the Airflow DAG
+    both mount storage/). Under the lock, rows are appended at the end of
+    the live file, numbered from its size, and flush() merges the index on
+    disk into its own before rewriting it. Rows that no index lists yet
+    (another writer has not flushed) are left alone. When the vectors file
+    grows past max_bytes, the least recently used rows are copied into a
+    new vectors file and the old one is removed; other processes switch to
+    it on their next write, flush or miss.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        model_name: str,
+        dtype: str = "float16",
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.dir = Path(root) / _slug(model_name)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        # Rows of the live file this instance knows the key of, and the
+        # last-use tick of every row up to the last one it has seen (0 for
+        # rows appended by others and not indexed yet).
+        self._rows: Dict[bytes, int] = {}
+        self._used: List[int] = []
+        self._tick = 0
+        self._file: Optional[str] = None
+        self._index_stat: Optional[tuple] = None
+        self._mm: Optional[np.memmap] = None
+        self._dirty = False
+        if self._index_path.exists():
+            self._sync_locked()
+
+    @property
+    def _index_path(self) -> Path:
+        return self.dir / "index.npz"
+
+    @property
+    def _lock_path(self) -> Path:
+        return self.dir / ".lock"
+
+    def _stat_index(self) -> Optional[tuple]:
+        try:
+            st = self._index_path.stat()
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _file_rows(self) -> int:
+        try:
+            size = (self.dir / self._file).stat().st_size
+        except (OSError, TypeError):
+            return 0
+        return size // (self._dim * self.dtype.itemsize)
+
+    def _read_index(self):
+        try:
+            with np.load(self._index_path) as idx:
+                # Caches written before multi-writer support used vectors.bin.
+                name = str(idx["vectors_file"]) if "vectors_file" in idx.files else "vectors.bin"
+                return idx["keys"], idx["used"], int(idx["dim"]), np.dtype(str(idx["dtype"])), name
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _sync(self) -> None:
+        """Merge the index on disk into this instance's view (file lock held)."""
+        self._index_stat = self._stat_index()
+        idx = self._read_index()
+        if idx is None:
+            return
+        keys, used, dim, dtype, name = idx
+        if dtype != self.dtype or (self._dim is not None and dim != self._dim):
+            return  # written with other settings: put_many starts a new file
+        if name != self._file:
+            # First look, or compacted by another process: old row numbers are void.
+            self._rows, self._used, self._mm = {}, [], None
+            self._file = name
+        self._dim = dim
+        n = min(len(keys), self._file_rows())
+        if len(self._used) < n:
+            self._used.extend([0] * (n - len(self._used)))
+        for r in np.flatnonzero(keys[:n].any(axis=1)).tolist():
+            self._rows.setdefault(bytes(keys[r]), r)
+            self._used[r] = max(self._used[r], int(used[r]))
+        self._tick = max(self._tick, int(used.max()) if len(used) else 0)
+
+    def _sync_locked(self) -> None:
+        with file_lock(self._lock_path):
+            self._sync()
+
+    def _matrix(self) -> np.ndarray:
+        if self._mm is None or self._mm.shape[0] != len(self._used):
+            self._mm = np.memmap(
+                self.dir / self._file,
+                dtype=self.dtype,
+                mode="r",
+                shape=(len(self._used), self._dim),
+            )
+        return self._mm
+
+    def _read(self, keys: List[bytes]) -> Tuple[Optional[np.ndarray], List[int]]:
+        found: List[Tuple[int, int]] = []
+        missing: List[int] = []
+        for i, key in enumerate(keys):
+            row = self._rows.get(key)
+            if row is None:
+                missing.append(i)
+            else:
+                found.append((i, row))
+        if self._dim is None:
+            self.misses += len(missing)
+            return None, missing
+
+        out = np.zeros((len(keys), self._dim), dtype=np.float32)
+        if found:
+            mat = self._matrix()
+            pos = np.fromiter((i for i, _ in found), dtype=np.int64, count=len(found))
+            rows = np.fromiter((r for _, r in found), dtype=np.int64, count=len(found))
+            out[pos] = mat[rows]
+            self._tick += 1
+            for r in rows.tolist():
+                self._used[r] = self._tick
+            self._dirty = True
+        self.hits += len(found)
+        self.misses += len(missing)
+        return out, missing
+
+    def get_many(self, fingerprints: Sequence[str]) -> Tuple[Optional[np.ndarray], List[int]]:
+        """
+        Look up hex SHA-256 fingerprints.
+
+        Returns (vectors, missing): a float32 array with one row per
+        fingerprint (rows of misses are zero, None if nothing is cached yet)
+        and the positions of the misses.
+        """
+        keys = [bytes.fromhex(fp) for fp in fingerprints]
+        with self._lock:
+            # Another process may have cached the misses since the last look.
+            if any(k not in self._rows for k in keys) and self._stat_index() != self._index_stat:
+                self._sync_locked()
+            try:
+                return self._read(keys)
+            except FileNotFoundError:  # compacted away by another process
+                self._sync_locked()
+                return self._read(keys)
+
+    def _new_file(self) -> None:
+        self._file = f"vectors-{uuid.uuid4().hex[:16]}.bin"
+        (self.dir / self._file).touch()
+        self._rows, self._used, self._mm = {}, [], None
+        # Indexed right away so that other writers append to the same file.
+        self._write_index()
+
+    def put_many(self, fingerprints: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors)
+        if len(fingerprints) == 0:
+            return
+        with self._lock, file_lock(self._lock_path):
+            if self._file is None or not (self.dir / self._file).exists():
+                self._sync()
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dim {vectors.shape[1]} does not match cache dim {self._dim}"
+                )
+            fresh = []
+            seen = set()
+            for i, fp in enumerate(fingerprints):
+                key = bytes.fromhex(fp)
+                if key not in self._rows and key not in seen:
+                    seen.add(key)
+                    fresh.append((i, key))
+            if not fresh:
+                return
+            self.dir.mkdir(parents=True, exist_ok=True)
+            if self._file is None or not (self.dir / self._file).exists():
+                self._new_file()
+            block = vectors[[i for i, _ in fresh]].astype(self.dtype, copy=False)
+            row_bytes = self._dim * self.dtype.itemsize
+            with (self.dir / self._file).open("r+b") as f:
+                size = f.seek(0, os.SEEK_END)
+                start = size // row_bytes
+                if size % row_bytes:  # torn row of a writer that crashed
+                    f.truncate(start * row_bytes)
+                    f.seek(start * row_bytes)
+                f.write(np.ascontiguousarray(block).tobytes())
+            self._tick += 1
+            self._used.extend([0] * (start - len(self._used)))
+            for j, (_, key) in enumerate(fresh):
+                self._rows[key] = start + j
+                self._used.append(self._tick)
+            self._mm = None
+            self._dirty = True
+
+    def _evict(self) -> None:
+        row_bytes = self._dim * self.dtype.itemsize
+        if self._file_rows() * row_bytes <= self.max_bytes:
+            return
+        keep_n = int(self.max_bytes * EVICT_TO) // row_bytes
+        used = np.asarray(self._used, dtype=np.int64)
+        known = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+        keep = np.sort(known[np.argsort(-used[known], kind="stable")[:keep_n]])
+
+        mat = self._matrix()
+        name = f"vectors-{uuid.uuid4().hex[:16]}.bin"
+        with (self.dir / name).open("wb") as f:
+            for start in range(0, len(keep), 4096):
+                f.write(np.ascontiguousarray(mat[keep[start : start + 4096]]).tobytes())
+        self._mm = None
+
+        keys_by_row = {row: key for key, row in self._rows.items()}
+        self._rows = {keys_by_row[int(r)]: i for i, r in enumerate(keep)}
+        self._used = used[keep].tolist()
+        self._file = name
+
+    def _write_index(self) -> None:
+        keys = np.zeros((len(self._used), 32), dtype=np.uint8)
+        for key, row in self._rows.items():
+            keys[row] = np.frombuffer(key, dtype=np.uint8)
+        tmp = self.dir / f"index.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp,
+            keys=keys,
+            used=np.asarray(self._used, dtype=np.int64),
+            dim=np.int64(self._dim),
+            dtype=np.str_(self.dtype.str),
+            vectors_file=np.str_(self._file),
+        )
+        tmp.replace(self._index_path)
+        self._index_stat = self._stat_index()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty or self._dim is None:
+                return
+            with file_lock(self._lock_path):
+                self._sync()
+                self._evict()
+                self._write_index()
+                # Vectors files the index no longer names: compacted, or left
+                # by a compaction that crashed before its index was written.
+                for path in self.dir.glob("vectors*.bin"):
+                    if path.name != self._file:
+                        path.unlink(missing_ok=True)
+            self._dirty = False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = len(self._rows)
+            return {
+                "entries": entries,
+                "bytes": entries * (self._dim or 0) * self.dtype.itemsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_caches: Dict[Tuple[str, str], EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(root: Path, model_name: str) -> EmbeddingCache:
+    """Process-wide cache instance per (root, model)."""
+    key = (str(root), model_name)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = EmbeddingCache(root, model_name)
+            _caches[key] = cache
+        return cache
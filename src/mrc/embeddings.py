@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import json
+import os
+import platform
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+DEFAULT_MAX_MODELS = 2
+
+# "torch" (SentenceTransformer on PyTorch), "onnx" (ONNX Runtime, fp32) or
+# "onnx-int8" (ONNX Runtime, dynamically quantized weights). The ONNX
+# runtimes need optimum[onnxruntime] and fall back to torch when the model
+# cannot be exported or fails the parity check.
+RUNTIMES = ("torch", "onnx", "onnx-int8")
+EMBED_RUNTIME = os.getenv("MRC_EMBED_RUNTIME", "torch")
+ONNX_DIR = Path(os.getenv("MRC_ONNX_DIR", "storage/onnx"))
+# Intra-op threads for ONNX Runtime (0: one per CPU available to the process).
+ONNX_THREADS = int(os.getenv("MRC_ONNX_THREADS", "0"))
+# Minimum cosine between PyTorch and ONNX embeddings of PARITY_TEXTS.
+PARITY_MIN_COSINE = 0.99
+PARITY_TEXTS = (
+    "The quarterly report is due on Friday.",
+    "Le rapport trimestriel doit être remis vendredi.",
+    "Der Quartalsbericht ist am Freitag fällig.",
+    "El informe trimestral vence el viernes.",
+    "四半期報告書は金曜日が締め切りです。",
+    "التقرير الفصلي مستحق يوم الجمعة.",
+    "Error ERR-404: resource not found (v1.2.3).",
+    "ok",
+)
+
+
+@dataclass
+class ModelInfo:
+    name: str
+    load_s: float
+    resident_bytes: int
+    warm: bool = False
+    runtime: str = "torch"
+    # Why a requested ONNX runtime fell back to torch ("" if it did not).
+    fallback: str = ""
+    # Min cosine to the PyTorch embeddings on PARITY_TEXTS (ONNX only).
+    parity: Optional[float] = None
+
+
+def _resident_bytes(model: SentenceTransformer) -> int:
+    total = 0
+    for t in list(model.parameters()) + list(model.buffers()):
+        total += t.numel() * t.element_size()
+    return total
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "__", name).strip("_") or "model"
+
+
+def _cpu_threads() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        return os.cpu_count() or 1
+
+
+def _quant_config() -> str:
+    """ONNX Runtime dynamic quantization preset for this CPU."""
+    if os.getenv("MRC_ONNX_QUANT"):
+        return os.environ["MRC_ONNX_QUANT"]
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        flags = Path("/proc/cpuinfo").read_text()
+    except OSError:
+        return "avx2"
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def parity(reference: SentenceTransformer, candidate: SentenceTransformer) -> float:
+    """Lowest cosine similarity between the two models' embeddings of PARITY_TEXTS."""
+    a = reference.encode(list(PARITY_TEXTS), normalize_embeddings=True)
+    b = candidate.encode(list(PARITY_TEXTS), normalize_embeddings=True)
+    return float(np.min(np.sum(a * b, axis=1)))
+
+
+def _onnx_artifact(name: str, runtime: str) -> Path:
+    """
+    Export `name` for `runtime` under ONNX_DIR once and return its directory.
+
+    The model is exported (and quantized) into a temporary directory that
+    is renamed into place when complete, with parity against PyTorch
+    recorded in parity.json, so concurrent processes never load a partial
+    export.
+    """
+    quant = _quant_config() if runtime == "onnx-int8" else ""
+    out = ONNX_DIR / _slug(name) / (f"int8-{quant}" if quant else "fp32")
+    if (out / "parity.json").exists():
+        return out
+    tmp = out.with_name(f"{out.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        if quant:
+            # Quantize from the cached fp32 export rather than exporting again.
+            fp32 = _onnx_artifact(name, "onnx")
+            shutil.copytree(fp32, tmp)
+            (tmp / "parity.json").unlink()
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+
+            model = SentenceTransformer(str(tmp), backend="onnx", device="cpu")
+            export_dynamic_quantized_onnx_model(model, quant, str(tmp))
+            (tmp / "onnx" / "model.onnx").unlink()
+        else:
+            model = SentenceTransformer(name, backend="onnx", device="cpu")
+            model.save_pretrained(str(tmp))
+        candidate = _load_onnx(tmp)
+        score = parity(SentenceTransformer(name, device="cpu"), candidate)
+        (tmp / "parity.json").write_text(
+            json.dumps({"model": name, "runtime": runtime, "quant": quant, "min_cosine": score}),
+            encoding="utf-8",
+        )
+        out.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            tmp.rename(out)
+        except OSError:  # another process finished first
+            pass
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return out
+
+
+def _onnx_file(path: Path) -> str:
+    files = sorted(p.name for p in (path / "onnx").glob("*.onnx"))
+    if not files:
+        raise FileNotFoundError(f"No ONNX model in {path}")
+    return f"onnx/{files[0]}"
+
+
+def _load_onnx(path: Path) -> SentenceTransformer:
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = ONNX_THREADS or _cpu_threads()
+    # One request at a time per session; parallelism is inside each op.
+    opts.inter_op_num_threads = 1
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return SentenceTransformer(
+        str(path),
+        backend="onnx",
+        device="cpu",
+        model_kwargs={
+            "file_name": _onnx_file(path),
+            "provider": "CPUExecutionProvider",
+            "session_options": opts,
+        },
+    )
+
+
+def _load(name: str, runtime: str) -> Tuple[SentenceTransformer, ModelInfo]:
+    t0 = time.perf_counter()
+    fallback = ""
+    if runtime != "torch":
+        try:
+            path = _onnx_artifact(name, runtime)
+            score = json.loads((path / "parity.json").read_text(encoding="utf-8"))["min_cosine"]
+            if score < PARITY_MIN_COSINE:
+                raise ValueError(f"parity {score:.4f} < {PARITY_MIN_COSINE}")
+            model = _load_onnx(path)
+            size = (path / _onnx_file(path)).stat().st_size
+            info = ModelInfo(name, time.perf_counter() - t0, size, runtime=runtime, parity=score)
+            return model, info
+        except Exception as e:  # optimum missing, export failure, parity
+            fallback = f"{type(e).__name__}: {e}"
+    model = SentenceTransformer(name)
+    info = ModelInfo(
+        name, time.perf_counter() - t0, _resident_bytes(model), runtime="torch", fallback=fallback
+    )
+    return model, info
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of SentenceTransformer models.
+
+    Each (model, runtime) is loaded once and shared by every caller
+    (Streamlit sessions, the Airflow task, ...). At most `max_models` stay
+    resident; the least recently used one is dropped when a new model is
+    requested.
+    """
+
+    def __init__(self, max_models: int = DEFAULT_MAX_MODELS) -> None:
+        self.max_models = max(1, max_models)
+        self._models: "OrderedDict[Tuple[str, str], SentenceTransformer]" = OrderedDict()
+        self._info: Dict[Tuple[str, str], ModelInfo] = {}
+        self._lock = threading.Lock()
+        self._loading: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def get(self, name: str, runtime: Optional[str] = None) -> SentenceTransformer:
+        return self._get(name, runtime)[0]
+
+    def _get(self, name: str, runtime: Optional[str]) -> Tuple[SentenceTransformer, ModelInfo]:
+        """
+        The model and its info, loading it if needed. Both are read under one
+        lock hold, so an eviction cannot drop the info in between.
+        """
+        key = (name, _runtime(runtime))
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                return model, self._info[key]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so other models stay available;
+        # concurrent requests for the same model wait on its own lock.
+        with load_lock:
+            with self._lock:
+                model = self._models.get(key)
+                if model is not None:
+                    self._models.move_to_end(key)
+                    return model, self._info[key]
+
+            model, info = _load(*key)
+
+            with self._lock:
+                self._models[key] = model
+                self._info[key] = info
+                while len(self._models) > self.max_models:
+                    evicted, _ = self._models.popitem(last=False)
+                    self._info.pop(evicted, None)
+                self._loading.pop(key, None)
+            return model, info
+
+    def warmup(self, name: str, runtime: Optional[str] = None) -> ModelInfo:
+        key = (name, _runtime(runtime))
+        model = self.get(*key)
+        with self._lock:
+            info = self._info.get(key)
+            warm = info is not None and info.warm
+        if not warm:
+            # First encode allocates buffers / tokenizer caches.
+            model.encode(["warm-up"], normalize_embeddings=True)
+            with self._lock:
+                if key in self._info:
+                    self._info[key].warm = True
+        return self.info(*key)
+
+    def info(self, name: str, runtime: Optional[str] = None) -> ModelInfo:
+        with self._lock:
+            info = self._info.get((name, _runtime(runtime)))
+            if info is None:
+                raise KeyError(f"Model not loaded: {name}")
+            return ModelInfo(**vars(info))
+
+    def runtime_of(self, name: str, runtime: Optional[str] = None) -> str:
+        """Runtime `name` actually runs on (torch if ONNX fell back), loading it if needed."""
+        return self._get(name, runtime)[1].runtime
+
+    def loaded_runtime(self, name: str, runtime: Optional[str] = None) -> Optional[str]:
+        """Runtime `name` runs on if it is loaded, else None; never loads it."""
+        with self._lock:
+            info = self._info.get((name, _runtime(runtime)))
+            return None if info is None else info.runtime
+
+    def stats(self) -> List[ModelInfo]:
+        with self._lock:
+            return [ModelInfo(**vars(self._info[k])) for k in self._models]
+
+    def unload(self, name: str, runtime: Optional[str] = None) -> None:
+        key = (name, _runtime(runtime))
+        with self._lock:
+            self._models.pop(key, None)
+            self._info.pop(key, None)
+
+
+def _runtime(runtime: Optional[str]) -> str:
+    runtime = runtime or EMBED_RUNTIME
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown embedding runtime: {runtime} (expected one of {RUNTIMES})")
+    return runtime
+
+
+registry = ModelRegistry()
+
+
+def get_model(name: str, runtime: Optional[str] = None) -> SentenceTransformer:
+    return registry.get(name, runtime)
+
+
+def warmup(name: str, runtime: Optional[str] = None) -> ModelInfo:
+    return registry.warmup(name, runtime)
+
+
+def model_runtime(name: str, runtime: Optional[str] = None) -> str:
+    return registry.runtime_of(name, runtime)
+
+
+def loaded_runtime(name: str, runtime: Optional[str] = None) -> Optional[str]:
+    return registry.loaded_runtime(name, runtime)
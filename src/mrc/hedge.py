@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .tracing import observe
+
+# Hedged generation: start on the primary backend and, if it has not sent a
+# first token after HEDGE_PERCENTILE of its recent time-to-first-token, also
+# start the secondary one. The first backend to send a token wins; the
+# other request is cancelled.
+HEDGE_ENABLED = os.getenv("MRC_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("MRC_HEDGE_PERCENTILE", "95"))
+# Hedge delay until a backend has HEDGE_MIN_SAMPLES first-token times.
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("MRC_HEDGE_DELAY_S", "2.0"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_S = 0.05
+HEDGE_MAX_DELAY_S = 30.0
+# Recent latencies kept per backend.
+WINDOW = 512
+
+# A backend's breaker opens after BREAKER_FAILURES consecutive failures;
+# BREAKER_COOLDOWN_S later a single trial request is let through
+# (half-open), which closes it again on success.
+BREAKER_FAILURES = int(os.getenv("MRC_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_S = float(os.getenv("MRC_BREAKER_COOLDOWN_S", "30"))
+
+# Opens a backend's token stream; the callback receives the response (or
+# stream) object whose close() aborts the request.
+Opener = Callable[[Callable[[Any], None]], Iterator[str]]
+
+_DONE = object()
+
+
+class CircuitBreaker:
+    def __init__(
+        self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S
+    ) -> None:
+        self.failures = max(1, failures)
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self._count = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown_s:
+                return "open"
+            return "half-open"
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (claims the half-open trial)."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown_s or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self._count = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._count += 1
+            self._trial = False
+            if self._opened_at is not None or self._count >= self.failures:
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """A request was cancelled before its outcome was known."""
+        with self._lock:
+            self._trial = False
+
+
+class BackendHealth:
+    """Recent latencies, counters and circuit breaker of one LLM backend."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._ttft: Deque[float] = deque(maxlen=WINDOW)
+        self._total: Deque[float] = deque(maxlen=WINDOW)
+        self.counts = {"requests": 0, "failures": 0, "cancelled": 0, "hedges": 0, "wins": 0}
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def first_token(self, seconds: float) -> None:
+        observe(f"llm_ttft.{self.name}", seconds)
+        with self._lock:
+            self._ttft.append(seconds)
+
+    def done(self, seconds: float) -> None:
+        observe(f"llm_total.{self.name}", seconds)
+        with self._lock:
+            self._total.append(seconds)
+        self.breaker.success()
+
+    def failed(self) -> None:
+        self.count("failures")
+        self.breaker.failure()
+
+    def cancelled(self) -> None:
+        self.count("cancelled")
+        self.breaker.release()
+
+    def percentile(self, q: float, total: bool = False) -> Optional[float]:
+        with self._lock:
+            samples = list(self._total if total else self._ttft)
+        return float(np.percentile(samples, q)) if samples else None
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            enough = len(self._ttft) >= HEDGE_MIN_SAMPLES
+        if not enough:
+            return HEDGE_DEFAULT_DELAY_S
+        delay = self.percentile(HEDGE_PERCENTILE)
+        return min(HEDGE_MAX_DELAY_S, max(HEDGE_MIN_DELAY_S, delay))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+            samples = len(self._ttft)
+        return {
+            **counts,
+            "breaker": self.breaker.state,
+            "samples": samples,
+            "ttft_p50_s": self.percentile(50),
+            "ttft_p95_s": self.percentile(95),
+            "total_p50_s": self.percentile(50, total=True),
+            "total_p95_s": self.percentile(95, total=True),
+            "hedge_delay_s": self.hedge_delay(),
+        }
+
+
+_health: Dict[str, BackendHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_health(backend: str) -> BackendHealth:
+    with _health_lock:
+        health = _health.get(backend)
+        if health is None:
+            health = _health[backend] = BackendHealth(backend)
+        return health
+
+
+def health_stats() -> Dict[str, Dict[str, Any]]:
+    with _health_lock:
+        backends = list(_health.values())
+    return {h.name: h.stats() for h in backends}
+
+
+class _Leg:
+    """One backend request, streaming its tokens into the shared queue."""
+
+    def __init__(self, backend: str, opener: Opener, events: "queue.Queue") -> None:
+        self.backend = backend
+        self.health = get_health(backend)
+        self._opener = opener
+        self._events = events
+        self._closer: Any = None
+        self._cancelled = threading.Event()
+        self._aborted = False
+        self._t0 = time.perf_counter()
+        self.health.count("requests")
+        # copy_context keeps the request's spans under the caller's span.
+        ctx = contextvars.copy_context()
+        threading.Thread(
+            target=ctx.run, args=(self._run,), name=f"mrc-llm-{backend}", daemon=True
+        ).start()
+
+    def _on_open(self, closer: Any) -> None:
+        self._closer = closer
+        if self._cancelled.is_set():
+            self._close()
+
+    def _run(self) -> None:
+        try:
+            first = True
+            for token in self._opener(self._on_open):
+                if self._cancelled.is_set():
+                    break
+                if first:
+                    self.health.first_token(time.perf_counter() - self._t0)
+                    first = False
+                self._events.put((self, token))
+            if self._cancelled.is_set():
+                self.health.cancelled()
+                return
+            self.health.done(time.perf_counter() - self._t0)
+            self._events.put((self, _DONE))
+        except Exception as e:
+            # Errors caused by closing the response are cancellations; a
+            # backend that failed before that (refused, timed out) is not.
+            if self._aborted:
+                self.health.cancelled()
+                return
+            self.health.failed()
+            if self._cancelled.is_set():
+                return
+            self._events.put((self, e))
+
+    def _close(self) -> None:
+        closer = self._closer
+        if closer is not None:
+            self._aborted = True
+            try:
+                closer.close()
+            except Exception:
+                pass
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self._close()
+
+
+class HedgedTokens:
+    """
+    Answer tokens from the first of two backends to respond.
+
+    The primary request starts at once (or the secondary, if the primary's
+    breaker is open). If no token has arrived after the primary's hedge
+    delay, or the primary fails first, the secondary is started too. The
+    first backend to send a token is kept and the other request closed.
+    `backend` is the winner and `hedged` whether the secondary was started.
+    """
+
+    def __init__(
+        self,
+        primary: Tuple[str, Opener],
+        secondary: Optional[Tuple[str, Opener]] = None,
+        on_winner: Optional[Callable[["HedgedTokens"], None]] = None,
+    ) -> None:
+        self._primary = primary
+        self._secondary = secondary
+        self._on_winner = on_winner
+        self.backend: Optional[str] = None
+        self.hedged = False
+
+    def __iter__(self) -> Iterator[str]:
+        events: "queue.Queue" = queue.Queue()
+        legs: List[_Leg] = []
+        live: List[_Leg] = []
+
+        def launch(spec: Tuple[str, Opener]) -> None:
+            leg = _Leg(spec[0], spec[1], events)
+            legs.append(leg)
+            live.append(leg)
+
+        spare = self._secondary
+        if get_health(self._primary[0]).breaker.allow():
+            launch(self._primary)
+        elif spare is not None and get_health(spare[0]).breaker.allow():
+            launch(spare)
+            spare = None
+        else:
+            # Both backends look unhealthy: try the primary anyway.
+            launch(self._primary)
+            spare = None
+        deadline = time.perf_counter() + get_health(legs[0].backend).hedge_delay()
+
+        def hedge() -> None:
+            nonlocal spare
+            if spare is not None and get_health(spare[0]).breaker.allow():
+                get_health(spare[0]).count("hedges")
+                self.hedged = True
+                launch(spare)
+            spare = None
+
+        winner: Optional[_Leg] = None
+        try:
+            while True:
+                timeout = None
+                if winner is None and spare is not None:
+                    timeout = max(0.0, deadline - time.perf_counter())
+                try:
+                    leg, item = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge()
+                    continue
+                if winner is None:
+                    if isinstance(item, Exception):
+                        live.remove(leg)
+                        hedge()
+                        if not live:
+                            raise item
+                        continue
+                    winner = leg
+                    self.backend = leg.backend
+                    leg.health.count("wins")
+                    for other in legs:
+                        if other is not leg:
+                            other.cancel()
+                    if self._on_winner is not None:
+                        self._on_winner(self)
+                if leg is not winner:
+                    continue
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Also reached when the consumer stops early.
+            for leg in legs:
+                leg.cancel()
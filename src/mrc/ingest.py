@@ -1,14 +1,28 @@
 from __future__ import annotations
 
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from io import BytesIO
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 from bs4 import BeautifulSoup
 from docx import Document as DocxDocument
 from pypdf import PdfReader
 
+from .lang import chunk_language
+from .textcache import TextCache, get_text_cache, hash_bytes
+from .tracing import record, stage
+
+SUPPORTED_SUFFIXES = {".pdf", ".txt", ".md", ".docx", ".html", ".htm"}
+DEFAULT_PARSE_TIMEOUT_S = 120.0
+# Bump when _clean or a _read_* parser changes output: texts cached by an
+# older version are then ignored (see textcache.py).
+PARSER_VERSION = 1
+
 
 @dataclass
 class RawDoc:
@@ -16,6 +30,15 @@ class RawDoc:
     text: str
 
 
+@dataclass
+class ParseResult:
+    source: str
+    doc: Optional[RawDoc]
+    seconds: float
+    error: str = ""
+    cached: bool = False
+
+
 def _clean(text: str) -> str:
     text = text.replace("\x00", " ")
     text = "\n".join([line.strip() for line in text.splitlines()])
@@ -28,6 +51,13 @@ def _read_pdf(b: bytes, source: str) -> RawDoc:
     return RawDoc(source=source, text=_clean("\n".join(pages)))
 
 
+def _iter_pdf_pages(path: Path) -> Iterator[str]:
+    # PdfReader on a path reads objects lazily, so only one page's text is alive.
+    reader = PdfReader(str(path))
+    for page in reader.pages:
+        yield _clean(page.extract_text() or "")
+
+
 def _read_txt(b: bytes, source: str) -> RawDoc:
     try:
         text = b.decode("utf-8")
@@ -52,59 +82,274 @@ def _read_html(b: bytes, source: str) -> RawDoc:
     return RawDoc(source=source, text=_clean(soup.get_text(" ")))
 
 
-def load_uploaded_files(files) -> List[RawDoc]:
+def _parse(name: str, b: bytes) -> RawDoc:
+    suffix = Path(name).suffix.lower()
+    if suffix == ".pdf":
+        return _read_pdf(b, name)
+    if suffix == ".txt":
+        return _read_txt(b, name)
+    if suffix == ".md":
+        return _read_md(b, name)
+    if suffix == ".docx":
+        return _read_docx(b, name)
+    if suffix in {".html", ".htm"}:
+        return _read_html(b, name)
+    raise ValueError(f"Unsupported file type: {suffix}")
+
+
+def _cache_tag(name: str) -> str:
+    return f"{Path(name).suffix.lower().lstrip('.')}-v{PARSER_VERSION}"
+
+
+def _digest(cache: TextCache, path: Optional[str], data: Optional[bytes]) -> str:
+    return hash_bytes(data) if data is not None else cache.digest_of(Path(path))
+
+
+def _parse_cached(name: str, path: Optional[Path] = None, data: Optional[bytes] = None):
+    """
+    _parse through the text cache, for a file on disk (`path`) or in memory
+    (`data`). Returns (doc, cached); a cached file is not parsed.
+    """
+    cache = get_text_cache()
+    if cache is None:
+        return _parse(name, data if data is not None else Path(path).read_bytes()), False
+    digest = _digest(cache, path, data)
+    text = cache.get(digest, _cache_tag(name))
+    if text is not None:
+        return RawDoc(source=name, text=text), True
+    doc = _parse(name, data if data is not None else Path(path).read_bytes())
+    cache.put(digest, _cache_tag(name), doc.text)
+    return doc, False
+
+
+def _on_timeout(signum, frame):
+    raise TimeoutError("parse timed out")
+
+
+def _parse_job(job: Tuple[str, Optional[str], Optional[bytes]], timeout_s: float) -> ParseResult:
+    """
+    Worker entry point: parse one file, never raise.
+
+    `job` is (name, path, data); workers read `path` themselves so large
+    files are not pickled through the pool. The timeout uses SIGALRM inside
+    the worker, so it is only enforced where that signal exists.
+    """
+    name, path, data = job
+    use_alarm = timeout_s > 0 and hasattr(signal, "SIGALRM")
+    t0 = time.perf_counter()
+    try:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, _on_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout_s)
+        if data is None:
+            data = Path(path).read_bytes()
+        doc = _parse(name, data)
+        return ParseResult(source=name, doc=doc, seconds=time.perf_counter() - t0)
+    except Exception as e:
+        return ParseResult(
+            source=name,
+            doc=None,
+            seconds=time.perf_counter() - t0,
+            error=f"{type(e).__name__}: {e}",
+        )
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def parse_parallel(
+    jobs: Sequence[Tuple[str, Optional[str], Optional[bytes]]],
+    workers: Optional[int] = None,
+    timeout_s: float = DEFAULT_PARSE_TIMEOUT_S,
+) -> List[ParseResult]:
+    """
+    Parse files across a process pool.
+
+    Results come back in the order of `jobs`. A file that fails or times out
+    yields a ParseResult with `error` set instead of aborting the run.
+    Files found in the text cache are not sent to the pool at all.
+    """
+    if not jobs:
+        return []
+    cache = get_text_cache()
+    results: List[Optional[ParseResult]] = [None] * len(jobs)
+    digests: Dict[int, str] = {}
+    todo: List[int] = []
+    for i, (name, path, data) in enumerate(jobs):
+        if cache is not None:
+            t0 = time.perf_counter()
+            try:
+                digests[i] = _digest(cache, path, data)
+            except OSError:
+                todo.append(i)  # unreadable: let the worker report it
+                continue
+            text = cache.get(digests[i], _cache_tag(name))
+            if text is not None:
+                results[i] = ParseResult(
+                    source=name,
+                    doc=RawDoc(source=name, text=text),
+                    seconds=time.perf_counter() - t0,
+                    cached=True,
+                )
+                continue
+        todo.append(i)
+
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            futures = [pool.submit(_parse_job, jobs[i], timeout_s) for i in todo]
+            for i, fut in zip(todo, futures):
+                try:
+                    results[i] = fut.result()
+                except Exception as e:  # worker crashed (e.g. BrokenProcessPool)
+                    results[i] = ParseResult(
+                        source=jobs[i][0], doc=None, seconds=0.0, error=f"{type(e).__name__}: {e}"
+                    )
+        # Workers don't export telemetry; their timings are recorded here.
+        for i in todo:
+            r = results[i]
+            record("parse", r.seconds, source=r.source, error=r.error)
+            if cache is not None and r.doc is not None and i in digests:
+                cache.put(digests[i], _cache_tag(r.source), r.doc.text)
+    if cache is not None:
+        cache.flush()
+    return results
+
+
+def parse_uploaded_files(
+    files,
+    workers: Optional[int] = None,
+    timeout_s: float = DEFAULT_PARSE_TIMEOUT_S,
+) -> List[ParseResult]:
+    jobs = [(uf.name, None, uf.getvalue()) for uf in files]
+    return parse_parallel(jobs, workers=workers, timeout_s=timeout_s)
+
+
+def load_uploaded_files(files, workers: int = 0) -> List[RawDoc]:
+    if workers:
+        results = parse_uploaded_files(files, workers=workers)
+        return [r.doc for r in results if r.doc is not None and r.doc.text]
+
     docs: List[RawDoc] = []
     for uf in files:
-        name = uf.name
-        suffix = Path(name).suffix.lower()
-        b = uf.getvalue()
-
-        if suffix == ".pdf":
-            docs.append(_read_pdf(b, name))
-        elif suffix == ".txt":
-            docs.append(_read_txt(b, name))
-        elif suffix == ".md":
-            docs.append(_read_md(b, name))
-        elif suffix == ".docx":
-            docs.append(_read_docx(b, name))
-        elif suffix in {".html", ".htm"}:
-            docs.append(_read_html(b, name))
-        else:
-            raise ValueError(f"Unsupported file type: {suffix}")
-
+        with stage("parse", source=uf.name) as st:
+            doc, cached = _parse_cached(uf.name, data=uf.getvalue())
+            st.set(cached=cached)
+        docs.append(doc)
+    _flush_text_cache()
     return [d for d in docs if d.text]
 
 
-def load_corpus_folder(folder: Path) -> List[RawDoc]:
+def list_corpus_files(folder: Path) -> List[Path]:
+    return sorted(
+        p for p in folder.rglob("*") if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES
+    )
+
+
+def parse_corpus_folder(
+    folder: Path,
+    workers: Optional[int] = None,
+    timeout_s: float = DEFAULT_PARSE_TIMEOUT_S,
+) -> List[ParseResult]:
+    if not folder.exists():
+        return []
+    jobs = [(p.name, str(p), None) for p in list_corpus_files(folder)]
+    return parse_parallel(jobs, workers=workers, timeout_s=timeout_s)
+
+
+def load_corpus_folder(folder: Path, workers: int = 0) -> List[RawDoc]:
+    if workers:
+        results = parse_corpus_folder(folder, workers=workers)
+        return [r.doc for r in results if r.doc is not None and r.doc.text]
+
     if not folder.exists():
         return []
     docs: List[RawDoc] = []
-    for path in folder.rglob("*"):
-        if not path.is_file():
-            continue
-        if path.suffix.lower() not in {".pdf", ".txt", ".md", ".docx", ".html", ".htm"}:
+    for path in list_corpus_files(folder):
+        with stage("parse", source=path.name) as st:
+            doc, cached = _parse_cached(path.name, path=path)
+            st.set(cached=cached)
+        docs.append(doc)
+    _flush_text_cache()
+    return [d for d in docs if d.text]
+
+
+def _flush_text_cache() -> None:
+    cache = get_text_cache()
+    if cache is not None:
+        cache.flush()
+
+
+def iter_file_segments(path: Path) -> Iterator[str]:
+    """
+    Cleaned text of one file as a stream of segments (one per PDF page).
+
+    _clean works line by line, so joining the segments with newlines gives
+    the same text as parsing the whole file at once. A file in the text
+    cache comes back as a single segment, without parsing.
+    """
+    cache = get_text_cache()
+    if cache is None:
+        yield from _iter_parsed_segments(path)
+        return
+    digest = cache.digest_of(path)
+    text = cache.get(digest, _cache_tag(path.name))
+    if text is not None:
+        yield text
+        return
+    segments: List[str] = []
+    for seg in _iter_parsed_segments(path):
+        segments.append(seg)
+        yield seg
+    # Only reached when the whole file was parsed.
+    cache.put(digest, _cache_tag(path.name), _clean("\n".join(segments)))
+
+
+def _iter_parsed_segments(path: Path) -> Iterator[str]:
+    if path.suffix.lower() == ".pdf":
+        yield from _iter_pdf_pages(path)
+    else:
+        yield _parse(path.name, path.read_bytes()).text
+
+
+def iter_text_chunks(
+    source: str,
+    segments: Iterable[str],
+    chunk_size: int = 900,
+    overlap: int = 150,
+) -> Iterator[Dict]:
+    """
+    Chunk a stream of text segments without materialising the full text.
+
+    Produces exactly the chunks chunk_documents would for the joined text;
+    only the current window plus one segment is held in memory. Each chunk
+    gets its detected `lang` (see lang.py); chunks too short or ambiguous
+    to tell inherit the previous chunk's.
+    """
+    buf = ""
+    started = False
+    cid = 0
+    lang = None
+    for seg in segments:
+        if not seg:
             continue
-        b = path.read_bytes()
-        # fake UploadedFile-like object
-        uf = type("UF", (), {"name": path.name, "getvalue": lambda self=b: self})()
-        docs.extend(load_uploaded_files([uf]))
-    return docs
+        buf = buf + "\n" + seg if started else seg
+        started = True
+        # Emit a window only once more text is known to follow it.
+        while len(buf) > chunk_size:
+            text = buf[:chunk_size]
+            lang = chunk_language(text, lang)
+            yield {"text": text, "source": source, "chunk_id": cid, "lang": lang}
+            cid += 1
+            buf = buf[max(0, chunk_size - overlap):]
+    if buf:
+        yield {"text": buf, "source": source, "chunk_id": cid, "lang": chunk_language(buf, lang)}
 
 
 def chunk_documents(docs: List[RawDoc], chunk_size: int = 900, overlap: int = 150):
     chunks = []
-    for d in docs:
-        text = d.text
-        if len(text) <= chunk_size:
-            chunks.append({"text": text, "source": d.source, "chunk_id": 0})
-            continue
-        start = 0
-        cid = 0
-        while start < len(text):
-            end = min(start + chunk_size, len(text))
-            chunks.append({"text": text[start:end], "source": d.source, "chunk_id": cid})
-            cid += 1
-            if end >= len(text):
-                break
-            start = max(0, end - overlap)
+    with stage("chunk", docs=len(docs)) as st:
+        for d in docs:
+            chunks.extend(iter_text_chunks(d.source, [d.text], chunk_size, overlap))
+        st.set(chunks=len(chunks))
     return chunks
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Bump when detection changes: indexes built with another version are
+# rebuilt by update_store, so every chunk carries comparable labels.
+DETECTOR_VERSION = 1
+UNKNOWN = "und"
+# Only the start of a text is looked at.
+MAX_CHARS = 2000
+# Latin-script languages need this many stopword hits, and the best one
+# must beat the runner-up by MIN_MARGIN.
+MIN_HITS = 2
+MIN_MARGIN = 1.5
+
+# Scripts that identify a language by themselves, checked on letter counts.
+_SCRIPTS: List[Tuple[str, re.Pattern]] = [
+    ("ko", re.compile(r"[\uac00-\ud7af\u1100-\u11ff\u3130-\u318f]")),
+    ("ja", re.compile(r"[\u3040-\u30ff]")),
+    ("zh", re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")),
+    ("ar", re.compile(r"[\u0600-\u06ff\u0750-\u077f\ufb50-\ufdff\ufe70-\ufeff]")),
+    ("he", re.compile(r"[\u0590-\u05ff]")),
+    ("el", re.compile(r"[\u0370-\u03ff\u1f00-\u1fff]")),
+    ("ru", re.compile(r"[\u0400-\u04ff]")),
+    ("hi", re.compile(r"[\u0900-\u097f]")),
+    ("bn", re.compile(r"[\u0980-\u09ff]")),
+    ("ta", re.compile(r"[\u0b80-\u0bff]")),
+    ("th", re.compile(r"[\u0e00-\u0e7f]")),
+    ("hy", re.compile(r"[\u0530-\u058f]")),
+    ("ka", re.compile(r"[\u10a0-\u10ff]")),
+]
+_LATIN_RE = re.compile(r"[A-Za-z\u00c0-\u024f]")
+_UKRAINIAN_RE = re.compile(r"[\u0456\u0457\u0454\u0491\u0406\u0407\u0404\u0490]")
+_PERSIAN_RE = re.compile(r"[\u067e\u0686\u0698\u06af]")
+_WORD_RE = re.compile(r"[a-z\u00e0-\u024f]+(?:'[a-z\u00e0-\u024f]+)?")
+
+_STOPWORDS: Dict[str, frozenset] = {
+    lang: frozenset(words.split())
+    for lang, words in {
+        "en": "the and of to is in that it for on with as are was be this by not or "
+        "have from at which what who how when where why does do can you your an",
+        "fr": "le la les de des est et une un du que qui dans en pour pas sur au aux "
+        "avec ce cette sont être il elle nous vous quel quelle quels comment pourquoi "
+        "où quand ne se plus par ou mais son sa ses leur deux",
+        "de": "der die das und ist nicht ein eine zu den von mit sich des auf für im "
+        "dem auch es wie wer was warum wo wann sind wird werden oder",
+        "es": "el la los las de que y en un una es por para con no se del al como "
+        "qué cuál cómo por qué dónde cuándo está son más pero su",
+        "it": "il lo la gli le di che e è un una per non con del della sono si come "
+        "cosa quale perché dove quando nel alla anche",
+        "pt": "o a os as de que e do da em um uma é para com não por se dos das "
+        "como qual quais onde quando são mais ao foi",
+        "nl": "de het een en van is dat in op te niet met voor zijn er aan ook als "
+        "wat wie hoe waar waarom wanneer door",
+    }.items()
+}
+# Letters that settle a tie between Latin-script languages.
+_LATIN_HINTS = {"ß": "de", "ñ": "es", "ã": "pt", "õ": "pt", "ĳ": "nl", "ò": "it"}
+
+
+def _latin(text: str) -> str:
+    counts = {lang: 0 for lang in _STOPWORDS}
+    for word in _WORD_RE.findall(text):
+        for lang, words in _STOPWORDS.items():
+            if word in words:
+                counts[lang] += 1
+    for ch, lang in _LATIN_HINTS.items():
+        if ch in text:
+            counts[lang] += 1
+    ranked = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+    (best, hits), (_, second) = ranked[0], ranked[1]
+    if hits >= MIN_HITS and hits >= second * MIN_MARGIN and hits > second:
+        return best
+    return UNKNOWN
+
+
+def detect_language(text: str) -> str:
+    """
+    ISO 639-1 code of `text`'s language, or UNKNOWN ("und").
+
+    Non-Latin scripts map to their main language (Cyrillic to Russian or
+    Ukrainian, Arabic script to Arabic or Persian, Han with kana to
+    Japanese); Latin-script text is scored against stopword lists of
+    English, French, German, Spanish, Italian, Portuguese and Dutch.
+    Short or mixed text is UNKNOWN rather than a guess.
+    """
+    text = text[:MAX_CHARS]
+    letters = len(_LATIN_RE.findall(text))
+    best, best_n = "latin", letters
+    counts = {}
+    for lang, pattern in _SCRIPTS:
+        n = counts[lang] = len(pattern.findall(text))
+        if n > best_n:
+            best, best_n = lang, n
+    if best_n == 0:
+        return UNKNOWN
+    if best == "latin":
+        return _latin(text.lower())
+    if best == "zh" and counts["ja"] * 10 >= best_n:
+        return "ja"
+    if best == "ru" and _UKRAINIAN_RE.search(text):
+        return "uk"
+    if best == "ar" and _PERSIAN_RE.search(text):
+        return "fa"
+    return best
+
+
+def chunk_language(text: str, previous: Optional[str] = None) -> str:
+    """detect_language for a chunk, falling back to the previous chunk's language."""
+    lang = detect_language(text)
+    if lang == UNKNOWN and previous:
+        return previous
+    return lang
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Bump when tokenize() changes; indexes built with another version are ignored.
+TOKENIZER_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Longer tokens are dropped (base64 blobs, URLs without separators, ...).
+MAX_TOKEN_LEN = 48
+
+
+def _mark_ranges() -> str:
+    # `\w` excludes combining marks, which would split words in Devanagari,
+    # Thai, Arabic with harakat, etc. Collect them as a character class.
+    ranges, start, prev = [], None, None
+    for cp in range(0x300, 0x20000):
+        if unicodedata.category(chr(cp)) in ("Mn", "Mc", "Me"):
+            if start is None:
+                start = cp
+            elif cp != prev + 1:
+                ranges.append((start, prev))
+                start = cp
+            prev = cp
+    ranges.append((start, prev))
+    return "".join(f"{chr(a)}-{chr(b)}" if a != b else chr(a) for a, b in ranges)
+
+
+_WORD = rf"[\w{_mark_ranges()}]"
+# Words, plus identifiers such as "ERR-404", "v1.2.3" or "a_b/c" kept whole.
+_TOKEN_RE = re.compile(rf"{_WORD}+(?:[-./:]{_WORD}+)*")
+# Scripts written without spaces between words: Han, Hiragana, Katakana.
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def _cjk_bigrams(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[i : i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Unicode-aware BM25 tokens: NFKC-normalized and casefolded.
+
+    Compound identifiers are emitted whole and as their parts, so
+    "ERR-404" matches both "err-404" and "404". Runs of CJK characters
+    become overlapping bigrams.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    out: List[str] = []
+    for m in _TOKEN_RE.finditer(text):
+        tok = m.group()
+        parts = re.split(r"[-./:]", tok) if len(tok) > 1 else [tok]
+        if len(parts) > 1 and len(tok) <= MAX_TOKEN_LEN:
+            out.append(tok)
+        for part in parts:
+            pos = 0
+            for cjk in _CJK_RE.finditer(part):
+                if cjk.start() > pos:
+                    out.append(part[pos : cjk.start()])
+                out.extend(_cjk_bigrams(cjk.group()))
+                pos = cjk.end()
+            if pos < len(part):
+                out.append(part[pos:])
+    return [t for t in out if len(t) <= MAX_TOKEN_LEN]
+
+
+def bm25_idf(n: int, df: int) -> float:
+    """BM25 IDF of a term found in `df` of `n` docs."""
+    return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+
+def build_lexical_index(
+    rows: Iterable[Tuple[str, ...]],
+    path: Path,
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+) -> int:
+    """
+    Write a BM25 index over (uid, text) or (uid, text, lang) rows to
+    `path`; returns the doc count.
+
+    Postings are stored in CSR form (sorted terms, offsets, doc rows) with
+    precomputed per-posting BM25 weights, so a query is a few array slices
+    and one scatter-add per query term. Doc languages, if given, let
+    search() keep one language's hits.
+    """
+    uids: List[str] = []
+    langs: List[str] = []
+    lengths: List[int] = []
+    postings: Dict[str, Tuple[List[int], List[int]]] = {}
+    for uid, text, *lang in rows:
+        counts = Counter(tokenize(text))
+        doc = len(uids)
+        uids.append(uid)
+        langs.append(lang[0] if lang else "")
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            docs, tfs = postings.setdefault(term, ([], []))
+            docs.append(doc)
+            tfs.append(tf)
+
+    n = len(uids)
+    dl = np.asarray(lengths, dtype=np.float32)
+    avgdl = float(dl.mean()) if n else 0.0
+    norm = k1 * (1.0 - b + b * dl / avgdl) if avgdl else np.zeros(n, dtype=np.float32)
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+        offsets[i + 1] = offsets[i] + len(postings[term][0])
+    docs_arr = np.empty(int(offsets[-1]), dtype=np.int32)
+    weights = np.empty(int(offsets[-1]), dtype=np.float32)
+    for i, term in enumerate(terms):
+        docs, tfs = postings[term]
+        start, stop = offsets[i], offsets[i + 1]
+        d = np.asarray(docs, dtype=np.int32)
+        tf = np.asarray(tfs, dtype=np.float32)
+        idf = bm25_idf(n, len(docs))
+        docs_arr[start:stop] = d
+        weights[start:stop] = idf * tf * (k1 + 1.0) / (tf + norm[d])
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    np.save(path / "terms.npy", np.array(terms, dtype=np.str_))
+    np.save(path / "offsets.npy", offsets)
+    np.save(path / "docs.npy", docs_arr)
+    np.save(path / "weights.npy", weights)
+    np.save(path / "uids.npy", np.array(uids, dtype=np.str_))
+    if any(langs):
+        np.save(path / "langs.npy", np.array(langs, dtype=np.str_))
+    (path / "info.json").write_text(
+        json.dumps(
+            {
+                "tokenizer": TOKENIZER_VERSION,
+                "docs": n,
+                "terms": len(terms),
+                "avgdl": avgdl,
+                "k1": k1,
+                "b": b,
+            }
+        ),
+        encoding="utf-8",
+    )
+    return n
+
+
+class LexicalIndex:
+    """Read side of build_lexical_index; arrays are memory-mapped."""
+
+    def __init__(self, path: Path) -> None:
+        path = Path(path)
+        self.info = json.loads((path / "info.json").read_text(encoding="utf-8"))
+        self.terms = np.load(path / "terms.npy", mmap_mode="r")
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.docs = np.load(path / "docs.npy", mmap_mode="r")
+        self.weights = np.load(path / "weights.npy", mmap_mode="r")
+        self.uids = np.load(path / "uids.npy", mmap_mode="r")
+        langs = path / "langs.npy"
+        self.langs = np.load(langs, mmap_mode="r") if langs.exists() else None
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["LexicalIndex"]:
+        """The index at `path`, or None if missing or built by another tokenizer."""
+        try:
+            index = cls(path)
+        except (OSError, ValueError):
+            return None
+        return index if index.info.get("tokenizer") == TOKENIZER_VERSION else None
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def _postings(self, term: str) -> Optional[Tuple[int, int]]:
+        """Slice of `term`'s postings, or None if no doc has it."""
+        i = int(np.searchsorted(self.terms, term))
+        if i >= len(self.terms) or self.terms[i] != term:
+            return None
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def df(self, term: str) -> int:
+        """Number of docs containing `term`."""
+        span = self._postings(term)
+        return 0 if span is None else span[1] - span[0]
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        lang: Optional[str] = None,
+        idf: Optional[Dict[str, float]] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        Top-`k` (uid, BM25 score) pairs for `query`, best first; only docs in
+        `lang` if given. With `idf` (see global_idf), query terms are weighted
+        by it instead of by this index's own document frequencies.
+        """
+        n = len(self.uids)
+        if n == 0 or k <= 0:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            span = self._postings(term)
+            if span is None:
+                continue
+            start, stop = span
+            weights = self.weights[start:stop]
+            if idf is not None and term in idf:
+                weights = weights * np.float32(idf[term] / bm25_idf(n, stop - start))
+            # A term posts each doc at most once, so plain fancy-index add is safe.
+            scores[self.docs[start:stop]] += weights
+        hit = np.flatnonzero(scores)
+        if lang is not None and self.langs is not None:
+            hit = hit[self.langs[hit] == lang]
+        if len(hit) == 0:
+            return []
+        k = min(k, len(hit))
+        top = hit[np.argpartition(-scores[hit], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(str(self.uids[i]), float(scores[i])) for i in top]
+
+
+def global_idf(indexes: List[LexicalIndex], query: str) -> Dict[str, float]:
+    """
+    IDF of each term of `query` over the union of `indexes` (e.g. the shards
+    of one index), so that their search() scores compare.
+    """
+    n = sum(len(index) for index in indexes)
+    return {
+        term: bm25_idf(n, sum(index.df(term) for index in indexes)) for term in set(tokenize(query))
+    }
+
+
+def rrf_merge(rankings: List[List[str]], k: int, c: float = 60.0) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion of ranked id lists; top-`k` (id, fused score)."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, uid in enumerate(ranking):
+            fused[uid] = fused.get(uid, 0.0) + 1.0 / (c + rank + 1)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:k]
@@ -1,16 +1,179 @@
 from __future__ import annotations
 
-from typing import Dict, List
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+import httpx
 import requests
 import streamlit as st
-from groq import Groq
+from groq import AsyncGroq, Groq
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from .context import PackedContext, context_budget, pack_context
+from .hedge import HEDGE_ENABLED, HedgedTokens, Opener
+from .tracing import Stage, observe, stage, start
 
-def _build_prompt(question: str, contexts: List[Dict]) -> str:
-    ctx = "\n\n".join(
-        [f"[Source: {c['source']} | chunk {c['chunk_id']}]\n{c['text']}" for c in contexts]
+CONNECT_TIMEOUT_S = 5.0
+READ_TIMEOUT_S = 120.0
+MAX_RETRIES = 3
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 8.0
+POOL_MAXSIZE = 32
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Hedged legs do not retry: the other backend is the fallback, and a refused
+# connection must reach HedgedTokens at once to start it.
+HEDGE_RETRIES = 0
+
+
+def _secret(name: str) -> str:
+    # Streamlit secrets first, then the environment (CLI / Airflow / no secrets.toml).
+    try:
+        value = st.secrets.get(name)
+    except Exception:
+        value = None
+    return value or os.getenv(name) or ""
+
+
+def _backoff_s(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2**attempt)))
+
+
+# --- Shared sync clients -----------------------------------------------------
+
+_clients_lock = threading.Lock()
+_groq_clients: Dict[tuple, Groq] = {}
+_ollama_sessions: Dict[int, requests.Session] = {}
+
+
+def _groq_api_key() -> str:
+    api_key = _secret("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("Missing GROQ_API_KEY in Streamlit secrets.")
+    return api_key
+
+
+def _groq_client(max_retries: int = MAX_RETRIES) -> Groq:
+    """
+    One Groq client (and keep-alive pool) per API key, shared by all
+    sessions; clients with other `max_retries` share its pool.
+    """
+    key = (_groq_api_key(), _secret("GROQ_BASE_URL") or None)
+    with _clients_lock:
+        client = _groq_clients.get(key)
+        if client is None:
+            client = Groq(
+                api_key=key[0],
+                base_url=key[1],
+                timeout=httpx.Timeout(READ_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+                max_retries=MAX_RETRIES,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE
+                    ),
+                ),
+            )
+            _groq_clients[key] = client
+        if max_retries != MAX_RETRIES:
+            variant = _groq_clients.get(key + (max_retries,))
+            if variant is None:
+                variant = client.with_options(max_retries=max_retries)
+                _groq_clients[key + (max_retries,)] = variant
+            client = variant
+        return client
+
+
+def _http_retry(retries: int = MAX_RETRIES) -> Retry:
+    kwargs = dict(
+        total=retries,
+        connect=retries,
+        read=0,  # a read timeout mid-generation is not retried
+        status=retries,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "POST"}),
+        backoff_factor=BACKOFF_BASE_S,
+        backoff_max=BACKOFF_MAX_S,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    try:
+        return Retry(backoff_jitter=BACKOFF_BASE_S, **kwargs)
+    except TypeError:  # urllib3 < 2 has no jitter / backoff_max
+        kwargs.pop("backoff_max")
+        return Retry(**kwargs)
+
+
+def _ollama_http(retries: int = MAX_RETRIES) -> requests.Session:
+    """Process-wide keep-alive session for Ollama with `retries` on transient errors."""
+    with _clients_lock:
+        session = _ollama_sessions.get(retries)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=_http_retry(retries)
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _ollama_sessions[retries] = session
+        return session
+
+
+# --- Per-event-loop async clients ------------------------------------------------
+# httpx async clients are bound to the loop they were first used on.
+
+_async_groq: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, AsyncGroq]]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_http: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _async_groq_client() -> AsyncGroq:
+    key = (_groq_api_key(), _secret("GROQ_BASE_URL") or None)
+    clients = _async_groq.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(key)
+    if client is None:
+        client = AsyncGroq(
+            api_key=key[0],
+            base_url=key[1],
+            timeout=httpx.Timeout(READ_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+            max_retries=MAX_RETRIES,
+        )
+        clients[key] = client
+    return client
+
+
+def _async_ollama_http() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_http.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+            limits=httpx.Limits(
+                max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE
+            ),
+        )
+        _async_http[loop] = client
+    return client
+
+
+def _pack(contexts: List[Dict], model: str, context_tokens: Optional[int]) -> PackedContext:
+    return pack_context(
+        contexts, context_tokens if context_tokens is not None else context_budget(model)
     )
+
+
+def _build_prompt(question: str, packed: PackedContext) -> str:
+    ctx = packed.text
     return f"""You are a helpful assistant. Answer using ONLY the provided context.
 Rules:
 - If the answer is not in the context, say you don't know and ask for more documents.
@@ -25,12 +188,18 @@ Context:
 """
 
 
+def _prompt(
+    question: str, contexts: List[Dict], model: str, context_tokens: Optional[int]
+) -> Tuple[PackedContext, str]:
+    with stage("prompt_build", chunks=len(contexts)) as st:
+        packed = _pack(contexts, model, context_tokens)
+        prompt = _build_prompt(question, packed)
+        st.set(tokens=packed.tokens_out, tokens_saved=packed.tokens_saved)
+    return packed, prompt
+
+
 def _groq_chat(model: str, prompt: str) -> str:
-    api_key = st.secrets.get("GROQ_API_KEY") or ""
-    if not api_key:
-        raise RuntimeError("Missing GROQ_API_KEY in Streamlit secrets.")
-    client = Groq(api_key=api_key)
-    resp = client.chat.completions.create(
+    resp = _groq_client().chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.2,
@@ -38,18 +207,202 @@ def _groq_chat(model: str, prompt: str) -> str:
     return resp.choices[0].message.content.strip()
 
 
+class _StreamAbort:
+    """close() for a Groq stream that also interrupts a read blocked in another thread."""
+
+    def __init__(self, stream: Any) -> None:
+        self._stream = stream
+
+    def close(self) -> None:
+        network = self._stream.response.extensions.get("network_stream")
+        sock = network.get_extra_info("socket") if network is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._stream.close()
+
+
+def _groq_chat_stream(
+    model: str,
+    prompt: str,
+    on_open: Optional[Callable[[Any], None]] = None,
+    retries: int = MAX_RETRIES,
+) -> Iterator[str]:
+    stream = _groq_client(retries).chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+        stream=True,
+    )
+    if on_open is not None:
+        on_open(_StreamAbort(stream))
+    with stream:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
 def _ollama_generate(base_url: str, model: str, prompt: str) -> str:
     url = base_url.rstrip("/") + "/api/generate"
-    r = requests.post(
+    r = _ollama_http().post(
         url,
         json={"model": model, "prompt": prompt, "stream": False, "options": {"temperature": 0.2}},
-        timeout=120,
+        timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S),
     )
     if r.status_code != 200:
         raise RuntimeError(f"Ollama error {r.status_code}: {r.text[:200]}")
     return (r.json().get("response") or "").strip()
 
 
+def _ollama_generate_stream(
+    base_url: str,
+    model: str,
+    prompt: str,
+    on_open: Optional[Callable[[Any], None]] = None,
+    retries: int = MAX_RETRIES,
+) -> Iterator[str]:
+    url = base_url.rstrip("/") + "/api/generate"
+    with _ollama_http(retries).post(
+        url,
+        json={"model": model, "prompt": prompt, "stream": True, "options": {"temperature": 0.2}},
+        timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S),
+        stream=True,
+    ) as r:
+        if on_open is not None:
+            on_open(r)
+        if r.status_code != 200:
+            raise RuntimeError(f"Ollama error {r.status_code}: {r.text[:200]}")
+        # Ollama streams one JSON object per line (NDJSON).
+        for line in r.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get("error"):
+                raise RuntimeError(f"Ollama error: {data['error']}")
+            token = data.get("response")
+            if token:
+                yield token
+            if data.get("done"):
+                break
+
+
+class AnswerStream:
+    """
+    Iterator over answer tokens that times the generation.
+
+    `ttft_s` is the time to the first non-empty token and `total_s` the time
+    until the stream is exhausted, both measured from creation. `context`
+    is the packed prompt context (see context.pack_context) and `backend`
+    the backend that answers (with hedging, set once one has won).
+    """
+
+    def __init__(
+        self,
+        tokens: Iterator[str],
+        context: Optional[PackedContext] = None,
+        span: Optional[Stage] = None,
+        backend: Optional[str] = None,
+    ) -> None:
+        self._tokens = tokens
+        self.context = context
+        self.backend = backend
+        self._span = span
+        self._t0 = time.perf_counter()
+        self._parts: List[str] = []
+        self.ttft_s: Optional[float] = None
+        self.total_s: Optional[float] = None
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for token in self._tokens:
+                if self.ttft_s is None:
+                    self.ttft_s = time.perf_counter() - self._t0
+                    observe("llm_ttft", self.ttft_s)
+                    if self._span is not None:
+                        self._span.event("first_token")
+                self._parts.append(token)
+                yield token
+            self.total_s = time.perf_counter() - self._t0
+        finally:
+            if self._span is not None:
+                self._span.end(ttft_s=self.ttft_s, chars=sum(map(len, self._parts)))
+                self._span = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts).strip()
+
+
+def _hedged(
+    backend: str,
+    groq_model: str,
+    ollama_base_url: str,
+    ollama_model: str,
+    prompt: str,
+    on_winner: Optional[Callable[[HedgedTokens], None]] = None,
+) -> HedgedTokens:
+    openers: Dict[str, Opener] = {
+        "groq": lambda on_open: _groq_chat_stream(groq_model, prompt, on_open, HEDGE_RETRIES),
+        "ollama": lambda on_open: _ollama_generate_stream(
+            ollama_base_url, ollama_model, prompt, on_open, HEDGE_RETRIES
+        ),
+    }
+    other = "ollama" if backend == "groq" else "groq"
+    return HedgedTokens((backend, openers[backend]), (other, openers[other]), on_winner)
+
+
+def _hedge_budget(groq_model: str, ollama_model: str, context_tokens: Optional[int]) -> int:
+    # A hedged prompt may go to either model: pack it for the smaller window.
+    if context_tokens is not None:
+        return context_tokens
+    return min(context_budget(groq_model), context_budget(ollama_model))
+
+
+def stream_answer(
+    backend: str,
+    question: str,
+    contexts: List[Dict],
+    groq_model: str,
+    ollama_base_url: str,
+    ollama_model: str,
+    context_tokens: Optional[int] = None,
+    hedge: Optional[bool] = None,
+) -> AnswerStream:
+    """
+    Stream the answer from `backend`. With `hedge` (default: MRC_HEDGE),
+    the other backend is raced against it when it is slow or failing (see
+    hedge.HedgedTokens).
+    """
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+    model = groq_model if backend == "groq" else ollama_model
+    if hedge:
+        context_tokens = _hedge_budget(groq_model, ollama_model, context_tokens)
+    packed, prompt = _prompt(question, contexts, model, context_tokens)
+    span = start("llm_generate", backend=backend, model=model, stream=True, hedge=hedge)
+    if hedge:
+
+        def on_winner(h: HedgedTokens) -> None:
+            answer.backend = h.backend
+            span.set(winner=h.backend, hedged=h.hedged)
+
+        answer = AnswerStream(
+            _hedged(backend, groq_model, ollama_base_url, ollama_model, prompt, on_winner),
+            context=packed,
+            span=span,
+        )
+        return answer
+    if backend == "groq":
+        tokens = _groq_chat_stream(groq_model, prompt)
+    else:
+        tokens = _ollama_generate_stream(ollama_base_url, ollama_model, prompt)
+    return AnswerStream(tokens, context=packed, span=span, backend=backend)
+
+
 def generate_answer(
     backend: str,
     question: str,
@@ -57,8 +410,80 @@ def generate_answer(
     groq_model: str,
     ollama_base_url: str,
     ollama_model: str,
+    context_tokens: Optional[int] = None,
+    context_stats: Optional[Dict] = None,
+    hedge: Optional[bool] = None,
 ) -> str:
-    prompt = _build_prompt(question, contexts)
-    if backend == "groq":
-        return _groq_chat(groq_model, prompt)
-    return _ollama_generate(ollama_base_url, ollama_model, prompt)
+    """
+    Answer `question` from `contexts`, packed into the model's context
+    budget (`context_tokens` overrides it). Packing stats (tokens in/out,
+    tokens saved, ...) are written into `context_stats` if given. With
+    `hedge` (default: MRC_HEDGE), the answer is streamed from whichever
+    backend responds first (see stream_answer).
+    """
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+    model = groq_model if backend == "groq" else ollama_model
+    if hedge:
+        context_tokens = _hedge_budget(groq_model, ollama_model, context_tokens)
+    packed, prompt = _prompt(question, contexts, model, context_tokens)
+    if context_stats is not None:
+        context_stats.update(packed.stats())
+    with stage("llm_generate", backend=backend, model=model, stream=False, hedge=hedge) as span:
+        if hedge:
+            tokens = _hedged(backend, groq_model, ollama_base_url, ollama_model, prompt)
+            answer = "".join(tokens).strip()
+            span.set(winner=tokens.backend, hedged=tokens.hedged)
+            return answer
+        if backend == "groq":
+            return _groq_chat(groq_model, prompt)
+        return _ollama_generate(ollama_base_url, ollama_model, prompt)
+
+
+async def _agroq_chat(model: str, prompt: str) -> str:
+    resp = await _async_groq_client().chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+    )
+    return resp.choices[0].message.content.strip()
+
+
+async def _aollama_generate(base_url: str, model: str, prompt: str) -> str:
+    url = base_url.rstrip("/") + "/api/generate"
+    payload = {"model": model, "prompt": prompt, "stream": False, "options": {"temperature": 0.2}}
+    client = _async_ollama_http()
+    for attempt in range(MAX_RETRIES + 1):
+        last = attempt == MAX_RETRIES
+        try:
+            r = await client.post(url, json=payload)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if last:
+                raise
+        else:
+            if r.status_code not in RETRY_STATUSES or last:
+                break
+        await asyncio.sleep(_backoff_s(attempt))
+    if r.status_code != 200:
+        raise RuntimeError(f"Ollama error {r.status_code}: {r.text[:200]}")
+    return (r.json().get("response") or "").strip()
+
+
+async def agenerate_answer(
+    backend: str,
+    question: str,
+    contexts: List[Dict],
+    groq_model: str,
+    ollama_base_url: str,
+    ollama_model: str,
+    context_tokens: Optional[int] = None,
+    context_stats: Optional[Dict] = None,
+) -> str:
+    """Async generate_answer, sharing per-event-loop pooled clients."""
+    model = groq_model if backend == "groq" else ollama_model
+    packed, prompt = _prompt(question, contexts, model, context_tokens)
+    if context_stats is not None:
+        context_stats.update(packed.stats())
+    with stage("llm_generate", backend=backend, model=model, stream=False):
+        if backend == "groq":
+            return await _agroq_chat(groq_model, prompt)
+        return await _aollama_generate(ollama_base_url, ollama_model, prompt)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+
+@dataclass
+class FileEntry:
+    hash: str
+    chunks: List[str]
+
+
+@dataclass
+class Manifest:
+    embedding_model: str = ""
+    backend: str = ""
+    # lang.DETECTOR_VERSION the chunks' languages were detected with.
+    lang_version: int = 0
+    # Embedding runtime the vectors were computed with (torch, onnx, ...).
+    embed_runtime: str = "torch"
+    # Shared by the shard versions one rebuild/update call produced.
+    build_id: str = ""
+    files: Dict[str, FileEntry] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        if not path.exists():
+            return cls()
+        try:
+            raw = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return cls()
+        return cls(
+            embedding_model=raw.get("embedding_model", ""),
+            backend=raw.get("backend", ""),
+            lang_version=int(raw.get("lang_version", 0)),
+            embed_runtime=raw.get("embed_runtime", "torch"),
+            build_id=raw.get("build_id", ""),
+            files={
+                src: FileEntry(hash=e["hash"], chunks=list(e["chunks"]))
+                for src, e in raw.get("files", {}).items()
+            },
+        )
+
+    def save(self, path: Path) -> None:
+        raw = {
+            "embedding_model": self.embedding_model,
+            "backend": self.backend,
+            "lang_version": self.lang_version,
+            "embed_runtime": self.embed_runtime,
+            "build_id": self.build_id,
+            "files": {src: vars(e) for src, e in sorted(self.files.items())},
+        }
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(raw, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+
+def file_hash(chunk_uids: List[str]) -> str:
+    """Hash of a file's ordered chunk ids (covers text and chunking params)."""
+    return hashlib.sha256("\n".join(chunk_uids).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IndexDiff:
+    added_files: List[str] = field(default_factory=list)
+    changed_files: List[str] = field(default_factory=list)
+    removed_files: List[str] = field(default_factory=list)
+    unchanged_files: List[str] = field(default_factory=list)
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    chunks_unchanged: int = 0
+    full_rebuild: bool = False
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added_files or self.changed_files or self.removed_files)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.added_files)} added, {len(self.changed_files)} changed, "
+            f"{len(self.removed_files)} removed, {len(self.unchanged_files)} unchanged files; "
+            f"+{self.chunks_added}/-{self.chunks_removed} chunks "
+            f"({self.chunks_unchanged} reused)"
+        )
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import queue
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .dedup import DEFAULT_THRESHOLD, DedupStats, dedup_chunks
+from .ingest import iter_file_segments, iter_text_chunks, list_corpus_files
+from .manifest import IndexDiff
+from .store import (
+    EMBED_BATCH_SIZE,
+    WRITE_BATCH_SIZE,
+    ProgressFn,
+    rebuild_store,
+    update_store,
+)
+from .textcache import get_text_cache
+from .tracing import timed_iter
+
+
+@dataclass
+class PipelineStats:
+    files: int = 0
+    chunks: int = 0
+    # Near-duplicate chunks stored as aliases instead of being embedded, and
+    # the embedding time that saved at the measured embedding rate.
+    duplicates: int = 0
+    embed_s_saved: float = 0.0
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    # Names of the failed files, for update_store(keep=...).
+    failed_sources: Set[str] = field(default_factory=set)
+
+
+def iter_corpus_chunks(
+    folder: Path,
+    chunk_size: int = 900,
+    overlap: int = 150,
+    stats: Optional[PipelineStats] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parse and chunk `folder` lazily, one file (and PDF page) at a time.
+
+    Chunks of a file are yielded contiguously, in sorted file order, once
+    the whole file has parsed: a file's chunks are buffered, so memory
+    follows the largest file. A file that fails to parse is recorded in
+    `stats.failed` and yields no chunks, not even those of the pages
+    before the error.
+    """
+    stats = stats if stats is not None else PipelineStats()
+    if not folder.exists():
+        return
+    for path in list_corpus_files(folder):
+        try:
+            file_chunks = iter_text_chunks(path.name, iter_file_segments(path), chunk_size, overlap)
+            buffered = list(timed_iter("parse_chunk", file_chunks, source=path.name))
+        except Exception as e:
+            stats.failed.append((path.name, f"{type(e).__name__}: {e}"))
+            stats.failed_sources.add(path.name)
+            continue
+        stats.files += 1
+        stats.chunks += len(buffered)
+        yield from buffered
+    cache = get_text_cache()
+    if cache is not None:
+        cache.flush()
+
+
+_DONE = object()
+
+
+def prefetch(items: Iterable[Any], maxsize: int) -> Iterator[Any]:
+    """
+    Run `items` in a background thread, at most `maxsize` items ahead.
+
+    The bounded queue is the backpressure: parsing blocks while embedding
+    catches up. Exceptions from the producer are re-raised in the consumer.
+    """
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def _put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        try:
+            for item in items:
+                if not _put(item):
+                    return
+        except BaseException as e:
+            _put(e)
+            return
+        _put(_DONE)
+
+    worker = threading.Thread(target=_produce, name="mrc-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        worker.join(timeout=1.0)
+
+
+def index_corpus(
+    folder: Path,
+    embedding_model: str,
+    chunk_size: int = 900,
+    overlap: int = 150,
+    incremental: bool = True,
+    batch_size: int = EMBED_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    progress: Optional[ProgressFn] = None,
+    backend: Optional[str] = None,
+    dedup: bool = True,
+    dedup_threshold: float = DEFAULT_THRESHOLD,
+    shard: Optional[str] = None,
+) -> Tuple[IndexDiff, PipelineStats]:
+    """
+    Stream `folder` through parse -> chunk -> dedup -> embed -> store.
+
+    Parsing and chunking run one window ahead of embedding, so peak memory
+    follows write_batch_size rather than the corpus size. With `dedup`,
+    near-duplicate chunks are kept as aliases of the first copy rather
+    than embedded. With `shard`, the folder is indexed into that shard
+    only (see store.SHARDS), e.g. one team's corpus. Without it, a
+    sharded index first spills the chunks to one temporary file per shard
+    under the index root, so embedding starts once the whole folder is
+    chunked and that much free disk space is needed.
+
+    In an incremental sync, files that fail to parse keep the chunks they
+    already have in the index; a full rebuild drops them.
+    """
+    stats = PipelineStats()
+    chunks: Iterable[Dict[str, Any]] = iter_corpus_chunks(folder, chunk_size, overlap, stats)
+    dedup_stats = DedupStats()
+    if dedup:
+        chunks = dedup_chunks(chunks, dedup_threshold, dedup_stats)
+    chunks = prefetch(chunks, maxsize=write_batch_size)
+
+    rate = [0.0]
+    report = progress
+
+    def _progress(done: int, total: Optional[int], chunks_per_s: float) -> None:
+        rate[0] = chunks_per_s
+        if report is not None:
+            report(done, total, chunks_per_s)
+
+    progress = _progress
+    if incremental:
+        diff = update_store(
+            chunks,
+            embedding_model,
+            batch_size,
+            write_batch_size,
+            progress,
+            backend,
+            shard,
+            keep=stats.failed_sources,
+        )
+    else:
+        count = rebuild_store(
+            chunks, embedding_model, batch_size, write_batch_size, progress, backend, shard
+        )
+        diff = IndexDiff(chunks_added=count, full_rebuild=True)
+    stats.duplicates = dedup_stats.duplicates
+    stats.embed_s_saved = dedup_stats.embed_s_saved(rate[0])
+    return diff, stats
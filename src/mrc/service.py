@@ -0,0 +1,414 @@
+from __future__ import annotations
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as BatchTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+from .embeddings import get_model, warmup
+from .hedge import health_stats
+from .llm import generate_answer, stream_answer
+from .store import (
+    EMBED_BATCH_SIZE,
+    LANG_MODES,
+    RETRIEVAL_MODES,
+    index_version,
+    retrieve_many,
+)
+from .tracing import stage
+from .vectorstore import BACKENDS
+
+# Headless retrieval / answer service: one process-wide embedding model and
+# store shared by all clients, with concurrent queries micro-batched.
+#
+#   GET  /healthz    process is up
+#   GET  /readyz     model loaded (503 until then); live index versions
+#   POST /embed      {"text"} -> {"embedding"}
+#   POST /retrieve   {"query", "top_k", "mode", "vector_backend", "embedding"?,
+#                     "lang_mode"?, "lang"?}
+#   POST /answer     {"question", LLM settings, "contexts"?, "stream"?}
+#
+# Run with: python -m src.mrc.service --port 8765
+
+DEFAULT_PORT = 8765
+MAX_BATCH = 32
+MAX_WAIT_MS = 5.0
+# How long a request waits for its batch before failing with 503.
+REQUEST_TIMEOUT_S = 30.0
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into batches for a single worker thread.
+
+    The worker takes the first waiting request, then keeps collecting for
+    up to `max_wait_s` or until `max_batch` requests are in hand. Requests
+    are grouped by key (requests with different settings cannot share a
+    call) and each group is passed to `handler(key, items)`, which returns
+    one result per item. If the handler raises for a group, its items are
+    retried one by one, so a bad request only fails itself. Running the
+    batches on one thread also keeps concurrent encodes from contending
+    for the CPU.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[tuple, List[Any]], List[Any]],
+        max_batch: int = MAX_BATCH,
+        max_wait_s: float = MAX_WAIT_MS / 1000,
+    ) -> None:
+        self.handler = handler
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max_wait_s
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue[Optional[Tuple[tuple, Any, Future, float]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="mrc-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key: tuple, item: Any) -> Future:
+        """Queue `item`; the future resolves to (result, info dict)."""
+        fut: Future = Future()
+        self._queue.put((key, item, fut, time.perf_counter()))
+        return fut
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first) -> List[Tuple[tuple, Any, Future, float]]:
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                nxt = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                self._queue.put(None)
+                break
+            batch.append(nxt)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            self.batches += 1
+            self.items += len(batch)
+            groups: Dict[tuple, List[Tuple[Any, Future, float]]] = {}
+            for key, item, fut, t in batch:
+                groups.setdefault(key, []).append((item, fut, t))
+            for key, group in groups.items():
+                self._handle(key, group)
+
+    def _handle(self, key: tuple, group: List[Tuple[Any, Future, float]]) -> None:
+        start = time.perf_counter()
+        try:
+            results = self.handler(key, [item for item, _, _ in group])
+        except Exception as e:
+            if len(group) == 1:
+                group[0][1].set_exception(e)
+                return
+            for one in group:
+                self._handle(key, [one])
+            return
+        took = time.perf_counter() - start
+        for (_, fut, t), result in zip(group, results):
+            info = {"queue_s": start - t, "batch_s": took, "batch_size": len(group)}
+            fut.set_result((result, info))
+
+
+class RetrievalService:
+    """Shared model and stores behind the HTTP handlers."""
+
+    def __init__(
+        self,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        max_batch: int = MAX_BATCH,
+        max_wait_s: float = MAX_WAIT_MS / 1000,
+    ) -> None:
+        self.embedding_model = embedding_model
+        self.ready = False
+        self.error: Optional[str] = None
+        self.runtime: Optional[str] = None
+        self.dim: Optional[int] = None
+        self.batcher = MicroBatcher(self._handle, max_batch, max_wait_s)
+
+    def load(self) -> None:
+        """Load and warm the embedding model; the service is ready afterwards."""
+        try:
+            self.runtime = warmup(self.embedding_model).runtime
+            self.dim = get_model(self.embedding_model).get_sentence_embedding_dimension()
+            self.ready = True
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    def _handle(self, key: tuple, items: List[Any]) -> List[Any]:
+        if key[0] == "embed":
+            with stage("query_embed", queries=len(items)):
+                embs = get_model(self.embedding_model).encode(
+                    items, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True
+                )
+            return list(embs)
+        _, backend, mode, top_k, lang_mode, lang = key
+        timings: Dict[str, float] = {}
+        results = retrieve_many(
+            [q for q, _ in items],
+            embedding_model=self.embedding_model,
+            top_k=top_k,
+            backend=backend,
+            mode=mode,
+            timings=timings,
+            query_embeddings=[e for _, e in items],
+            lang_mode=lang_mode,
+            lang=lang,
+        )
+        return [(r, timings) for r in results]
+
+    def _wait(self, key: tuple, item: Any):
+        return self.batcher.submit(key, item).result(timeout=REQUEST_TIMEOUT_S)
+
+    def embed(self, text: str) -> Tuple[np.ndarray, Dict[str, Any]]:
+        return self._wait(("embed",), text)
+
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 6,
+        mode: str = "dense",
+        backend: Optional[str] = None,
+        embedding: Optional[List[float]] = None,
+        lang_mode: str = "off",
+        lang: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if lang_mode not in LANG_MODES:
+            raise ValueError(f"Unknown language mode: {lang_mode}")
+        if backend is not None and backend not in BACKENDS:
+            raise ValueError(f"Unknown vector backend: {backend}")
+        emb = None if embedding is None else np.asarray(embedding, dtype=np.float32)
+        # Checked here: a bad embedding would fail the whole batch's search.
+        if emb is not None and (emb.ndim != 1 or (self.dim and len(emb) != self.dim)):
+            raise ValueError(
+                f"embedding must be a list of {self.dim} numbers, got shape {emb.shape}"
+            )
+        (contexts, timings), info = self._wait(
+            ("retrieve", backend, mode, int(top_k), lang_mode, lang), (query, emb)
+        )
+        return contexts, {**timings, **info}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "embedding_model": self.embedding_model,
+            "embedding_runtime": self.runtime,
+            "index_versions": {b: index_version(b) for b in BACKENDS},
+            "batches": self.batcher.batches,
+            "batched_requests": self.batcher.items,
+            "llm_backends": health_stats(),
+        }
+
+
+def _llm_args(req: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "backend": req.get("backend", "groq"),
+        "groq_model": req.get("groq_model", "openai/gpt-oss-20b"),
+        "ollama_base_url": req.get("ollama_base_url", "http://localhost:11434"),
+        "ollama_model": req.get("ollama_model", "llama3.1"),
+        "context_tokens": req.get("context_tokens"),
+        "hedge": req.get("hedge"),
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, *args: Any) -> None:  # quiet
+        pass
+
+    def _json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ndjson(self, lines: Iterator[Dict[str, Any]]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in lines:
+            part = json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self) -> None:
+        svc = self.server.service
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self._json(200, {"status": "ok"})
+        elif path == "/readyz":
+            status = svc.status()
+            self._json(200 if status["ready"] else 503, status)
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        svc = self.server.service
+        path = urlparse(self.path).path
+        handlers = {"/embed": self._embed, "/retrieve": self._retrieve, "/answer": self._answer}
+        handler = handlers.get(path)
+        if handler is None:
+            self._json(404, {"error": "not found"})
+            return
+        if not svc.ready:
+            self._json(503, {"error": "not ready", "detail": svc.error})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._json(400, {"error": "invalid JSON"})
+            return
+        try:
+            with stage("request", path=path):
+                handler(svc, req)
+        except (KeyError, ValueError, TypeError) as e:
+            self._json(400, {"error": f"{type(e).__name__}: {e}"})
+        except BatchTimeout:
+            self._json(503, {"error": "request timed out waiting for its batch"})
+        except Exception as e:
+            self._json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _embed(self, svc: RetrievalService, req: Dict[str, Any]) -> None:
+        emb, info = svc.embed(req["text"])
+        self._json(200, {"embedding": np.asarray(emb).tolist(), "timings": info})
+
+    def _retrieve(self, svc: RetrievalService, req: Dict[str, Any]) -> None:
+        contexts, timings = svc.retrieve(
+            req["query"],
+            top_k=req.get("top_k", 6),
+            mode=req.get("mode", "dense"),
+            backend=req.get("vector_backend"),
+            embedding=req.get("embedding"),
+            lang_mode=req.get("lang_mode", "off"),
+            lang=req.get("lang"),
+        )
+        self._json(200, {"contexts": contexts, "timings": timings})
+
+    def _answer(self, svc: RetrievalService, req: Dict[str, Any]) -> None:
+        question = req["question"]
+        contexts = req.get("contexts")
+        timings: Dict[str, Any] = {}
+        if contexts is None:
+            contexts, timings = svc.retrieve(
+                question,
+                top_k=req.get("top_k", 6),
+                mode=req.get("mode", "dense"),
+                backend=req.get("vector_backend"),
+                lang_mode=req.get("lang_mode", "off"),
+                lang=req.get("lang"),
+            )
+        llm = _llm_args(req)
+        if not req.get("stream"):
+            context_stats: Dict[str, Any] = {}
+            t0 = time.perf_counter()
+            answer = generate_answer(
+                question=question, contexts=contexts, context_stats=context_stats, **llm
+            )
+            timings["generate_s"] = time.perf_counter() - t0
+            self._json(
+                200,
+                {
+                    "answer": answer,
+                    "contexts": contexts,
+                    "context": context_stats,
+                    "timings": timings,
+                },
+            )
+            return
+        answer_stream = stream_answer(question=question, contexts=contexts, **llm)
+
+        def lines() -> Iterator[Dict[str, Any]]:
+            # Context first, so the client has its stats before any token.
+            yield {"contexts": contexts, "context": answer_stream.context.stats()}
+            try:
+                for token in answer_stream:
+                    yield {"token": token}
+            except Exception as e:
+                yield {"error": f"{type(e).__name__}: {e}"}
+                return
+            yield {
+                "done": True,
+                "backend": answer_stream.backend,
+                "timings": {
+                    **timings,
+                    "ttft_s": answer_stream.ttft_s,
+                    "generate_s": answer_stream.total_s,
+                },
+            }
+
+        self._ndjson(lines())
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    service: RetrievalService
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients dropping keep-alive or streaming connections are expected.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(service: RetrievalService, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+    server = _Server((host, port), _Handler)
+    server.service = service
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless retrieval / answer service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    service = RetrievalService(args.embedding_model, args.max_batch, args.max_wait_ms / 1000)
+    server = make_server(service, args.host, args.port)
+    # Serve /healthz right away; /readyz turns 200 once the model is loaded.
+    threading.Thread(target=service.load, name="mrc-warmup", daemon=True).start()
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.batcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,1551 @@
 from __future__ import annotations
 
+import contextvars
 import hashlib
 import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain, groupby, islice
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import (
+    Any,
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import numpy as np
+
+from .chunkstore import ChunkStore
+from .embcache import get_embedding_cache
+from .embeddings import EMBED_RUNTIME, get_model, loaded_runtime, model_runtime
+from .filelock import file_lock
+from .lang import DETECTOR_VERSION, UNKNOWN, detect_language
+from .lexical import LexicalIndex, build_lexical_index, global_idf, rrf_merge
+from .manifest import FileEntry, IndexDiff, Manifest, file_hash
+from .tracing import stage
+from .vectorstore import (
+    BACKENDS,
+    ChromaStore,
+    NumpyStore,
+    VectorStore,
+    forget_chroma_client,
+)
 
 STORAGE_DIR = Path("storage")
-META_PATH = STORAGE_DIR / "chunks.json"
+# One root per vector backend. <root>/CURRENT names the live version; each
+# version is a directory <root>/versions/<id>/ with vectors/, chunks.db and
+# manifest.json, built aside and promoted by rewriting CURRENT.
+INDEX_DIR = STORAGE_DIR / "index"
+# Written directly under STORAGE_DIR by older versions; removed on clear.
+LEGACY_PATHS = (
+    "chunks.json",
+    "chunks.db",
+    "chunks.db-wal",
+    "chunks.db-shm",
+    "manifest.json",
+    "index_version",
+    "numpy",
+)
+# Sharding: with MRC_SHARDS > 1, <root>/shards/<name>/ are independent
+# roots (CURRENT + versions/ each), built, promoted and rolled back on their
+# own. A chunk goes to the shard named by its "group" if it has one, else
+# to h<crc32(source) % SHARDS>, so a file's chunks stay together. Queries
+# fan out to the live shards in parallel and merge their top-k; a shard
+# that fails or takes longer than SHARD_TIMEOUT_S is left out.
+SHARDS = int(os.getenv("MRC_SHARDS", "1"))
+SHARD_TIMEOUT_S = float(os.getenv("MRC_SHARD_TIMEOUT_S", "5.0"))
+SHARD_WORKERS = int(os.getenv("MRC_SHARD_WORKERS", "8"))
+_SHARDS_DIR = "shards"
+# Survives clear_store on purpose: embeddings depend only on model + text.
+EMBED_CACHE_DIR = STORAGE_DIR / "embcache"
+
+# "chroma" or "numpy"; the NumPy backend stores float32, float16 or int8.
+VECTOR_BACKEND = os.getenv("MRC_VECTOR_BACKEND", "chroma")
+NUMPY_DTYPE = os.getenv("MRC_NUMPY_DTYPE", "float32")
+
+# Texts per model.encode call, and chunks per vector store write call.
+EMBED_BATCH_SIZE = 64
+WRITE_BATCH_SIZE = 512
+
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+# Candidates taken from each stage before rank fusion in hybrid mode.
+HYBRID_STAGE_K = 20
+RRF_K = 60.0
 
+# "off" searches every language; "filter" only searches chunks in the
+# question's language; "prefer" does too, but re-searches the whole index
+# when the partition gives fewer than top_k hits or a best dense score
+# under LANG_MIN_SCORE. Questions in an unknown language, or one with no
+# indexed chunks, always search everything.
+LANG_MODES = ("off", "filter", "prefer")
+LANG_MIN_SCORE = float(os.getenv("MRC_LANG_MIN_SCORE", "0.35"))
 
-def _ensure_dirs() -> None:
-    STORAGE_DIR.mkdir(exist_ok=True)
+# Complete versions kept on disk (the live one included) for rollback.
+KEEP_VERSIONS = 2
+# A version still marked as building after this long is an abandoned build.
+STALE_BUILD_S = 6 * 3600.0
+_BUILDING = "BUILDING"
+
+# progress(done, total, chunks_per_s); total is None when unknown, and the
+# rate counts embedded chunks only (near-duplicates are not embedded).
+ProgressFn = Callable[[int, Optional[int], float], None]
 
 
 def _fingerprint(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
 
 
-def get_store():
-    _ensure_dirs()
-    client = chromadb.PersistentClient(
-        path=str(STORAGE_DIR),
-        settings=Settings(anonymized_telemetry=False),
-    )
-    return client.get_or_create_collection(name="docs")
+def _backend(backend: Optional[str]) -> str:
+    backend = backend or VECTOR_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector backend: {backend} (expected one of {BACKENDS})")
+    return backend
+
+
+def _index_root(backend: str, root: Path = INDEX_DIR) -> Path:
+    return root / backend
+
+
+def _current(root: Path) -> Optional[str]:
+    try:
+        vid = (root / "CURRENT").read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    return vid if vid and (root / "versions" / vid).is_dir() else None
+
+
+def _new_id() -> str:
+    """Version / build id, sortable by creation time (rollback() and GC rely on it)."""
+    return datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+
+def _build_lock(backend: str):
+    """
+    Exclusive lock over builds, rollbacks and GC of `backend`'s index. The
+    app and the Airflow DAG share storage/: without it, two incremental
+    builds copy the same live version and the last one promoted drops the
+    other's changes.
+    """
+    return file_lock(_index_root(backend) / ".lock")
+
+
+def _promote(root: Path, vid: str) -> None:
+    # LIVE's mtime records when a version last served, for _gc.
+    (root / "versions" / vid / "LIVE").touch()
+    tmp = root / "CURRENT.tmp"
+    tmp.write_text(vid, encoding="utf-8")
+    tmp.replace(root / "CURRENT")
+
+
+def _open_store(backend: str, path: Path) -> VectorStore:
+    if backend == "numpy":
+        return NumpyStore(path / "vectors", dtype=NUMPY_DTYPE)
+    return ChromaStore(path / "vectors", collection="docs")
+
+
+# Open stores by (root, version id), and lexical indexes and read-only
+# chunk stores by version dir; versions are immutable once promoted.
+_stores: Dict[tuple, VectorStore] = {}
+_lexicals: Dict[str, Optional[LexicalIndex]] = {}
+_chunk_stores: Dict[str, ChunkStore] = {}
+_languages_of: Dict[str, Dict[str, int]] = {}
+_stores_lock = threading.Lock()
+
+
+def _live_at(backend: str, broot: Path):
+    """(version dir, store) of the live version under `broot`, or None."""
+    vid = _current(broot)
+    if vid is None:
+        return None
+    with _stores_lock:
+        store = _stores.get((str(broot), vid))
+        if store is None:
+            store = _open_store(backend, broot / "versions" / vid)
+            _stores[(str(broot), vid)] = store
+    return broot / "versions" / vid, store
+
+
+def _live(backend: Optional[str] = None, root: Path = INDEX_DIR, shard: Optional[str] = None):
+    """(version dir, store) of the live version, or None if nothing is built."""
+    backend = _backend(backend)
+    return _live_at(backend, _shard_root(backend, shard, root))
+
+
+def _shard_name(name: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "._-" else "_" for ch in name).strip("._") or "_"
+
+
+def shard_of(c: Dict[str, Any]) -> str:
+    """Shard a chunk is stored in (see SHARDS)."""
+    if c.get("group"):
+        return _shard_name(str(c["group"]))
+    return f"h{zlib.crc32(c['source'].encode('utf-8')) % max(SHARDS, 1):02d}"
+
+
+def _shard_root(backend: str, shard: Optional[str], root: Path = INDEX_DIR) -> Path:
+    broot = _index_root(backend, root)
+    return broot if shard is None else broot / _SHARDS_DIR / _shard_name(shard)
+
+
+def _shard_roots(backend: str, root: Path = INDEX_DIR) -> Dict[str, Path]:
+    """Shard roots on disk by name ({} when the index is not sharded)."""
+    shards = _index_root(backend, root) / _SHARDS_DIR
+    if not shards.is_dir():
+        return {}
+    return {p.name: p for p in sorted(shards.iterdir()) if p.is_dir()}
+
+
+def _sharded(backend: str) -> bool:
+    return SHARDS > 1 or bool(_shard_roots(backend))
+
+
+def _live_shards(backend: str) -> List[tuple]:
+    """(shard, version dir, store) of every live shard; shard is None if unsharded."""
+    roots: Dict[Optional[str], Path] = dict(_shard_roots(backend))
+    if not roots:
+        roots = {None: _index_root(backend)}
+    out = []
+    for name, broot in roots.items():
+        live = _live_at(backend, broot)
+        if live is not None:
+            out.append((name, *live))
+    return out
+
+
+def list_shards(backend: Optional[str] = None) -> Dict[str, str]:
+    """Live version id of each shard ({} when the index is not sharded)."""
+    return {name: _current(broot) or "0" for name, broot in _shard_roots(_backend(backend)).items()}
+
+
+def _lexical(path: Path) -> Optional[LexicalIndex]:
+    with _stores_lock:
+        if str(path) not in _lexicals:
+            _lexicals[str(path)] = LexicalIndex.open(path / "lexical")
+        return _lexicals[str(path)]
+
+
+def _chunk_store(path: Path) -> ChunkStore:
+    """Read-only chunk store of a version, opened once."""
+    with _stores_lock:
+        chunk_store = _chunk_stores.get(str(path))
+        if chunk_store is None:
+            chunk_store = ChunkStore(path / "chunks.db", readonly=True)
+            _chunk_stores[str(path)] = chunk_store
+        return chunk_store
+
+
+def _languages(path: Path) -> Dict[str, int]:
+    """Chunk count per language of a version ({} if built without languages)."""
+    with _stores_lock:
+        if str(path) not in _languages_of:
+            try:
+                langs = json.loads((path / "languages.json").read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                langs = {}
+            _languages_of[str(path)] = langs
+        return _languages_of[str(path)]
+
+
+def get_store(backend: Optional[str] = None, shard: Optional[str] = None) -> Optional[VectorStore]:
+    """Vector store of the live index version for `backend` (None before the first build)."""
+    live = _live(backend, shard=shard)
+    return None if live is None else live[1]
+
+
+def index_version(backend: Optional[str] = None) -> str:
+    """Id of the live index version (changes whenever the indexed content changes)."""
+    shards = list_shards(backend)
+    if shards:
+        return ",".join(f"{name}:{vid}" for name, vid in shards.items())
+    return _current(_index_root(_backend(backend))) or "0"
+
+
+def get_chunk_store(backend: Optional[str] = None, shard: Optional[str] = None) -> ChunkStore:
+    broot = _shard_root(_backend(backend), shard)
+    vid = _current(broot)
+    if vid is None:
+        raise FileNotFoundError("No index has been built yet.")
+    return ChunkStore(broot / "versions" / vid / "chunks.db")
+
+
+def _is_building(path: Path) -> bool:
+    return (path / _BUILDING).exists()
+
+
+def _drop_version(broot: Path, vid: str) -> None:
+    path = broot / "versions" / vid
+    with _stores_lock:
+        _stores.pop((str(broot), vid), None)
+        _lexicals.pop(str(path), None)
+        _languages_of.pop(str(path), None)
+        chunk_store = _chunk_stores.pop(str(path), None)
+    if chunk_store is not None:
+        chunk_store.close()
+    forget_chroma_client(path / "vectors")
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _last_live(path: Path) -> float:
+    try:
+        return (path / "LIVE").stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def _gc(broot: Path, keep: int) -> List[str]:
+    versions = broot / "versions"
+    if not versions.is_dir():
+        return []
+    current = _current(broot)
+    now = time.time()
+    complete, removed = [], []
+    for path in sorted(versions.iterdir(), reverse=True):
+        if _is_building(path):
+            if now - (path / _BUILDING).stat().st_mtime > STALE_BUILD_S:
+                _drop_version(broot, path.name)
+                removed.append(path.name)
+        elif path.name != current:
+            complete.append(path)
+    # Keep the versions that served most recently: in-flight queries may
+    # still be reading the one that was live just before the current one.
+    complete.sort(key=lambda p: (_last_live(p), p.name), reverse=True)
+    for vid in [p.name for p in complete[max(keep - 1, 0) :]]:
+        _drop_version(broot, vid)
+        removed.append(vid)
+    return removed
+
+
+def _roots(backend: Optional[str], shard: Optional[str]) -> List[Path]:
+    """Index roots a version-management call applies to."""
+    backend = _backend(backend)
+    if shard is not None:
+        return [_shard_root(backend, shard)]
+    return list(_shard_roots(backend).values()) or [_index_root(backend)]
+
+
+def gc_versions(
+    backend: Optional[str] = None, keep: int = KEEP_VERSIONS, shard: Optional[str] = None
+) -> List[str]:
+    """
+    Delete old index versions, keeping the live one and the `keep - 1`
+    that were live most recently. Builds in progress are left alone
+    unless abandoned. Applies to every shard unless `shard` is given.
+    """
+    with _build_lock(_backend(backend)):
+        return [vid for broot in _roots(backend, shard) for vid in _gc(broot, keep)]
+
+
+def _list_versions(broot: Path) -> List[Dict[str, Any]]:
+    versions = broot / "versions"
+    if not versions.is_dir():
+        return []
+    current = _current(broot)
+    out = []
+    for path in sorted(versions.iterdir(), reverse=True):
+        manifest = Manifest.load(path / "manifest.json")
+        out.append(
+            {
+                "id": path.name,
+                "current": path.name == current,
+                "building": _is_building(path),
+                "embedding_model": manifest.embedding_model,
+                "embed_runtime": manifest.embed_runtime,
+                "build": manifest.build_id or path.name,
+                "files": len(manifest.files),
+                "chunks": sum(len(e.chunks) for e in manifest.files.values()),
+            }
+        )
+    return out
+
+
+def list_versions(
+    backend: Optional[str] = None, shard: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Index versions on disk, newest first (with their "shard" when sharded)."""
+    backend = _backend(backend)
+    if shard is not None or not _shard_roots(backend):
+        return _list_versions(_shard_root(backend, shard))
+    out = []
+    for name, broot in _shard_roots(backend).items():
+        out.extend({**v, "shard": name} for v in _list_versions(broot))
+    return sorted(out, key=lambda v: v["id"], reverse=True)
+
+
+def _previous(broot: Path) -> Optional[str]:
+    """Newest complete version older than the live one."""
+    current = _current(broot)
+    for v in _list_versions(broot):
+        if v["building"] or (current is not None and v["id"] >= current):
+            continue
+        return v["id"]
+    return None
+
+
+def _rollback(broot: Path) -> Optional[str]:
+    vid = _previous(broot)
+    if vid is not None:
+        _promote(broot, vid)
+    return vid
+
+
+def _live_build(broot: Path) -> Optional[str]:
+    """Build id of the live version under `broot` (its own id if untagged)."""
+    current = _current(broot)
+    if current is None:
+        return None
+    return Manifest.load(broot / "versions" / current / "manifest.json").build_id or current
+
+
+def rollback(backend: Optional[str] = None, shard: Optional[str] = None) -> Optional[str]:
+    """
+    Make the newest complete version older than the live one live again.
+
+    On a sharded index without `shard`, this undoes the last build: every
+    shard whose live version it produced goes back to its previous version
+    (a shard that build created is taken offline), and
+    "<shard>:<version>,..." is returned ("0" for a shard taken offline).
+    The first build of an index is never undone.
+    """
+    backend = _backend(backend)
+    with _build_lock(backend):
+        if shard is not None or not _shard_roots(backend):
+            return _rollback(_shard_root(backend, shard))
+        builds = {name: _live_build(broot) for name, broot in _shard_roots(backend).items()}
+        last = max((b for b in builds.values() if b is not None), default=None)
+        names = [name for name, b in builds.items() if b is not None and b == last]
+        previous = {name: _previous(_shard_root(backend, name)) is not None for name in names}
+        if not any(previous.values()):
+            return None
+        rolled = []
+        for name in names:
+            broot = _shard_root(backend, name)
+            if previous[name]:
+                rolled.append(f"{name}:{_rollback(broot)}")
+            else:
+                (broot / "CURRENT").unlink(missing_ok=True)
+                rolled.append(f"{name}:0")
+        return ",".join(rolled)
+
+
+def _clear_root(broot: Path) -> None:
+    (broot / "CURRENT").unlink(missing_ok=True)
+    versions = broot / "versions"
+    if versions.is_dir():
+        for path in versions.iterdir():
+            if not _is_building(path):
+                _drop_version(broot, path.name)
 
 
 def clear_store() -> None:
-    if STORAGE_DIR.exists():
-        client = chromadb.PersistentClient(
-            path=str(STORAGE_DIR),
-            settings=Settings(anonymized_telemetry=False),
+    for backend in BACKENDS:
+        with _build_lock(backend):
+            for broot in _shard_roots(backend).values():
+                _clear_root(broot)
+                versions = broot / "versions"
+                if not versions.is_dir() or not any(versions.iterdir()):
+                    shutil.rmtree(broot, ignore_errors=True)
+            _clear_root(_index_root(backend))
+    if (STORAGE_DIR / "chroma.sqlite3").exists():
+        ChromaStore.drop(STORAGE_DIR, collection="docs")
+        forget_chroma_client(STORAGE_DIR)
+    for name in LEGACY_PATHS:
+        path = STORAGE_DIR / name
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        elif path.exists():
+            path.unlink()
+
+
+class _Build:
+    """
+    A new index version, written next to the live one.
+
+    Readers keep using the CURRENT version until commit() has validated the
+    new one and atomically repointed CURRENT. Leaving the `with` block
+    without committing deletes the half-built directory. With `base`, the
+    build starts from a copy of that version (for incremental updates).
+    Callers hold _build_lock from reading `base` until commit(). Versions
+    that one call builds in several shards share a `build_id`.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        broot: Path,
+        base: Optional[str] = None,
+        build_id: Optional[str] = None,
+    ) -> None:
+        self.backend = backend
+        self.broot = broot
+        self.vid = _new_id()
+        self.build_id = build_id or self.vid
+        self.path = broot / "versions" / self.vid
+        self.path.mkdir(parents=True)
+        (self.path / _BUILDING).touch()
+        self.committed = False
+        if base is not None:
+            src = broot / "versions" / base
+            shutil.copytree(src / "vectors", self.path / "vectors")
+            with ChunkStore(src / "chunks.db") as chunk_store:
+                chunk_store.backup(self.path / "chunks.db")
+        self.store = _open_store(backend, self.path)
+        self.chunk_store = ChunkStore(self.path / "chunks.db")
+
+    def __enter__(self) -> "_Build":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if not self.committed:
+            self.abort()
+
+    def commit(self, manifest: Manifest) -> None:
+        self.store.flush()
+        expected = (
+            sum(len(e.chunks) for e in manifest.files.values()) - self.chunk_store.alias_count()
         )
+        vectors, chunks = self.store.count(), self.chunk_store.count()
+        if vectors != expected or chunks != expected:
+            raise RuntimeError(
+                f"Index version {self.vid} failed validation: expected {expected} chunks, "
+                f"got {vectors} vectors and {chunks} stored chunks"
+            )
+        with stage("lexical_build"):
+            build_lexical_index(self.chunk_store.iter_texts(), self.path / "lexical")
+        (self.path / "languages.json").write_text(
+            json.dumps(self.chunk_store.languages()), encoding="utf-8"
+        )
+        manifest.lang_version = DETECTOR_VERSION
+        manifest.embed_runtime = _cache_runtime(manifest.embedding_model)
+        manifest.build_id = self.build_id
+        manifest.save(self.path / "manifest.json")
+        self.chunk_store.close()
+        (self.path / _BUILDING).unlink()
+        with _stores_lock:
+            _stores[(str(self.broot), self.vid)] = self.store
+        _promote(self.broot, self.vid)
+        self.committed = True
+        _gc(self.broot, KEEP_VERSIONS)
+
+    def abort(self) -> None:
         try:
-            client.delete_collection(name="docs")
+            self.chunk_store.close()
         except Exception:
             pass
-    if META_PATH.exists():
-        META_PATH.unlink()
+        _drop_version(self.broot, self.vid)
+
+
+def chunk_uid(c: Dict[str, Any], fp: Optional[str] = None) -> str:
+    """
+    Stable chunk id: source, position and text fingerprint. A near-duplicate
+    (see dedup.py) also carries its representative's uid, so its file is
+    re-synced when the representative changes.
+    """
+    fp = fp or _fingerprint(c["text"])
+    uid = f"{c['source']}::{c['chunk_id']}::{fp[:12]}"
+    if c.get("duplicate_of"):
+        uid += f"={c['duplicate_of']}"
+    return uid
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _cache_runtime(embedding_model: str) -> str:
+    """
+    Runtime the model's embeddings come from: the one it runs on if loaded
+    (ONNX may have fallen back to torch), else the configured one. Nothing
+    is loaded, so fully cached builds never touch the model.
+    """
+    return loaded_runtime(embedding_model) or EMBED_RUNTIME
+
+
+def _embed_cache(embedding_model: str, runtime: str):
+    # ONNX / int8 embeddings differ slightly from PyTorch ones: cache apart.
+    if runtime != "torch":
+        embedding_model = f"{embedding_model}@{runtime}"
+    return get_embedding_cache(EMBED_CACHE_DIR, embedding_model)
+
+
+def _runtime_changed(manifest: Manifest, embedding_model: str) -> bool:
+    """Whether the index was embedded with another runtime than queries now use."""
+    # The model is only loaded when the configured runtime differs from the
+    # recorded one (it may have fallen back to torch, as it did then).
+    if manifest.embed_runtime == EMBED_RUNTIME:
+        return False
+    return manifest.embed_runtime != model_runtime(embedding_model)
+
+
+def _embed_texts(texts: List[str], fps: List[str], embedding_model: str, batch_size: int):
+    """Embeddings for `texts`, taken from the on-disk cache where possible."""
+    runtime = _cache_runtime(embedding_model)
+    cache = _embed_cache(embedding_model, runtime)
+    vectors, missing = cache.get_many(fps)
+    if not missing:
+        return vectors
+    # The model is needed now; if it fell back to another runtime than the
+    # configured one, its embeddings are cached under that runtime.
+    actual = model_runtime(embedding_model)
+    if actual != runtime:
+        cache = _embed_cache(embedding_model, actual)
+        vectors, missing = cache.get_many(fps)
+        if not missing:
+            return vectors
+    with stage("embed_batch", texts=len(missing), cached=len(texts) - len(missing)):
+        fresh = get_model(embedding_model).encode(
+            [texts[i] for i in missing],
+            batch_size=batch_size,
+            normalize_embeddings=True,
+        )
+    cache.put_many([fps[i] for i in missing], fresh)
+    if vectors is None:
+        return fresh
+    vectors[missing] = fresh
+    return vectors
+
 
+def _embed_and_add(
+    store: VectorStore,
+    chunks: Iterable[Dict[str, Any]],
+    embedding_model: str,
+    batch_size: int = EMBED_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    total: Optional[int] = None,
+    progress: Optional[ProgressFn] = None,
+    chunk_store: Optional[ChunkStore] = None,
+    on_window: Optional[Callable[[List[Dict[str, Any]], List[str]], None]] = None,
+) -> int:
+    """
+    Embed chunks window by window and write each window to the vector store.
 
-def rebuild_store(chunks: List[Dict[str, Any]], embedding_model: str) -> None:
-    clear_store()
-    col = get_store()
-    model = SentenceTransformer(embedding_model)
+    Only one window (write_batch_size chunks and their embeddings) is held
+    at a time. Inside a window, texts are sorted by length so each encode
+    batch pads to similar lengths, and only embedding-cache misses reach
+    the model. Chunks marked `duplicate_of` are not embedded; they are
+    stored as aliases of their representative. Returns the number of
+    chunks embedded.
+    """
+    done = embedded = 0
+    t0 = time.perf_counter()
+    try:
+        for window in _batched(chunks, write_batch_size):
+            fresh = [c for c in window if not c.get("duplicate_of")]
+            dups = [c for c in window if c.get("duplicate_of")]
+            uids: List[str] = []
+            if fresh:
+                fresh.sort(key=lambda c: len(c["text"]))
+                fresh = [{**c, "lang": c.get("lang") or detect_language(c["text"])} for c in fresh]
+                texts = [c["text"] for c in fresh]
+                fps = [_fingerprint(t) for t in texts]
+                embeddings = _embed_texts(texts, fps, embedding_model, batch_size)
+                uids = [chunk_uid(c, fp) for c, fp in zip(fresh, fps)]
+                with stage("vector_add", chunks=len(uids)):
+                    store.upsert(
+                        uids,
+                        embeddings,
+                        [
+                            {
+                                "source": c["source"],
+                                "chunk_id": int(c["chunk_id"]),
+                                "lang": c["lang"],
+                            }
+                            for c in fresh
+                        ],
+                    )
+                if chunk_store is not None:
+                    chunk_store.upsert({**c, "uid": uid} for c, uid in zip(fresh, uids))
+            dup_uids = [chunk_uid(c) for c in dups]
+            if dups and chunk_store is not None:
+                chunk_store.upsert_aliases({**c, "uid": uid} for c, uid in zip(dups, dup_uids))
+            if on_window is not None:
+                on_window(fresh + dups, uids + dup_uids)
+            done += len(window)
+            embedded += len(fresh)
+            if progress is not None:
+                elapsed = time.perf_counter() - t0
+                progress(done, total, embedded / elapsed if elapsed > 0 else 0.0)
+    finally:
+        for runtime in {EMBED_RUNTIME, _cache_runtime(embedding_model)}:
+            _embed_cache(embedding_model, runtime).flush()
+    return embedded
 
-    ids, documents, metadatas, embeddings = [], [], [], []
-    for c in chunks:
-        text = c["text"]
-        cid = f"{c['source']}::{c['chunk_id']}::{_fingerprint(text)[:12]}"
-        ids.append(cid)
-        documents.append(text)
-        metadatas.append({"source": c["source"], "chunk_id": int(c["chunk_id"])})
-        embeddings.append(model.encode(text, normalize_embeddings=True).tolist())
 
-    col.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
-    META_PATH.write_text(json.dumps(chunks, ensure_ascii=False, indent=2), encoding="utf-8")
+def _manifest_entries(chunk_ids: Dict[str, List[tuple]]) -> Dict[str, FileEntry]:
+    files = {}
+    for source, pairs in chunk_ids.items():
+        uids = [uid for _, uid in sorted(pairs)]
+        files[source] = FileEntry(hash=file_hash(uids), chunks=uids)
+    return files
 
 
-def retrieve(query: str, embedding_model: str, top_k: int = 6):
-    col = get_store()
-    model = SentenceTransformer(embedding_model)
-    q = model.encode(query, normalize_embeddings=True).tolist()
+def _rebuild(
+    backend: str,
+    broot: Path,
+    chunks: Iterable[Dict[str, Any]],
+    embedding_model: str,
+    batch_size: int,
+    write_batch_size: int,
+    progress: Optional[ProgressFn],
+    build_id: Optional[str] = None,
+):
+    total = len(chunks) if hasattr(chunks, "__len__") else None
 
-    res = col.query(
-        query_embeddings=[q],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"],
+    chunk_ids: Dict[str, List[tuple]] = {}
+
+    def _on_window(window: List[Dict[str, Any]], uids: List[str]) -> None:
+        for c, uid in zip(window, uids):
+            chunk_ids.setdefault(c["source"], []).append((int(c["chunk_id"]), uid))
+
+    with _Build(backend, broot, build_id=build_id) as build:
+        count = _embed_and_add(
+            build.store,
+            chunks,
+            embedding_model,
+            batch_size=batch_size,
+            write_batch_size=write_batch_size,
+            total=total,
+            progress=progress,
+            chunk_store=build.chunk_store,
+            on_window=_on_window,
+        )
+        manifest = Manifest(
+            embedding_model=embedding_model, backend=backend, files=_manifest_entries(chunk_ids)
+        )
+        build.commit(manifest)
+    return count, manifest
+
+
+class _Part:
+    """One shard's share of a chunk stream, spilled to a JSONL file and read back lazily."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.count = 0
+        self._f = open(path, "w", encoding="utf-8")
+
+    def append(self, c: Dict[str, Any]) -> None:
+        self._f.write(json.dumps(c, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        self._f.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+@contextmanager
+def _split(chunks: Iterable[Dict[str, Any]], backend: str) -> Iterator[Dict[str, Any]]:
+    """
+    `chunks` grouped by shard, with an entry (maybe empty) for every shard on disk.
+
+    A list is grouped in memory. Any other iterable is streamed into one
+    temporary file per shard under the index root, so a corpus never has
+    to fit in memory; each part keeps the stream's order (and so its
+    sources contiguous) and is valid until the block exits.
+    """
+    names = list(_shard_roots(backend))
+    if isinstance(chunks, list):
+        lists: Dict[str, List[Dict[str, Any]]] = {name: [] for name in names}
+        for c in chunks:
+            lists.setdefault(shard_of(c), []).append(c)
+        yield lists
+        return
+    root = _index_root(backend)
+    root.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=".split-", dir=root) as tmp:
+        parts: Dict[str, _Part] = {}
+
+        def part(name: str) -> _Part:
+            if name not in parts:
+                parts[name] = _Part(Path(tmp) / f"{len(parts)}.jsonl")
+            return parts[name]
+
+        try:
+            for name in names:
+                part(name)
+            for c in chunks:
+                part(shard_of(c)).append(c)
+        finally:
+            for p in parts.values():
+                p.close()
+        yield parts
+
+
+def _offset_progress(
+    progress: Optional[ProgressFn], offset: int, total: int
+) -> Optional[ProgressFn]:
+    """Progress of one shard's build reported as part of the whole."""
+    if progress is None:
+        return None
+    return lambda done, _, rate: progress(offset + done, total, rate)
+
+
+def rebuild_store(
+    chunks: Iterable[Dict[str, Any]],
+    embedding_model: str,
+    batch_size: int = EMBED_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    progress: Optional[ProgressFn] = None,
+    backend: Optional[str] = None,
+    shard: Optional[str] = None,
+) -> int:
+    """
+    Build a fresh index version from `chunks` and make it live.
+
+    The live version keeps serving queries until the new one is complete;
+    if the build fails, the live version is left untouched. With `shard`,
+    only that shard is rebuilt (from `chunks`, whatever their group) and
+    the others keep serving. On a sharded index without `shard`, chunks
+    are split across shards (a stream is spilled to temporary files, see
+    _split) and every shard gets a new version, empty for shards no chunk
+    maps to; rollback() undoes them together.
+    """
+    backend = _backend(backend)
+    with _build_lock(backend):
+        if shard is None and _sharded(backend):
+            with _split(chunks, backend) as parts:
+                count, offset, total = 0, 0, sum(len(p) for p in parts.values())
+                build_id = _new_id()
+                for name, part in parts.items():
+                    count += _rebuild(
+                        backend,
+                        _shard_root(backend, name),
+                        part,
+                        embedding_model,
+                        batch_size,
+                        write_batch_size,
+                        _offset_progress(progress, offset, total),
+                        build_id,
+                    )[0]
+                    offset += len(part)
+            return count
+        count, _ = _rebuild(
+            backend,
+            _shard_root(backend, shard),
+            chunks,
+            embedding_model,
+            batch_size,
+            write_batch_size,
+            progress,
+        )
+        return count
+
+
+def _merge_diffs(diffs: List[IndexDiff]) -> IndexDiff:
+    out = IndexDiff()
+    for d in diffs:
+        out.added_files += d.added_files
+        out.changed_files += d.changed_files
+        out.removed_files += d.removed_files
+        out.unchanged_files += d.unchanged_files
+        out.chunks_added += d.chunks_added
+        out.chunks_removed += d.chunks_removed
+        out.chunks_unchanged += d.chunks_unchanged
+        out.full_rebuild = out.full_rebuild or d.full_rebuild
+    return out
+
+
+def update_store(
+    chunks: Iterable[Dict[str, Any]],
+    embedding_model: str,
+    batch_size: int = EMBED_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    progress: Optional[ProgressFn] = None,
+    backend: Optional[str] = None,
+    shard: Optional[str] = None,
+    keep: Container[str] = (),
+) -> IndexDiff:
+    """
+    Incrementally sync the index with `chunks`.
+
+    Files whose chunk hashes match the manifest are skipped; only new or
+    changed chunks are embedded, and chunks of edited or removed files are
+    deleted. Changes are applied to a copy of the live version, which is
+    promoted once complete. Falls back to a full rebuild when nothing is
+    indexed yet, the embedding model or runtime changed or chunks were
+    labelled by another version of the language detector.
+
+    `chunks` may be a stream; it is consumed one source at a time, so an
+    iterator must yield each source's chunks contiguously (lists are
+    grouped here). With `shard`, only that shard is synced; on a sharded
+    index without it, chunks are split across shards (a stream is spilled
+    to temporary files, see _split) and each shard is synced on its own
+    (files missing from `chunks` are removed from every shard). A shard
+    that has nothing indexed and gets no chunks is left as is.
+
+    Files missing from `chunks` but listed in `keep` (e.g. files that
+    failed to parse this time) keep their indexed chunks rather than being
+    removed. `keep` is only read once `chunks` is exhausted, so it may be
+    filled while the stream is consumed.
+    """
+    backend = _backend(backend)
+    with _build_lock(backend):
+        if shard is None and _sharded(backend):
+            with _split(chunks, backend) as parts:
+                diffs, offset, total = [], 0, sum(len(p) for p in parts.values())
+                build_id = _new_id()
+                for name, part in parts.items():
+                    broot = _shard_root(backend, name)
+                    if part or _current(broot) is not None:
+                        diffs.append(
+                            _update(
+                                backend,
+                                broot,
+                                part,
+                                embedding_model,
+                                batch_size,
+                                write_batch_size,
+                                _offset_progress(progress, offset, total),
+                                keep,
+                                build_id,
+                            )
+                        )
+                    offset += len(part)
+            return _merge_diffs(diffs)
+        return _update(
+            backend,
+            _shard_root(backend, shard),
+            chunks,
+            embedding_model,
+            batch_size,
+            write_batch_size,
+            progress,
+            keep,
+        )
+
+
+def _update(
+    backend: str,
+    broot: Path,
+    chunks: Iterable[Dict[str, Any]],
+    embedding_model: str,
+    batch_size: int,
+    write_batch_size: int,
+    progress: Optional[ProgressFn],
+    keep: Container[str] = (),
+    build_id: Optional[str] = None,
+) -> IndexDiff:
+    current = _current(broot)
+    manifest = (
+        Manifest.load(broot / "versions" / current / "manifest.json")
+        if current is not None
+        else Manifest()
     )
+    if (
+        current is None
+        or manifest.embedding_model != embedding_model
+        or manifest.backend != backend
+        or manifest.lang_version != DETECTOR_VERSION
+        or _runtime_changed(manifest, embedding_model)
+    ):
+        count, manifest = _rebuild(
+            backend,
+            broot,
+            chunks,
+            embedding_model,
+            batch_size,
+            write_batch_size,
+            progress,
+            build_id,
+        )
+        return IndexDiff(added_files=sorted(manifest.files), chunks_added=count, full_rebuild=True)
+
+    if isinstance(chunks, list):
+        chunks = sorted(chunks, key=lambda c: c["source"])
+
+    diff = IndexDiff()
+    new_files: Dict[str, FileEntry] = {}
+    to_delete: List[str] = []
+
+    def _to_embed() -> Iterator[Dict[str, Any]]:
+        for source, group in groupby(chunks, key=lambda c: c["source"]):
+            rows = sorted(((int(c["chunk_id"]), chunk_uid(c), c) for c in group), key=lambda r: r[0])
+            uids = [uid for _, uid, _ in rows]
+            entry = FileEntry(hash=file_hash(uids), chunks=uids)
+            new_files[source] = entry
+            old = manifest.files.get(source)
+            if old is not None and old.hash == entry.hash:
+                diff.unchanged_files.append(source)
+                diff.chunks_unchanged += len(uids)
+                continue
+            (diff.added_files if old is None else diff.changed_files).append(source)
+            old_uids = set(old.chunks) if old is not None else set()
+            new_uids = set(uids)
+            to_delete.extend(uid for uid in old_uids if uid not in new_uids)
+            diff.chunks_unchanged += len(new_uids & old_uids)
+            for _, uid, c in rows:
+                if uid not in old_uids:
+                    yield c
+
+    def _removed() -> List[str]:
+        """Indexed files missing from `chunks` (call once it is exhausted)."""
+        gone = sorted(set(manifest.files) - set(new_files))
+        for source in gone:
+            if source in keep:
+                new_files[source] = manifest.files[source]
+        return [source for source in gone if source not in keep]
+
+    # Only copy the live version once something actually changed, so a
+    # no-op sync (the common daily case) costs no I/O.
+    pending = _to_embed()
+    first = next(pending, None)
+    if first is not None:
+        pending = chain([first], pending)
+    elif not to_delete and not _removed():
+        return diff
+
+    with _Build(backend, broot, base=current, build_id=build_id) as build:
+        diff.chunks_added = _embed_and_add(
+            build.store,
+            pending,
+            embedding_model,
+            batch_size=batch_size,
+            write_batch_size=write_batch_size,
+            progress=progress,
+            chunk_store=build.chunk_store,
+        )
+
+        for source in _removed():
+            diff.removed_files.append(source)
+            to_delete.extend(manifest.files[source].chunks)
+
+        for batch in _batched(to_delete, write_batch_size):
+            build.store.delete(batch)
+            build.chunk_store.delete(batch)
+        diff.chunks_removed = len(to_delete)
+
+        build.commit(Manifest(embedding_model=embedding_model, backend=backend, files=new_files))
+    return diff
+
+
+def embed_query(query: str, embedding_model: str):
+    with stage("query_embed"):
+        return get_model(embedding_model).encode(query, normalize_embeddings=True)
+
+
+# Runs the lexical stage of hybrid queries next to the dense one.
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mrc-search")
+
+
+def retrieve(
+    query: str,
+    embedding_model: str,
+    top_k: int = 6,
+    query_embedding=None,
+    backend: Optional[str] = None,
+    mode: str = "dense",
+    dense_k: Optional[int] = None,
+    lexical_k: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+    lang_mode: str = "off",
+    lang: Optional[str] = None,
+):
+    """
+    Top-`top_k` chunks of the live index version for `query`.
+
+    mode="dense" ranks by embedding similarity and "lexical" by BM25;
+    "hybrid" runs both concurrently (`dense_k` / `lexical_k` candidates,
+    default max(top_k, HYBRID_STAGE_K)) and merges them with reciprocal
+    rank fusion, so scores are then RRF scores. Versions without a lexical
+    index fall back to dense. Per-stage wall times in seconds (embed_s,
+    dense_s, lexical_s, fusion_s, fetch_s, total_s) go into `timings`.
+
+    With lang_mode "filter" or "prefer" (see LANG_MODES), the search is
+    restricted to chunks in `lang`, by default the detected language of
+    `query`. A sharded index is searched shard by shard in parallel (see
+    SHARDS); each chunk carries the `shard` it came from.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode} (expected one of {RETRIEVAL_MODES})")
+    _check_lang_mode(lang_mode)
+    if lang_mode != "off" or _sharded(_backend(backend)):
+        return retrieve_many(
+            [query],
+            embedding_model,
+            top_k,
+            backend,
+            mode,
+            dense_k,
+            lexical_k,
+            timings,
+            [query_embedding],
+            lang_mode,
+            lang,
+        )[0]
+    timings = timings if timings is not None else {}
+    with stage("retrieve", mode=mode, top_k=top_k, backend=_backend(backend)) as st:
+        out = _retrieve(
+            query,
+            embedding_model,
+            top_k,
+            query_embedding,
+            backend,
+            mode,
+            dense_k,
+            lexical_k,
+            timings,
+        )
+        st.set(results=len(out))
+    timings["total_s"] = st.seconds
+    return out
+
+
+def _check_lang_mode(lang_mode: str) -> None:
+    if lang_mode not in LANG_MODES:
+        raise ValueError(f"Unknown language mode: {lang_mode} (expected one of {LANG_MODES})")
+
+
+def _query_langs(
+    path: Path, queries: List[str], lang_mode: str, lang: Optional[str]
+) -> List[Optional[str]]:
+    """Language partition each query is restricted to (None: the whole index)."""
+    if lang_mode == "off":
+        return [None] * len(queries)
+    indexed = _languages(path)
+    out: List[Optional[str]] = []
+    for q in queries:
+        q_lang = lang or detect_language(q)
+        out.append(q_lang if q_lang != UNKNOWN and indexed.get(q_lang) else None)
+    return out
+
+
+def _retrieve(
+    query: str,
+    embedding_model: str,
+    top_k: int,
+    query_embedding,
+    backend: Optional[str],
+    mode: str,
+    dense_k: Optional[int],
+    lexical_k: Optional[int],
+    timings: Dict[str, float],
+):
+    live = _live(backend)
+    if live is None:
+        return []
+    path, store = live
+    lexical = _lexical(path) if mode != "dense" else None
+    if lexical is None:
+        mode = "dense"
+
+    def _dense(k: int):
+        emb = query_embedding
+        if emb is None:
+            t0 = time.perf_counter()
+            emb = embed_query(query, embedding_model)
+            timings["embed_s"] = time.perf_counter() - t0
+        with stage("vector_query", k=k) as st:
+            hits = store.query(np.atleast_2d(emb), k)[0]
+        timings["dense_s"] = st.seconds
+        return hits
+
+    def _lex(k: int):
+        with stage("lexical_query", k=k) as st:
+            hits = lexical.search(query, k)
+        timings["lexical_s"] = st.seconds
+        return hits
+
+    if mode == "hybrid":
+        # copy_context keeps the lexical span under the current retrieve span.
+        lexical_hits = _search_pool.submit(
+            contextvars.copy_context().run, _lex, lexical_k or max(top_k, HYBRID_STAGE_K)
+        )
+        dense_hits = _dense(dense_k or max(top_k, HYBRID_STAGE_K))
+        rankings = [[uid for uid, _ in dense_hits], [uid for uid, _ in lexical_hits.result()]]
+        with stage("rank_fusion") as st:
+            hits = rrf_merge(rankings, top_k, RRF_K)
+        timings["fusion_s"] = st.seconds
+    elif mode == "lexical":
+        hits = _lex(top_k)
+    else:
+        hits = _dense(top_k)
+
+    return _fetch(path, [hits], timings)[0]
+
+
+def _read_chunks(
+    path: Path,
+    uids: List[str],
+    timings: Dict[str, float],
+    alias_uids: Optional[List[str]] = None,
+):
+    """
+    Rows of `uids` and aliases of `alias_uids` (default: `uids`), read in
+    one pass over a version's chunks.db.
+    """
+    alias_uids = uids if alias_uids is None else alias_uids
+    with stage("chunk_fetch", chunks=len(uids)) as st:
+        chunk_store = _chunk_store(path)
+        rows = dict(zip(uids, chunk_store.get_many(uids)))
+        aliases = chunk_store.aliases_of(alias_uids)
+    timings["fetch_s"] = timings.get("fetch_s", 0.0) + st.seconds
+    return rows, aliases
+
+
+def _chunk(row: Dict[str, Any], score: float, aliases: List, shard: Optional[str]):
+    return {
+        "text": row["text"],
+        "source": row["source"],
+        "chunk_id": int(row["chunk_id"]),
+        "lang": row["lang"],
+        "score": score,
+        "aliases": aliases,
+        "shard": shard,
+    }
+
+
+def _fetch(
+    path: Path,
+    hit_lists: List[List[tuple]],
+    timings: Dict[str, float],
+    shard: Optional[str] = None,
+):
+    """Chunks for each list of (uid, score) hits, read in one pass over chunks.db."""
+    uids = list(dict.fromkeys(uid for hits in hit_lists for uid, _ in hits))
+    rows, aliases = _read_chunks(path, uids, timings)
+    return [
+        [
+            _chunk(rows[uid], score, aliases.get(uid, []), shard)
+            for uid, score in hits
+            if uid in rows
+        ]
+        for hits in hit_lists
+    ]
+
+
+def _fetch_shards(shards: List[tuple], hit_lists: List[List[tuple]], timings: Dict[str, float]):
+    """
+    _fetch for (shard index, uid, score) hits, reading each shard's chunks.db
+    once. Aliases are looked up in every shard: dedup runs over the whole
+    stream, so a duplicate may be stored in another shard than its
+    representative.
+    """
+    all_uids = list(dict.fromkeys(uid for hits in hit_lists for _, uid, _ in hits))
+    if not all_uids:
+        return [[] for _ in hit_lists]
+    rows: Dict[tuple, Dict[str, Any]] = {}
+    aliases: Dict[str, List[Dict[str, Any]]] = {}
+    for i, (_, path) in enumerate(shards):
+        uids = list(dict.fromkeys(uid for hits in hit_lists for s, uid, _ in hits if s == i))
+        shard_rows, shard_aliases = _read_chunks(path, uids, timings, alias_uids=all_uids)
+        rows.update(((i, uid), row) for uid, row in shard_rows.items() if row is not None)
+        for uid, found in shard_aliases.items():
+            aliases.setdefault(uid, []).extend(found)
     out = []
-    for doc, meta, dist in zip(res["documents"][0], res["metadatas"][0], res["distances"][0]):
-        score = 1.0 - float(dist)
-        out.append(
-            {
-                "text": doc,
-                "source": meta.get("source", "unknown"),
-                "chunk_id": int(meta.get("chunk_id", -1)),
-                "score": score,
-            }
+    for hits in hit_lists:
+        chunks = []
+        for i, uid, score in hits:
+            if (i, uid) in rows:
+                found = sorted(aliases.get(uid, []), key=lambda a: (a["source"], a["chunk_id"]))
+                chunks.append(_chunk(rows[(i, uid)], score, found, shards[i][0]))
+        out.append(chunks)
+    return out
+
+
+def retrieve_many(
+    queries: List[str],
+    embedding_model: str,
+    top_k: int = 6,
+    backend: Optional[str] = None,
+    mode: str = "dense",
+    dense_k: Optional[int] = None,
+    lexical_k: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+    query_embeddings: Optional[List[Any]] = None,
+    lang_mode: str = "off",
+    lang: Optional[str] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    retrieve() for many queries at once, one result list per query.
+
+    All queries are embedded in one batched encode (except those with an
+    embedding in `query_embeddings`, which may hold None entries) and
+    searched with one multi-query vector store call; BM25 runs alongside
+    on the search pool, and chunks are fetched in one pass. `timings` gets
+    the batch totals. With a `lang_mode`, queries are grouped by language
+    and each group searches its own partition. On a sharded index, the
+    batch fans out to every shard and their hits are merged.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode} (expected one of {RETRIEVAL_MODES})")
+    _check_lang_mode(lang_mode)
+    timings = timings if timings is not None else {}
+    with stage(
+        "retrieve", mode=mode, top_k=top_k, backend=_backend(backend), queries=len(queries)
+    ) as st:
+        out = _retrieve_many(
+            queries,
+            embedding_model,
+            top_k,
+            backend,
+            mode,
+            dense_k,
+            lexical_k,
+            timings,
+            query_embeddings,
+            lang_mode,
+            lang,
         )
+    timings["total_s"] = st.seconds
     return out
+
+
+def _retrieve_many(
+    queries: List[str],
+    embedding_model: str,
+    top_k: int,
+    backend: Optional[str],
+    mode: str,
+    dense_k: Optional[int],
+    lexical_k: Optional[int],
+    timings: Dict[str, float],
+    query_embeddings: Optional[List[Any]],
+    lang_mode: str,
+    lang: Optional[str],
+):
+    shards = _live_shards(_backend(backend))
+    if not shards or not queries:
+        return [[] for _ in queries]
+    # Dense everywhere if a shard has no lexical index, so scores compare.
+    if mode != "dense" and any(_lexical(path) is None for _, path, _ in shards):
+        mode = "dense"
+
+    embs = None
+    if mode != "lexical":
+        embs = list(query_embeddings or [None] * len(queries))
+        missing = [i for i, e in enumerate(embs) if e is None]
+        if missing:
+            with stage("query_embed", queries=len(missing)) as st:
+                encoded = get_model(embedding_model).encode(
+                    [queries[i] for i in missing],
+                    batch_size=EMBED_BATCH_SIZE,
+                    normalize_embeddings=True,
+                )
+            for i, e in zip(missing, encoded):
+                embs[i] = e
+            timings["embed_s"] = st.seconds
+        embs = np.atleast_2d(np.asarray(embs, dtype=np.float32))
+
+    dense_k, lexical_k = _stage_ks(mode, top_k, dense_k, lexical_k)
+    # BM25 weights terms by document frequency: over a sharded index, use
+    # the frequencies of the whole index so shard scores compare.
+    idfs = None
+    if mode != "dense" and len(shards) > 1:
+        lexicals = [_lexical(path) for _, path, _ in shards]
+        idfs = [global_idf(lexicals, q) for q in queries]
+
+    def _search(path: Path, store: VectorStore, stage_timings: Dict[str, float]):
+        return _search_version(
+            path,
+            store,
+            queries,
+            embs,
+            top_k,
+            mode,
+            dense_k,
+            lexical_k,
+            stage_timings,
+            lang_mode,
+            lang,
+            idfs,
+        )
+
+    if len(shards) == 1:
+        name, path, store = shards[0]
+        hits = _rank(*_search(path, store, timings), mode, top_k, timings)
+        return _fetch(path, hits, timings, shard=name)
+    return _fan_out(shards, _search, len(queries), mode, top_k, dense_k, lexical_k, timings)
+
+
+def _stage_ks(
+    mode: str, top_k: int, dense_k: Optional[int], lexical_k: Optional[int]
+) -> Tuple[int, int]:
+    """Candidates taken from the dense and lexical stages."""
+    if mode == "hybrid":
+        return dense_k or max(top_k, HYBRID_STAGE_K), lexical_k or max(top_k, HYBRID_STAGE_K)
+    return top_k, top_k
+
+
+def _rank(
+    dense: List[List[tuple]],
+    lexical: List[List[tuple]],
+    mode: str,
+    top_k: int,
+    timings: Dict[str, float],
+) -> List[List[tuple]]:
+    """Top-`top_k` (id, score) hits of each query from its dense and lexical hits."""
+    if mode == "hybrid":
+        with stage("rank_fusion", queries=len(dense)) as st:
+            hits = [
+                rrf_merge([[u for u, _ in d], [u for u, _ in lx]], top_k, RRF_K)
+                for d, lx in zip(dense, lexical)
+            ]
+        timings["fusion_s"] = st.seconds
+        return hits
+    return [h[:top_k] for h in (lexical if mode == "lexical" else dense)]
+
+
+# Runs each shard's search of a sharded query.
+_shard_pool = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="mrc-shard")
+
+
+def _fan_out(
+    shards: List[tuple],
+    search: Callable[[Path, VectorStore, Dict[str, float]], tuple],
+    n_queries: int,
+    mode: str,
+    top_k: int,
+    dense_k: int,
+    lexical_k: int,
+    timings: Dict[str, float],
+):
+    """
+    Search every shard in parallel and merge the hits into a global top-k.
+
+    Each stage is merged on its own: dense hits by similarity and lexical
+    hits by BM25 (computed with whole-index IDF), into the top `dense_k` /
+    `lexical_k` of the index; hybrid then fuses those two rankings once,
+    as an unsharded search would. Shards that fail or miss
+    SHARD_TIMEOUT_S are left out (listed in the span's `skipped`); an
+    error is raised only if no shard answered. Stage times are the slowest
+    shard's.
+    """
+    per_shard = [{} for _ in shards]
+    with stage("shard_fanout", shards=len(shards)) as st:
+        # copy_context keeps each shard's spans under the retrieve span.
+        futures = [
+            _shard_pool.submit(contextvars.copy_context().run, search, path, store, t)
+            for (_, path, store), t in zip(shards, per_shard)
+        ]
+        done, _ = wait(futures, timeout=SHARD_TIMEOUT_S)
+        answered, skipped, error = [], [], None
+        for (name, path, _), future, t in zip(shards, futures, per_shard):
+            if future not in done:
+                skipped.append(name)
+                continue
+            try:
+                answered.append((name, path, future.result()))
+            except Exception as e:
+                skipped.append(name)
+                error = error or e
+                continue
+            for key, seconds in t.items():
+                timings[key] = max(timings.get(key, 0.0), seconds)
+        st.set(answered=len(answered), skipped=",".join(skipped))
+    if not answered:
+        raise error or TimeoutError(f"No index shard answered within {SHARD_TIMEOUT_S}s")
+
+    def _merge(stage_hits: List[List[List[tuple]]], q: int, k: int) -> List[tuple]:
+        """Global top-`k` ((shard index, uid), score) of query `q` in one stage."""
+        hits = [((i, uid), score) for i, lists in enumerate(stage_hits) for uid, score in lists[q]]
+        hits.sort(key=lambda h: h[1], reverse=True)
+        return hits[:k]
+
+    dense = [_merge([r[0] for _, _, r in answered], q, dense_k) for q in range(n_queries)]
+    lexical = [_merge([r[1] for _, _, r in answered], q, lexical_k) for q in range(n_queries)]
+    merged = [
+        [(i, uid, score) for (i, uid), score in hits]
+        for hits in _rank(dense, lexical, mode, top_k, timings)
+    ]
+    return _fetch_shards([(name, path) for name, path, _ in answered], merged, timings)
+
+
+def _search_version(
+    path: Path,
+    store: VectorStore,
+    queries: List[str],
+    embs: Optional[np.ndarray],
+    top_k: int,
+    mode: str,
+    dense_k: Optional[int],
+    lexical_k: Optional[int],
+    timings: Dict[str, float],
+    lang_mode: str,
+    lang: Optional[str],
+    idfs: Optional[List[Dict[str, float]]] = None,
+) -> Tuple[List[List[tuple]], List[List[tuple]]]:
+    """
+    Top-`dense_k` dense and top-`lexical_k` lexical (uid, score) hits of
+    each query in one index version (empty for a stage `mode` skips); see
+    _rank. `idfs` are per-query BM25 IDF overrides (see global_idf).
+    """
+    lexical = _lexical(path) if mode != "dense" else None
+
+    def _add_time(key: str, seconds: float) -> None:
+        timings[key] = timings.get(key, 0.0) + seconds
+
+    def _lex_all(groups: Dict[Optional[str], List[int]], n: int):
+        hits: Dict[int, List[tuple]] = {}
+        with stage("lexical_query", k=lexical_k, queries=n) as st:
+            for q_lang, idx in groups.items():
+                for i in idx:
+                    idf = idfs[i] if idfs is not None else None
+                    hits[i] = lexical.search(queries[i], lexical_k, lang=q_lang, idf=idf)
+        _add_time("lexical_s", st.seconds)
+        return hits
+
+    def _search(groups: Dict[Optional[str], List[int]]):
+        """Dense and lexical hits, by query index, of each language group."""
+        n = sum(len(idx) for idx in groups.values())
+        lexical_hits = None
+        if mode != "dense":
+            lexical_hits = _search_pool.submit(contextvars.copy_context().run, _lex_all, groups, n)
+        dense_hits: Dict[int, List[tuple]] = {}
+        if mode != "lexical":
+            with stage("vector_query", k=dense_k, queries=n) as st:
+                for q_lang, idx in groups.items():
+                    dense_hits.update(zip(idx, store.query(embs[idx], dense_k, lang=q_lang)))
+            _add_time("dense_s", st.seconds)
+        return dense_hits, lexical_hits.result() if lexical_hits is not None else {}
+
+    q_langs = _query_langs(path, queries, lang_mode, lang)
+    groups: Dict[Optional[str], List[int]] = {}
+    for i, q_lang in enumerate(q_langs):
+        groups.setdefault(q_lang, []).append(i)
+    dense_hits, lexical_hits = _search(groups)
+
+    if lang_mode == "prefer":
+        # Widen queries whose partition gave too little to the whole index.
+        weak = []
+        for i, q_lang in enumerate(q_langs):
+            if q_lang is None:
+                continue
+            first = dense_hits.get(i) or lexical_hits.get(i)
+            if (
+                not first
+                or len(first) < top_k
+                or (i in dense_hits and first[0][1] < LANG_MIN_SCORE)
+            ):
+                weak.append(i)
+        if weak:
+            with stage("lang_widen", queries=len(weak)):
+                wide_dense, wide_lexical = _search({None: weak})
+            dense_hits.update(wide_dense)
+            lexical_hits.update(wide_lexical)
+
+    order = range(len(queries))
+    return [dense_hits.get(i, []) for i in order], [lexical_hits.get(i, []) for i in order]
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+# Local stand-in for the LLM backends, for offline batch runs and benchmarks:
+#   Ollama:  POST /api/generate                    (ollama_base_url = server url)
+#   Groq:    POST /openai/v1/chat/completions      (GROQ_BASE_URL = server url)
+# Answers are deterministic: they echo the question and cite the first
+# context label, so retrieval changes still show up in regression diffs.
+
+DEFAULT_PORT = 11435
+
+_QUESTION_RE = re.compile(r"User question:\n(.*?)\n\nContext:", re.S)
+_LABEL_RE = re.compile(r"^\[Source: [^\]]*\]", re.M)
+
+
+def stub_answer(prompt: str) -> str:
+    m = _QUESTION_RE.search(prompt)
+    question = (m.group(1) if m else prompt[-200:]).strip()
+    labels = _LABEL_RE.findall(prompt)
+    cite = labels[0] if labels else "no context"
+    return f"Stub answer to: {question}\n- {cite}"
+
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubLLMServer._Server"
+
+    def log_message(self, *args: Any) -> None:  # quiet
+        pass
+
+    def _json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, content_type: str, parts: Iterator[bytes]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for part in parts:
+            self.wfile.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _generate(self, text: str) -> None:
+        """Sleep as long as streaming `text` would take."""
+        n = len(_tokens(text))
+        time.sleep(self.server.latency_s + self.server.token_s * max(0, n - 1))
+
+    def _delayed(self, text: str) -> Iterator[str]:
+        time.sleep(self.server.latency_s)
+        for i, tok in enumerate(_tokens(text)):
+            if i:
+                time.sleep(self.server.token_s)
+            yield tok
+
+    def do_GET(self) -> None:
+        if self.path in ("/", "/api/tags"):
+            self._json(200, {"models": [{"name": "stub"}]})
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._json(400, {"error": "invalid JSON"})
+            return
+        with self.server.lock:
+            self.server.requests += 1
+        if self.path == "/api/generate":
+            self._ollama(req)
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            self._openai(req)
+        else:
+            self._json(404, {"error": "not found"})
+
+    def _ollama(self, req: Dict[str, Any]) -> None:
+        model = req.get("model", "stub")
+        answer = stub_answer(req.get("prompt", ""))
+        if not req.get("stream", True):
+            self._generate(answer)
+            self._json(200, {"model": model, "response": answer, "done": True})
+            return
+
+        def lines() -> Iterator[bytes]:
+            for tok in self._delayed(answer):
+                yield json.dumps({"model": model, "response": tok, "done": False}).encode() + b"\n"
+            yield json.dumps({"model": model, "response": "", "done": True}).encode() + b"\n"
+
+        self._stream("application/x-ndjson", lines())
+
+    def _openai(self, req: Dict[str, Any]) -> None:
+        model = req.get("model", "stub")
+        messages = req.get("messages") or [{}]
+        answer = stub_answer(messages[-1].get("content", ""))
+        rid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        if not req.get("stream"):
+            self._generate(answer)
+            self._json(
+                200,
+                {
+                    "id": rid,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": answer},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                },
+            )
+            return
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> bytes:
+            payload = {
+                "id": rid,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            return b"data: " + json.dumps(payload).encode() + b"\n\n"
+
+        def events() -> Iterator[bytes]:
+            yield chunk({"role": "assistant", "content": ""})
+            for tok in self._delayed(answer):
+                yield chunk({"content": tok})
+            yield chunk({}, "stop")
+            yield b"data: [DONE]\n\n"
+
+        self._stream("text/event-stream", events())
+
+
+class StubLLMServer:
+    """
+    Stub Ollama / Groq-compatible server on a background thread.
+
+    `latency_s` is the delay before the first token and `token_s` the delay
+    between tokens, to mimic a real model's timing.
+    """
+
+    class _Server(ThreadingHTTPServer):
+        daemon_threads = True
+        latency_s = 0.0
+        token_s = 0.0
+        requests = 0
+
+        def handle_error(self, request, client_address) -> None:
+            # Clients dropping keep-alive or streaming connections are expected.
+            if not isinstance(sys.exc_info()[1], ConnectionError):
+                super().handle_error(request, client_address)
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_s: float = 0.0,
+        token_s: float = 0.0,
+    ) -> None:
+        self._server = self._Server((host, port), _Handler)
+        self._server.latency_s = latency_s
+        self._server.token_s = token_s
+        self._server.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> int:
+        return self._server.requests
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mrc-stub-llm", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stub LLM server (Ollama + Groq/OpenAI APIs).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before first token")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="delay between tokens")
+    args = parser.parse_args()
+    server = StubLLMServer(args.host, args.port, args.latency_ms / 1000, args.token_ms / 1000)
+    print(f"Stub LLM at {server.url} (Ollama base URL, or GROQ_BASE_URL)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
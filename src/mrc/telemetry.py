@@ -1,33 +1,282 @@
 from __future__ import annotations
 
+import atexit
+import json
 import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-import mlflow
 import streamlit as st
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
 
+DEFAULT_EXPERIMENT = "multilingual-rag-copilot"
+# Events waiting for the worker; beyond this they are spilled to disk.
+QUEUE_SIZE = 2000
+# The worker writes a batch every FLUSH_INTERVAL_S, or sooner once
+# FLUSH_AT events are waiting.
+FLUSH_INTERVAL_S = 30.0
+FLUSH_AT = 500
+SPILL_PATH = Path(os.getenv("MRC_TELEMETRY_DIR", "storage/telemetry")) / "mlflow_spill.jsonl"
+# Past this size spilled events are dropped (and counted) instead.
+SPILL_MAX_BYTES = 20 * 1024 * 1024
+SHUTDOWN_TIMEOUT_S = 10.0
+# MLflow log_batch limits per request.
+_MAX_METRICS = 1000
+_MAX_PARAMS = 100
 
-def _setup() -> None:
-    uri = st.secrets.get("MLFLOW_TRACKING_URI") or os.getenv("MLFLOW_TRACKING_URI")
-    exp = st.secrets.get("MLFLOW_EXPERIMENT") or os.getenv("MLFLOW_EXPERIMENT") or "multilingual-rag-copilot"
-    if uri:
-        mlflow.set_tracking_uri(uri)
-    mlflow.set_experiment(exp)
+Event = Dict[str, Any]
 
 
-def mlflow_log_index(doc_count: int, chunk_count: int, embedding_model: str, elapsed_s: float) -> None:
-    _setup()
-    with mlflow.start_run(run_name="index"):
-        mlflow.log_param("embedding_model", embedding_model)
-        mlflow.log_metric("doc_count", doc_count)
-        mlflow.log_metric("chunk_count", chunk_count)
-        mlflow.log_metric("index_elapsed_s", elapsed_s)
+def _config() -> Tuple[Optional[str], str]:
+    try:
+        secrets = dict(st.secrets)
+    except Exception:  # no secrets.toml, or not running under Streamlit
+        secrets = {}
+    uri = secrets.get("MLFLOW_TRACKING_URI") or os.getenv("MLFLOW_TRACKING_URI")
+    exp = secrets.get("MLFLOW_EXPERIMENT") or os.getenv("MLFLOW_EXPERIMENT") or DEFAULT_EXPERIMENT
+    return uri, exp
 
 
-def mlflow_log_chat(backend: str, model: str, top_k: int, latency_s: float, retrieved: int) -> None:
-    _setup()
-    with mlflow.start_run(run_name="chat", nested=True):
-        mlflow.log_param("backend", backend)
-        mlflow.log_param("model", model)
-        mlflow.log_param("top_k", top_k)
-        mlflow.log_metric("latency_s", latency_s)
-        mlflow.log_metric("retrieved_chunks", retrieved)
+def _chunks(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+class MlflowSink:
+    """
+    Background MLflow writer.
+
+    `log()` only enqueues the event, so it never waits on the tracking
+    server. A worker thread drains the queue periodically and writes one
+    run per (kind, params) group with `MlflowClient.log_batch`; each
+    event's metrics become one step of the run's series. Events that do
+    not fit the queue, or whose batch fails to log, are appended to a
+    JSONL spill file and retried with the next batch.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = QUEUE_SIZE,
+        flush_interval_s: float = FLUSH_INTERVAL_S,
+        spill_path: Path = SPILL_PATH,
+    ) -> None:
+        self.flush_interval_s = flush_interval_s
+        self.spill_path = Path(spill_path)
+        self.dropped = 0
+        self.spilled = 0
+        self.logged = 0
+        self.last_error: Optional[str] = None
+        self._queue: "queue.Queue[Event]" = queue.Queue(maxsize=queue_size)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._done = threading.Condition()
+        self._requested = 0
+        self._completed = 0
+        self._client: Optional[MlflowClient] = None
+        self._experiment_id: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, name="mlflow-sink", daemon=True)
+        self._thread.start()
+
+    def log(self, kind: str, params: Dict[str, Any], metrics: Dict[str, float]) -> None:
+        event = {
+            "kind": kind,
+            "ts": time.time(),
+            "params": {k: str(v) for k, v in params.items()},
+            "metrics": {k: float(v) for k, v in metrics.items() if v is not None},
+        }
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._spill([event])
+            return
+        if self._queue.qsize() >= FLUSH_AT:
+            self._wake.set()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Ask the worker to write everything queued so far; wait for it."""
+        with self._done:
+            self._requested += 1
+            target = self._requested
+        self._wake.set()
+        with self._done:
+            return self._done.wait_for(lambda: self._completed >= target, timeout)
+
+    def close(self, timeout: float = SHUTDOWN_TIMEOUT_S) -> None:
+        """Write what is queued and stop the worker (registered with atexit)."""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    # worker side
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            self._write_pending()
+        self._write_pending()
+
+    def _drain(self) -> List[Event]:
+        events: List[Event] = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _write_pending(self) -> None:
+        with self._done:
+            target = self._requested
+        events = self._unspill() + self._drain()
+        if events:
+            failed = self._write(events)
+            self.logged += len(events) - len(failed)
+            if failed:
+                # Tracking server down: keep them for the next batch.
+                self._client = None
+                self._spill(failed)
+        with self._done:
+            self._completed = max(self._completed, target)
+            self._done.notify_all()
+
+    def _setup(self) -> Tuple[MlflowClient, str]:
+        if self._client is None or self._experiment_id is None:
+            uri, name = _config()
+            client = MlflowClient(tracking_uri=uri)
+            exp = client.get_experiment_by_name(name)
+            self._experiment_id = exp.experiment_id if exp else client.create_experiment(name)
+            self._client = client
+        return self._client, self._experiment_id
+
+    def _write(self, events: List[Event]) -> List[Event]:
+        """Log `events` as one run per (kind, params); returns those not logged."""
+        try:
+            client, experiment_id = self._setup()
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            return events
+        groups: Dict[Tuple[str, Tuple], List[Event]] = {}
+        for e in events:
+            key = (e["kind"], tuple(sorted(e["params"].items())))
+            groups.setdefault(key, []).append(e)
+        failed: List[Event] = []
+        for (kind, params), group in groups.items():
+            group.sort(key=lambda e: e["ts"])
+            try:
+                self._write_run(client, experiment_id, kind, params, group)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                failed.extend(group)
+        return failed
+
+    def _write_run(
+        self,
+        client: MlflowClient,
+        experiment_id: str,
+        kind: str,
+        params: Tuple[Tuple[str, str], ...],
+        group: List[Event],
+    ) -> None:
+        run = client.create_run(
+            experiment_id,
+            start_time=int(group[0]["ts"] * 1000),
+            tags={"mrc.kind": kind, "events": str(len(group))},
+            run_name=kind,
+        )
+        run_id = run.info.run_id
+        metrics = [
+            Metric(name, value, int(e["ts"] * 1000), step)
+            for step, e in enumerate(group)
+            for name, value in e["metrics"].items()
+        ]
+        try:
+            for chunk in _chunks([Param(k, v) for k, v in params], _MAX_PARAMS):
+                client.log_batch(run_id, params=chunk)
+            for chunk in _chunks(metrics, _MAX_METRICS):
+                client.log_batch(run_id, metrics=chunk)
+        except Exception:
+            # The group is spilled and logged again as a new run: drop this
+            # partial one rather than leave it RUNNING next to its duplicate.
+            try:
+                client.delete_run(run_id)
+            except Exception:
+                client.set_terminated(run_id, status="FAILED")
+            raise
+        client.set_terminated(run_id, end_time=int(group[-1]["ts"] * 1000))
+
+    def _spill(self, events: List[Event]) -> None:
+        with self._spill_lock:
+            try:
+                size = self.spill_path.stat().st_size
+            except OSError:
+                size = 0
+            if size >= SPILL_MAX_BYTES:
+                self.dropped += len(events)
+                return
+            try:
+                self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(e) + "\n" for e in events)
+                self.spilled += len(events)
+            except OSError:
+                self.dropped += len(events)
+
+    def _unspill(self) -> List[Event]:
+        with self._spill_lock:
+            try:
+                lines = self.spill_path.read_text(encoding="utf-8").splitlines()
+                self.spill_path.unlink()
+            except OSError:
+                return []
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:  # torn write from a killed process
+                continue
+        return events
+
+
+_sink: Optional[MlflowSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_sink() -> MlflowSink:
+    """Process-wide sink, started on first use and flushed at exit."""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = MlflowSink()
+                atexit.register(_sink.close)
+    return _sink
+
+
+def mlflow_log_index(
+    doc_count: int, chunk_count: int, embedding_model: str, elapsed_s: float
+) -> None:
+    get_sink().log(
+        "index",
+        {"embedding_model": embedding_model},
+        {"doc_count": doc_count, "chunk_count": chunk_count, "index_elapsed_s": elapsed_s},
+    )
+
+
+def mlflow_log_chat(
+    backend: str,
+    model: str,
+    top_k: int,
+    latency_s: float,
+    retrieved: int,
+    ttft_s: Optional[float] = None,
+) -> None:
+    get_sink().log(
+        "chat",
+        {"backend": backend, "model": model, "top_k": top_k},
+        {"latency_s": latency_s, "retrieved_chunks": retrieved, "ttft_s": ttft_s},
+    )
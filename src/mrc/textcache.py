@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+TEXT_CACHE_DIR = Path(os.getenv("MRC_TEXT_CACHE_DIR", "storage/textcache"))
+# "0" turns the cache off (every file is parsed).
+TEXT_CACHE_ENABLED = os.getenv("MRC_TEXT_CACHE", "1") != "0"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# After eviction the cache is trimmed to this fraction of max_bytes.
+EVICT_TO = 0.8
+ZLIB_LEVEL = 6
+_HASH_BLOCK = 1024 * 1024
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class TextCache:
+    """
+    On-disk cache of extracted, cleaned document text.
+
+    Entries are keyed by the file's SHA-256 and a parser tag (suffix and
+    parser version), so a changed file or parser is a miss; each one is a
+    zlib-compressed blob under blobs/. To avoid hashing unchanged files,
+    index.json maps paths to their last (size, mtime_ns, sha256): a path
+    whose stat matches reuses the recorded hash. A blob's mtime is its last
+    use; past max_bytes the least recently used blobs are removed.
+    """
+
+    def __init__(self, root: Path = TEXT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Tuple[int, int, str]] = {}
+        self._dirty = False
+        self._bytes: Optional[int] = None
+        self._load()
+
+    @property
+    def _index_path(self) -> Path:
+        return self.root / "index.json"
+
+    def _load(self) -> None:
+        try:
+            raw = json.loads(self._index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self._stats = {p: (int(s), int(m), h) for p, (s, m, h) in raw.items()}
+
+    def _blob(self, digest: str, tag: str) -> Path:
+        return self.root / "blobs" / digest[:2] / f"{digest}.{tag}.z"
+
+    def digest_of(self, path: Path) -> str:
+        """SHA-256 of `path`, reusing the recorded one if size and mtime match."""
+        st = os.stat(path)
+        key = str(Path(path).resolve())
+        with self._lock:
+            known = self._stats.get(key)
+        if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        digest = hash_file(path)
+        with self._lock:
+            self._stats[key] = (st.st_size, st.st_mtime_ns, digest)
+            self._dirty = True
+        return digest
+
+    def get(self, digest: str, tag: str) -> Optional[str]:
+        blob = self._blob(digest, tag)
+        try:
+            text = zlib.decompress(blob.read_bytes()).decode("utf-8")
+        except (OSError, zlib.error, UnicodeDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(blob)  # mark as recently used
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, digest: str, tag: str, text: str) -> None:
+        blob = self._blob(digest, tag)
+        data = zlib.compress(text.encode("utf-8"), ZLIB_LEVEL)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        # Unique tmp name: other processes (the DAG, parse workers' parent)
+        # may write the same entry concurrently.
+        tmp = blob.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(blob)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += len(data)
+            self._dirty = True
+
+    def _evict(self) -> None:
+        blobs = []
+        for p in (self.root / "blobs").glob("*/*.z"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            blobs.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in blobs)
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICT_TO
+            for _, size, p in sorted(blobs, key=lambda b: b[0]):
+                if total <= target:
+                    break
+                try:
+                    p.unlink()
+                    total -= size
+                except OSError:
+                    pass
+        self._bytes = total
+
+    def flush(self) -> None:
+        """Save the stat index and evict if over max_bytes."""
+        with self._lock:
+            if not self._dirty:
+                return
+            if self._bytes is None or self._bytes > self.max_bytes:
+                self._evict()
+            # Forget paths that no longer exist so the index doesn't grow forever.
+            self._stats = {p: v for p, v in self._stats.items() if os.path.exists(p)}
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self._index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._stats), encoding="utf-8")
+            tmp.replace(self._index_path)
+            self._dirty = False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "paths": len(self._stats)}
+
+
+_cache: Optional[TextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> Optional[TextCache]:
+    """Process-wide text cache (None when disabled with MRC_TEXT_CACHE=0)."""
+    global _cache
+    if not TEXT_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = TextCache()
+            atexit.register(_cache.flush)
+        return _cache
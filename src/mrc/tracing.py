@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import (
+        ConsoleMetricExporter,
+        PeriodicExportingMetricReader,
+    )
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError:  # tracing becomes a no-op; stage() still times the block
+    trace = None
+
+SERVICE_NAME = "multilingual-rag-copilot"
+# "otlp", "file", "console" or "off". Unset: OTLP when OTEL_EXPORTER_OTLP_ENDPOINT
+# is set (a collector is configured), else off.
+TELEMETRY_EXPORTER = os.getenv("MRC_TELEMETRY", "")
+# "file" writes JSON lines under TELEMETRY_DIR; each file is rotated to
+# <name>.1 at TELEMETRY_MAX_BYTES, the previous .1 being dropped.
+TELEMETRY_DIR = Path(os.getenv("MRC_TELEMETRY_DIR", "storage/telemetry"))
+TELEMETRY_MAX_BYTES = int(os.getenv("MRC_TELEMETRY_MAX_BYTES", str(20 * 1024 * 1024)))
+METRICS_INTERVAL_S = 30.0
+# One histogram for all stages, split by the "stage" attribute.
+STAGE_HISTOGRAM = "mrc.stage.duration"
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {}
+
+
+def _exporter_mode() -> str:
+    mode = TELEMETRY_EXPORTER.strip().lower()
+    if mode:
+        return mode
+    return "otlp" if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") else "off"
+
+
+class _RotatingFile:
+    """Text file an exporter writes to, rotated once it reaches max_bytes."""
+
+    def __init__(self, path: Path, max_bytes: int = TELEMETRY_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._f = open(path, "a", encoding="utf-8")
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            if self._f.tell() >= self.max_bytes:
+                self._f.close()
+                self.path.replace(self.path.with_name(self.path.name + ".1"))
+                self._f = open(self.path, "a", encoding="utf-8")
+            return self._f.write(text)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._f.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
+
+
+def _exporters(mode: str):
+    if mode == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import (
+                OTLPMetricExporter,
+            )
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+                OTLPSpanExporter,
+            )
+
+            return OTLPSpanExporter(), OTLPMetricExporter()
+        except ImportError:
+            mode = "file"
+    if mode == "file":
+        TELEMETRY_DIR.mkdir(parents=True, exist_ok=True)
+        spans = _RotatingFile(TELEMETRY_DIR / "spans.jsonl")
+        metrics = _RotatingFile(TELEMETRY_DIR / "metrics.jsonl")
+        _state["files"] = [spans, metrics]
+        return (
+            ConsoleSpanExporter(out=spans, formatter=lambda s: s.to_json(indent=None) + "\n"),
+            ConsoleMetricExporter(out=metrics, formatter=lambda m: m.to_json(indent=None) + "\n"),
+        )
+    return ConsoleSpanExporter(), ConsoleMetricExporter()
+
+
+def _init() -> Dict[str, Any]:
+    """Tracer and stage histogram, set up on first use (empty if disabled)."""
+    if "ready" in _state:
+        return _state
+    with _lock:
+        if "ready" in _state:
+            return _state
+        mode = _exporter_mode()
+        if trace is not None and mode != "off":
+            span_exporter, metric_exporter = _exporters(mode)
+            resource = Resource.create({"service.name": SERVICE_NAME})
+            # Spans are queued and exported from the processor's own thread.
+            tracer_provider = TracerProvider(resource=resource)
+            tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+            meter_provider = MeterProvider(
+                resource=resource,
+                metric_readers=[
+                    PeriodicExportingMetricReader(
+                        metric_exporter, export_interval_millis=METRICS_INTERVAL_S * 1000
+                    )
+                ],
+            )
+            _state["tracer_provider"] = tracer_provider
+            _state["meter_provider"] = meter_provider
+            _state["tracer"] = tracer_provider.get_tracer("mrc")
+            _state["histogram"] = meter_provider.get_meter("mrc").create_histogram(
+                STAGE_HISTOGRAM, unit="ms", description="Wall time per ingest/chat stage"
+            )
+            atexit.register(shutdown)
+        _state["ready"] = True
+        return _state
+
+
+def _attrs(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        k: v if isinstance(v, (str, bool, int, float)) else str(v)
+        for k, v in attrs.items()
+        if v is not None
+    }
+
+
+def observe(name: str, seconds: float) -> None:
+    """Add a duration to the stage histogram (no span)."""
+    histogram = _init().get("histogram")
+    if histogram is not None:
+        # Only the stage name: span attributes (sources, models) are too
+        # high-cardinality for metric labels.
+        histogram.record(seconds * 1000.0, {"stage": name})
+
+
+def record(name: str, seconds: float, **attrs: Any) -> None:
+    """A stage that already happened: histogram entry plus a span ending now."""
+    observe(name, seconds)
+    tracer = _init().get("tracer")
+    if tracer is not None:
+        end = time.time_ns()
+        span = tracer.start_span(
+            f"mrc.{name}", start_time=end - int(seconds * 1e9), attributes=_attrs(attrs)
+        )
+        span.end(end_time=end)
+
+
+class Stage:
+    """Handle for a running stage; `seconds` is set when it ends."""
+
+    def __init__(self, name: str, span=None) -> None:
+        self.name = name
+        self.seconds = 0.0
+        self._span = span
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs: Any) -> None:
+        if self._span is not None:
+            self._span.set_attributes(_attrs(attrs))
+
+    def event(self, name: str, **attrs: Any) -> None:
+        if self._span is not None:
+            self._span.add_event(name, _attrs(attrs))
+
+    def end(self, **attrs: Any) -> float:
+        """End a stage opened with start(); returns its duration in seconds."""
+        self.seconds = time.perf_counter() - self._t0
+        observe(self.name, self.seconds)
+        if self._span is not None:
+            self.set(**attrs)
+            self._span.end()
+            self._span = None
+        return self.seconds
+
+
+@contextmanager
+def stage(name: str, **attrs: Any) -> Iterator[Stage]:
+    """
+    Time the block as stage `name`: a span (child of the current one) and a
+    histogram entry. Exceptions are recorded on the span and re-raised.
+    """
+    tracer = _init().get("tracer")
+    if tracer is None:
+        st = Stage(name)
+        try:
+            yield st
+        finally:
+            st.seconds = time.perf_counter() - st._t0
+        return
+    with tracer.start_as_current_span(f"mrc.{name}", attributes=_attrs(attrs)) as span:
+        st = Stage(name, span)
+        try:
+            yield st
+        finally:
+            st.seconds = time.perf_counter() - st._t0
+            observe(name, st.seconds)
+
+
+def start(name: str, **attrs: Any) -> Stage:
+    """
+    Open a stage that outlives the current block (e.g. a streamed answer);
+    call end() on the result. It does not become the current span.
+    """
+    tracer = _init().get("tracer")
+    span = tracer.start_span(f"mrc.{name}", attributes=_attrs(attrs)) if tracer else None
+    return Stage(name, span)
+
+
+def timed_iter(name: str, items: Iterable[Any], **attrs: Any) -> Iterator[Any]:
+    """
+    Yield from `items`, recording only the time spent producing them (not
+    the consumer's time between items) as one stage when exhausted.
+    """
+    spent = 0.0
+    count = 0
+    error = None
+    it = iter(items)
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                spent += time.perf_counter() - t0
+            count += 1
+            yield item
+    finally:
+        record(name, spent, items=count, error=error, **attrs)
+
+
+def flush(timeout_ms: int = 5000) -> None:
+    """Export pending spans and metrics now (e.g. at the end of a batch job)."""
+    for key in ("tracer_provider", "meter_provider"):
+        provider = _state.get(key)
+        if provider is not None:
+            provider.force_flush(timeout_ms)
+
+
+def shutdown() -> None:
+    for key in ("tracer_provider", "meter_provider"):
+        provider = _state.pop(key, None)
+        if provider is not None:
+            provider.shutdown()
+    _state.pop("tracer", None)
+    _state.pop("histogram", None)
+    for f in _state.pop("files", []):
+        f.close()
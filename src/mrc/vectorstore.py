@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import json
+import shutil
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+BACKENDS = ("chroma", "numpy")
+NUMPY_DTYPES = ("float32", "float16", "int8")
+
+# (id, cosine similarity) pairs per query, best first.
+Hits = List[List[Tuple[str, float]]]
+
+
+class VectorStore(ABC):
+    """Minimal vector index interface used by store.py."""
+
+    @abstractmethod
+    def upsert(
+        self, ids: Sequence[str], embeddings: np.ndarray, metadatas: Sequence[Dict]
+    ) -> None: ...
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]) -> None: ...
+
+    @abstractmethod
+    def query(self, embeddings: np.ndarray, k: int, lang: Optional[str] = None) -> Hits:
+        """
+        Top-`k` ids and cosine similarities for each row of `embeddings`,
+        among vectors whose metadata `lang` is `lang` if given.
+        """
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    def flush(self) -> None:
+        """Persist buffered writes (no-op for stores that write through)."""
+
+
+# --- Chroma ----------------------------------------------------------------------
+
+_chroma_clients: Dict[str, object] = {}
+_chroma_lock = threading.Lock()
+
+
+def _chroma_client(path: Path):
+    key = str(Path(path).resolve())
+    with _chroma_lock:
+        client = _chroma_clients.get(key)
+        if client is None:
+            Path(path).mkdir(parents=True, exist_ok=True)
+            client = chromadb.PersistentClient(
+                path=str(path),
+                settings=Settings(anonymized_telemetry=False),
+            )
+            _chroma_clients[key] = client
+        return client
+
+
+def forget_chroma_client(path: Path) -> None:
+    """Drop the cached client for `path` (e.g. before deleting the directory)."""
+    with _chroma_lock:
+        _chroma_clients.pop(str(Path(path).resolve()), None)
+
+
+class ChromaStore(VectorStore):
+    def __init__(self, path: Path, collection: str = "docs") -> None:
+        self.path = Path(path)
+        self.name = collection
+        self.col = _chroma_client(self.path).get_or_create_collection(name=collection)
+        self._space = (self.col.metadata or {}).get("hnsw:space", "l2")
+
+    def upsert(self, ids, embeddings, metadatas) -> None:
+        self.col.upsert(
+            ids=list(ids), embeddings=np.asarray(embeddings).tolist(), metadatas=list(metadatas)
+        )
+
+    def delete(self, ids) -> None:
+        self.col.delete(ids=list(ids))
+
+    def _similarity(self, dist: float) -> float:
+        # Embeddings are normalized, so every space maps back to cosine.
+        if self._space == "l2":
+            return 1.0 - dist / 2.0
+        return 1.0 - dist
+
+    def query(self, embeddings, k, lang=None) -> Hits:
+        if self.col.count() == 0:
+            return [[] for _ in range(len(embeddings))]
+        res = self.col.query(
+            query_embeddings=np.asarray(embeddings).tolist(),
+            n_results=k,
+            where={"lang": lang} if lang is not None else None,
+            include=["distances"],
+        )
+        # Chroma can return more than n_results after deletes (brute-force
+        # buffer merged with the HNSW index), so cap the result here.
+        return [
+            [(i, self._similarity(float(d))) for i, d in zip(ids[:k], dists[:k])]
+            for ids, dists in zip(res["ids"], res["distances"])
+        ]
+
+    def count(self) -> int:
+        return self.col.count()
+
+    @staticmethod
+    def drop(path: Path, collection: str = "docs") -> None:
+        if not Path(path).exists():
+            return
+        try:
+            _chroma_client(path).delete_collection(name=collection)
+        except Exception:
+            pass
+
+
+# --- NumPy -----------------------------------------------------------------------
+
+_BLOCK = 65536
+
+
+class NumpyStore(VectorStore):
+    """
+    Exact in-process vector index over a memory-mapped matrix.
+
+    Each committed state is a segment directory (vectors.npy, ids.npy, and
+    scales.npy for int8) named by the CURRENT file, so opening the store is
+    just a few np.load(mmap_mode="r") calls. Writes are buffered (vectors
+    spill to a temp file) and become visible on flush(), which writes a new
+    segment and swaps CURRENT.
+
+    Rows are grouped by their metadata `lang`, with each language's row
+    range recorded in info.json, so a query restricted to one language
+    only scans that partition.
+
+    float16 halves and int8 (per-row scale) quarters the footprint; both
+    are upcast block by block at query time, which costs some latency.
+    """
+
+    def __init__(self, path: Path, dtype: str = "float32") -> None:
+        if dtype not in NUMPY_DTYPES:
+            raise ValueError(f"Unsupported dtype: {dtype} (expected one of {NUMPY_DTYPES})")
+        self.path = Path(path)
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._row_of: Optional[Dict[str, int]] = None
+        self._pending_ids: Dict[str, int] = {}
+        self._pending_langs: Dict[str, str] = {}
+        self._partitions: Optional[Dict[str, Tuple[int, int]]] = None
+        self._pending_file = None
+        self._pending_rows = 0
+        self._dim: Optional[int] = None
+        self._deleted: set = set()
+        self._open()
+
+    # -- persistence --
+
+    def _segment(self) -> Optional[Path]:
+        current = self.path / "CURRENT"
+        if not current.exists():
+            return None
+        seg = self.path / current.read_text(encoding="utf-8").strip()
+        return seg if seg.is_dir() else None
+
+    def _open(self) -> None:
+        seg = self._segment()
+        if seg is None:
+            return
+        info = json.loads((seg / "info.json").read_text(encoding="utf-8"))
+        self.dtype = info["dtype"]
+        self._dim = int(info["dim"])
+        parts = info.get("partitions")
+        self._partitions = {k: (int(a), int(b)) for k, (a, b) in parts.items()} if parts else None
+        self._vectors = np.load(seg / "vectors.npy", mmap_mode="r")
+        self._ids = np.load(seg / "ids.npy", mmap_mode="r")
+        if self.dtype == "int8":
+            self._scales = np.load(seg / "scales.npy", mmap_mode="r")
+
+    def _encode(self, block: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        block = np.asarray(block, dtype=np.float32)
+        if self.dtype == "int8":
+            scales = np.abs(block).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            q = np.round(block / scales[:, None]).astype(np.int8)
+            return q, scales.astype(np.float32)
+        return block.astype(self.dtype), None
+
+    # -- writes --
+
+    def _rows(self) -> Dict[str, int]:
+        if self._row_of is None:
+            ids = self._ids if self._ids is not None else []
+            self._row_of = {str(i): r for r, i in enumerate(ids)}
+        return self._row_of
+
+    def _row_langs(self) -> np.ndarray:
+        """Language of each row of the current segment ("" if not recorded)."""
+        langs = np.full(self.count(), "", dtype=object)
+        for lang, (start, stop) in (self._partitions or {}).items():
+            langs[start:stop] = lang
+        return langs
+
+    def upsert(self, ids, embeddings, metadatas) -> None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(ids) == 0:
+            return
+        with self._lock:
+            if self._dim is None:
+                self._dim = int(embeddings.shape[1])
+            if self._pending_file is None:
+                self.path.mkdir(parents=True, exist_ok=True)
+                self._pending_file = (self.path / "pending.bin").open("w+b")
+            self._pending_file.write(np.ascontiguousarray(embeddings).tobytes())
+            for i, (uid, meta) in enumerate(zip(ids, metadatas)):
+                self._pending_ids[uid] = self._pending_rows + i
+                self._pending_langs[uid] = meta.get("lang") or ""
+                self._deleted.discard(uid)
+            self._pending_rows += len(ids)
+
+    def delete(self, ids) -> None:
+        with self._lock:
+            for uid in ids:
+                self._pending_ids.pop(uid, None)
+                self._pending_langs.pop(uid, None)
+                self._deleted.add(uid)
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending_ids and not self._deleted:
+                return
+            row_of = self._rows()
+            keep_old = np.array(
+                sorted(
+                    r
+                    for uid, r in row_of.items()
+                    if uid not in self._deleted and uid not in self._pending_ids
+                ),
+                dtype=np.int64,
+            )
+            pending = sorted(self._pending_ids.items(), key=lambda kv: kv[1])
+            n = len(keep_old) + len(pending)
+            # Rows of each language, kept and new, to be written contiguously.
+            old_langs = self._row_langs()
+            groups: Dict[str, Tuple[np.ndarray, List[Tuple[str, int]]]] = {}
+            for lang in sorted(set(old_langs[keep_old].tolist())):
+                groups[lang] = (keep_old[old_langs[keep_old] == lang], [])
+            for uid, r in pending:
+                lang = self._pending_langs.get(uid, "")
+                groups.setdefault(lang, (np.empty(0, dtype=np.int64), []))[1].append((uid, r))
+
+            seg = self.path / f"seg-{uuid.uuid4().hex[:12]}"
+            seg.mkdir(parents=True)
+            dim = self._dim or 0
+            store_dtype = np.int8 if self.dtype == "int8" else np.dtype(self.dtype)
+            vecs = np.lib.format.open_memmap(
+                seg / "vectors.npy", mode="w+", dtype=store_dtype, shape=(n, dim)
+            )
+            scales = (
+                np.lib.format.open_memmap(
+                    seg / "scales.npy", mode="w+", dtype=np.float32, shape=(n,)
+                )
+                if self.dtype == "int8"
+                else None
+            )
+            raw = None
+            if pending:
+                self._pending_file.flush()
+                raw = np.memmap(
+                    self._pending_file.name,
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(self._pending_rows, dim),
+                )
+            new_ids: List[str] = []
+            partitions: Dict[str, List[int]] = {}
+            pos = 0
+            for lang in sorted(groups):
+                old_rows, new_rows = groups[lang]
+                first = pos
+                for start in range(0, len(old_rows), _BLOCK):
+                    rows = old_rows[start : start + _BLOCK]
+                    vecs[pos : pos + len(rows)] = self._vectors[rows]
+                    if scales is not None:
+                        scales[pos : pos + len(rows)] = self._scales[rows]
+                    pos += len(rows)
+                new_ids.extend(str(self._ids[r]) for r in old_rows)
+                for start in range(0, len(new_rows), _BLOCK):
+                    rows = np.array([r for _, r in new_rows[start : start + _BLOCK]], dtype=np.int64)
+                    q, s = self._encode(raw[rows])
+                    vecs[pos : pos + len(rows)] = q
+                    if scales is not None:
+                        scales[pos : pos + len(rows)] = s
+                    pos += len(rows)
+                new_ids.extend(uid for uid, _ in new_rows)
+                partitions[lang] = [first, pos]
+            del raw
+            vecs.flush()
+            del vecs
+            if scales is not None:
+                scales.flush()
+                del scales
+            np.save(seg / "ids.npy", np.array(new_ids, dtype=np.str_))
+            (seg / "info.json").write_text(
+                json.dumps(
+                    {"dtype": self.dtype, "dim": dim, "count": n, "partitions": partitions}
+                ),
+                encoding="utf-8",
+            )
+
+            old = self._segment()
+            tmp = self.path / "CURRENT.tmp"
+            tmp.write_text(seg.name, encoding="utf-8")
+            tmp.replace(self.path / "CURRENT")
+
+            if self._pending_file is not None:
+                self._pending_file.close()
+                Path(self._pending_file.name).unlink(missing_ok=True)
+                self._pending_file = None
+            self._pending_ids = {}
+            self._pending_langs = {}
+            self._pending_rows = 0
+            self._deleted = set()
+            self._row_of = None
+            self._vectors = self._ids = self._scales = self._partitions = None
+            self._open()
+            if old is not None:
+                shutil.rmtree(old, ignore_errors=True)
+
+    # -- reads --
+
+    def query(self, embeddings, k, lang=None) -> Hits:
+        q = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        vectors, scales, ids = self._vectors, self._scales, self._ids
+        partitions = self._partitions
+        if vectors is None or len(vectors) == 0 or k <= 0:
+            return [[] for _ in range(len(q))]
+        lo, hi = 0, len(vectors)
+        if lang is not None and partitions is not None:
+            lo, hi = partitions.get(lang, (0, 0))
+        n = hi - lo
+        if n <= 0:
+            return [[] for _ in range(len(q))]
+        scores = np.empty((len(q), n), dtype=np.float32)
+        for start in range(lo, hi, _BLOCK):
+            stop = min(start + _BLOCK, hi)
+            block = np.asarray(vectors[start:stop], dtype=np.float32)
+            s = q @ block.T
+            if scales is not None:
+                s *= np.asarray(scales[start:stop], dtype=np.float32)
+            scores[:, start - lo : stop - lo] = s
+        k = min(k, n)
+        out: Hits = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top], kind="stable")]
+            out.append([(str(ids[lo + i]), float(row[i])) for i in top])
+        return out
+
+    def count(self) -> int:
+        return 0 if self._ids is None else len(self._ids)
+
+    @staticmethod
+    def drop(path: Path) -> None:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import zlib
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+
+from mrc import embcache, hedge, store
+
+DIM = 32
+
+
+class StubEncoder:
+    """Bag-of-words stand-in for a SentenceTransformer: same words, same vector."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return DIM
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True, **kw):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        self.calls += len(texts)
+        out = np.zeros((len(texts), DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, zlib.crc32(word.encode()) % DIM] += 1
+            out[i] /= max(float(np.linalg.norm(out[i])), 1e-9)
+        return out[0] if single else out
+
+
+@pytest.fixture
+def encoder() -> StubEncoder:
+    return StubEncoder()
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch, encoder):
+    """Each test gets its own storage/ (paths are relative) and the stub encoder."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(store, "get_model", lambda name, runtime=None: encoder)
+    monkeypatch.setattr(store, "model_runtime", lambda name, runtime=None: "torch")
+    monkeypatch.setattr(store, "SHARDS", 1)
+    for cache in (embcache._caches, store._stores, store._lexicals, store._languages_of):
+        cache.clear()
+    hedge._health.clear()
+    yield tmp_path
+    for chunk_store in store._chunk_stores.values():
+        chunk_store.close()
+    store._chunk_stores.clear()
+    for cache in (embcache._caches, store._stores, store._lexicals, store._languages_of):
+        cache.clear()
+    hedge._health.clear()
+
+
+def make_chunks(files: Dict[str, str], per_file: int = 2) -> List[Dict[str, Any]]:
+    """`per_file` chunks for each source, with text derived from `files[source]`."""
+    return [
+        {"source": source, "chunk_id": i, "text": f"{text} part {i}", "lang": "en"}
+        for source, text in files.items()
+        for i in range(per_file)
+    ]
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import time
+
+import numpy as np
+
+from mrc.answer_cache import AnswerCache
+
+KEY = ("groq", "llm", "embedder", 6, "numpy:dense:off:v1", "en")
+
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_similar_question_hits_within_its_key():
+    cache = AnswerCache(threshold=0.9)
+    cache.store(_unit([1, 0, 0]), KEY, "What is X?", "X is a thing.", [{"source": "a.txt"}])
+
+    hit = cache.lookup(_unit([1, 0.1, 0]), KEY)
+    assert hit is not None and hit.answer == "X is a thing."
+    assert hit.similarity > 0.9
+    assert cache.lookup(_unit([0, 1, 0]), KEY) is None
+    assert cache.lookup(_unit([1, 0, 0]), KEY[:4] + ("v2", "en")) is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2}
+
+
+def test_entries_of_another_dimension_never_match():
+    cache = AnswerCache()
+    cache.store(_unit([1, 0, 0]), KEY, "q", "old model", [])
+    assert cache.lookup(_unit([1, 0, 0, 0]), KEY) is None
+    cache.store(_unit([1, 0, 0, 0]), KEY, "q", "new model", [])
+    assert cache.lookup(_unit([1, 0, 0, 0]), KEY).answer == "new model"
+
+
+def test_expiry_and_eviction(monkeypatch):
+    cache = AnswerCache(ttl_s=10, max_entries=2)
+    for i in range(3):
+        cache.store(_unit(np.eye(3)[i]), KEY, f"q{i}", f"a{i}", [])
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup(_unit([1, 0, 0]), KEY) is None  # evicted (LRU)
+    assert cache.lookup(_unit([0, 0, 1]), KEY).answer == "a2"
+
+    now = time.time()
+    monkeypatch.setattr("mrc.answer_cache.time.time", lambda: now + 60)
+    assert cache.lookup(_unit([0, 0, 1]), KEY) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+from conftest import make_chunks
+
+from mrc import store
+from mrc.chunkstore import ChunkStore
+
+
+def _rows(n: int, source: str = "a.txt"):
+    return [
+        {"uid": f"{source}:{i}", "source": source, "chunk_id": i, "text": f"text {i}", "lang": "en"}
+        for i in range(n)
+    ]
+
+
+def test_lookups(tmp_path):
+    with ChunkStore(tmp_path / "chunks.db") as cs:
+        cs.upsert(_rows(5) + _rows(2, source="b.txt"))
+        cs.upsert_aliases(
+            [{"uid": "c.txt:0", "source": "c.txt", "chunk_id": 0, "duplicate_of": "a.txt:1"}]
+        )
+
+        got = cs.get_many(["a.txt:3", "missing", "b.txt:0"])
+        assert [r and r["uid"] for r in got] == ["a.txt:3", None, "b.txt:0"]
+        assert [r["chunk_id"] for r in cs.neighbours("a.txt", 2)] == [1, 2, 3]
+        assert cs.aliases_of(["a.txt:1", "a.txt:2"]) == {
+            "a.txt:1": [{"source": "c.txt", "chunk_id": 0}]
+        }
+        assert cs.languages() == {"en": 7}
+
+        cs.delete(["a.txt:0", "c.txt:0"])
+        assert cs.count() == 6 and cs.alias_count() == 0
+        assert cs.sources() == ["a.txt", "b.txt"]
+
+
+def test_readonly_store_reads_but_never_writes(tmp_path):
+    with ChunkStore(tmp_path / "chunks.db") as cs:
+        cs.upsert(_rows(3))
+    with ChunkStore(tmp_path / "chunks.db", readonly=True) as ro:
+        assert ro.get("a.txt:1")["text"] == "text 1"
+        with pytest.raises(sqlite3.OperationalError):
+            ro.upsert(_rows(1, source="b.txt"))
+
+    with pytest.raises(sqlite3.OperationalError):
+        ChunkStore(tmp_path / "gone" / "chunks.db", readonly=True)
+    assert not (tmp_path / "gone").exists()
+
+
+def test_retrieve_reuses_one_connection_per_version():
+    store.rebuild_store(make_chunks({"a.txt": "alpha beta"}), "stub", backend="numpy")
+    store.retrieve("alpha", "stub", backend="numpy")
+    store.retrieve("beta", "stub", backend="numpy")
+    assert len(store._chunk_stores) == 1
+    old = next(iter(store._chunk_stores))
+
+    store.rebuild_store(make_chunks({"b.txt": "gamma delta"}), "stub", backend="numpy")
+    store.retrieve("gamma", "stub", backend="numpy")
+    store.gc_versions("numpy", keep=1)
+    assert old not in store._chunk_stores
+    store.retrieve("gamma", "stub", backend="numpy")
+    assert not Path(old).exists()
+    assert [v["id"] for v in store.list_versions("numpy")] == [store.index_version("numpy")]
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from mrc.context import estimate_tokens, pack_context
+
+OVERLAP = "shared sentence between chunks. "
+
+
+def _chunk(source, cid, text, **extra):
+    return {"source": source, "chunk_id": cid, "text": text, **extra}
+
+
+def test_adjacent_chunks_merge_without_their_overlap():
+    contexts = [
+        _chunk("a.txt", 1, OVERLAP + "second part."),
+        _chunk("b.txt", 0, "another document entirely."),
+        _chunk("a.txt", 0, "first part. " + OVERLAP),
+    ]
+    packed = pack_context(contexts, budget_tokens=1000)
+
+    assert [b.source for b in packed.blocks] == ["a.txt", "b.txt"]
+    a = packed.blocks[0]
+    assert a.chunk_ids == [0, 1]
+    assert a.text == "first part. " + OVERLAP + "second part."
+    assert packed.text.startswith("[Source: a.txt | chunks 0-1]\n")
+    assert packed.tokens_saved > 0
+
+
+def test_duplicate_text_is_dropped_and_aliases_cited():
+    text = "the quarterly revenue report shows strong growth"
+    contexts = [
+        _chunk("a.txt", 0, text, aliases=[{"source": "copy.txt", "chunk_id": 3}]),
+        _chunk("b.txt", 5, text),
+    ]
+    packed = pack_context(contexts, budget_tokens=1000)
+    assert [b.source for b in packed.blocks] == ["a.txt"]
+    assert packed.duplicates == 1
+    assert "also in: copy.txt (chunk 3)" in packed.text
+
+
+def test_budget_cuts_the_overflowing_block_and_drops_the_rest():
+    long = " ".join(f"Sentence number {i} is here." for i in range(200))
+    contexts = [
+        _chunk("a.txt", 0, "short first block."),
+        _chunk("b.txt", 0, long),
+        _chunk("c.txt", 0, "never reached."),
+    ]
+    packed = pack_context(contexts, budget_tokens=300)
+
+    assert [b.source for b in packed.blocks] == ["a.txt", "b.txt"]
+    assert packed.blocks[1].truncated
+    assert packed.blocks[1].text.endswith("here. …")
+    assert packed.dropped == 1
+    assert packed.tokens_out == estimate_tokens(packed.text) <= 300
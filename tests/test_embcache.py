@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import hashlib
+
+import numpy as np
+from conftest import make_chunks
+
+from mrc import embcache, store
+from mrc.embcache import EmbeddingCache
+
+
+def _fps(n: int, start: int = 0):
+    return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(start, start + n)]
+
+
+def _vectors(n: int, start: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(start)
+    return rng.standard_normal((n, 8)).astype(np.float32)
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model")
+    fps, vectors = _fps(5), _vectors(5)
+    cache.put_many(fps, vectors)
+
+    out, missing = cache.get_many(fps[:3] + _fps(1, start=99))
+    assert missing == [3]
+    np.testing.assert_allclose(out[:3], vectors[:3], atol=1e-2)
+    assert not out[3].any()
+
+
+def test_survives_restart(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model")
+    fps, vectors = _fps(5), _vectors(5)
+    cache.put_many(fps, vectors)
+    cache.flush()
+
+    reopened = EmbeddingCache(tmp_path, "model")
+    out, missing = reopened.get_many(fps)
+    assert missing == []
+    np.testing.assert_allclose(out, vectors, atol=1e-2)
+    assert reopened.stats()["entries"] == 5
+
+
+def test_writers_sharing_a_directory(tmp_path):
+    # Two instances stand in for the app and the DAG writing the same cache.
+    a = EmbeddingCache(tmp_path, "model")
+    b = EmbeddingCache(tmp_path, "model")
+    a.put_many(_fps(4), _vectors(4))
+    b.put_many(_fps(4, start=4), _vectors(4, start=4))
+    a.put_many(_fps(4, start=8), _vectors(4, start=8))
+    b.flush()
+    a.flush()
+
+    out, missing = EmbeddingCache(tmp_path, "model").get_many(_fps(12))
+    assert missing == []
+    expected = np.concatenate([_vectors(4), _vectors(4, start=4), _vectors(4, start=8)])
+    np.testing.assert_allclose(out, expected, atol=1e-2)
+
+    # b sees a's rows without reopening.
+    out, missing = b.get_many(_fps(4, start=8))
+    assert missing == []
+    np.testing.assert_allclose(out, _vectors(4, start=8), atol=1e-2)
+
+
+def test_eviction_keeps_recent_rows(tmp_path):
+    row_bytes = 8 * 2  # dim 8, float16
+    cache = EmbeddingCache(tmp_path, "model", max_bytes=10 * row_bytes)
+    for start in range(0, 30, 5):
+        cache.put_many(_fps(5, start=start), _vectors(5, start=start))
+    cache.flush()
+
+    assert cache.stats()["bytes"] <= 10 * row_bytes
+    out, missing = EmbeddingCache(tmp_path, "model").get_many(_fps(5, start=25))
+    assert missing == []
+    np.testing.assert_allclose(out, _vectors(5, start=25), atol=1e-2)
+    assert len(list(cache.dir.glob("vectors*.bin"))) == 1
+
+
+def test_rebuild_after_restart_reuses_embeddings(encoder):
+    chunks = make_chunks({"a.txt": "alpha beta", "b.txt": "gamma delta"})
+    store.rebuild_store(chunks, "stub", backend="numpy")
+    assert encoder.calls == len(chunks)
+
+    embcache._caches.clear()  # as after a process restart
+    store.rebuild_store(chunks, "stub", backend="numpy")
+    assert encoder.calls == len(chunks)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from conftest import make_chunks
+
+from mrc import embcache, embeddings, store
+from mrc.embeddings import ModelRegistry
+
+
+class FakeSentenceTransformer:
+    def __init__(self, name, **kw) -> None:
+        self.name = name
+
+    def parameters(self):
+        return []
+
+    def buffers(self):
+        return []
+
+    def encode(self, texts, **kw):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    monkeypatch.setattr(embeddings, "SentenceTransformer", FakeSentenceTransformer)
+
+
+def test_onnx_falls_back_to_torch(monkeypatch, fake_models):
+    def no_optimum(name, runtime):
+        raise ImportError("optimum is not installed")
+
+    monkeypatch.setattr(embeddings, "_onnx_artifact", no_optimum)
+    registry = ModelRegistry()
+    assert registry.loaded_runtime("m", "onnx") is None
+
+    info = registry.warmup("m", "onnx")
+    assert info.runtime == "torch"
+    assert info.fallback.startswith("ImportError")
+    assert registry.runtime_of("m", "onnx") == "torch"
+    assert registry.loaded_runtime("m", "onnx") == "torch"
+
+
+def test_runtime_of_survives_eviction_right_after_load(fake_models):
+    class Racy(ModelRegistry):
+        def get(self, name, runtime=None):
+            model = super().get(name, runtime)
+            # Another thread loads a model meanwhile, evicting this one.
+            super().get("other", runtime)
+            return model
+
+    assert Racy(max_models=1).runtime_of("a", "torch") == "torch"
+
+
+def test_cached_rebuild_does_not_load_the_model(monkeypatch, encoder):
+    chunks = make_chunks({"a.txt": "alpha beta", "b.txt": "gamma delta"})
+    store.rebuild_store(chunks, "stub", backend="numpy")
+    embcache._caches.clear()
+
+    def no_model(name, runtime=None):
+        raise AssertionError("model loaded for a fully cached build")
+
+    monkeypatch.setattr(store, "get_model", no_model)
+    monkeypatch.setattr(store, "model_runtime", no_model)
+    store.rebuild_store(chunks, "stub", backend="numpy")
+    assert store.list_versions("numpy")[0]["embed_runtime"] == "torch"
+
+
+def test_fallback_embeddings_are_cached_under_the_runtime_used(monkeypatch, encoder):
+    loaded = {}
+
+    def load(name, runtime=None):
+        loaded[name] = "torch"  # ONNX failed: the model runs on torch
+        return "torch"
+
+    monkeypatch.setattr(store, "EMBED_RUNTIME", "onnx")
+    monkeypatch.setattr(store, "model_runtime", load)
+    monkeypatch.setattr(store, "loaded_runtime", lambda name, runtime=None: loaded.get(name))
+    store.rebuild_store(make_chunks({"a.txt": "alpha beta"}), "stub", backend="numpy")
+
+    assert store._embed_cache("stub", "torch").stats()["entries"] == 2
+    assert store._embed_cache("stub", "onnx").stats()["entries"] == 0
+    assert store.list_versions("numpy")[0]["embed_runtime"] == "torch"
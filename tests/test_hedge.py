@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import socket
+import threading
+import time
+
+import pytest
+
+from mrc import hedge, llm
+from mrc.hedge import HedgedTokens, get_health
+from mrc.stubserver import StubLLMServer
+
+
+def _opener(tokens, started=None, error=None):
+    def open_stream(on_open):
+        if started is not None:
+            started.set()
+        on_open(None)
+        yield from tokens
+        if error is not None:
+            raise error
+
+    return open_stream
+
+
+def test_tripped_breaker_goes_straight_to_secondary():
+    for _ in range(hedge.BREAKER_FAILURES):
+        get_health("primary").breaker.failure()
+    assert get_health("primary").breaker.state == "open"
+
+    primary_started = threading.Event()
+    answer = HedgedTokens(
+        primary=("primary", _opener(["never"], started=primary_started)),
+        secondary=("secondary", _opener(["hello", " world"])),
+    )
+    assert "".join(answer) == "hello world"
+    assert answer.backend == "secondary"
+    assert not answer.hedged
+    assert not primary_started.is_set()
+
+
+def test_failed_primary_falls_back_to_secondary():
+    answer = HedgedTokens(
+        primary=("primary", _opener([], error=ConnectionError("refused"))),
+        secondary=("secondary", _opener(["ok"])),
+    )
+    assert list(answer) == ["ok"]
+    assert answer.backend == "secondary"
+    assert answer.hedged
+    assert get_health("primary").counts["failures"] == 1
+
+
+def test_both_backends_failing_raises():
+    answer = HedgedTokens(
+        primary=("primary", _opener([], error=ConnectionError("refused"))),
+        secondary=("secondary", _opener([], error=TimeoutError("slow"))),
+    )
+    with pytest.raises((ConnectionError, TimeoutError)):
+        list(answer)
+
+
+def test_refused_primary_fails_over_at_once(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        refused = f"http://127.0.0.1:{s.getsockname()[1]}"
+    with StubLLMServer() as groq:
+        monkeypatch.setenv("GROQ_API_KEY", "test")
+        monkeypatch.setenv("GROQ_BASE_URL", groq.url)
+        t0 = time.perf_counter()
+        answer = llm.stream_answer(
+            backend="ollama",
+            question="Where is the report?",
+            contexts=[],
+            groq_model="stub",
+            ollama_base_url=refused,
+            ollama_model="stub",
+            hedge=True,
+        )
+        assert "Where is the report?" in "".join(answer)
+        elapsed = time.perf_counter() - t0
+    assert answer.backend == "groq"
+    # Well under the default hedge delay: the refusal is not retried.
+    assert elapsed < hedge.HEDGE_DEFAULT_DELAY_S / 2
+    assert get_health("ollama").counts["failures"] == 1
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import pytest
+
+from mrc.lang import UNKNOWN, chunk_language, detect_language
+
+
+@pytest.mark.parametrize(
+    "text, lang",
+    [
+        ("What is the revenue of the company in this report?", "en"),
+        ("Quel est le chiffre d'affaires de la société dans ce rapport ?", "fr"),
+        ("Wie hoch ist der Umsatz des Unternehmens in diesem Bericht?", "de"),
+        ("¿Cuál es la facturación de la empresa en el informe?", "es"),
+        ("Какова выручка компании в этом отчёте?", "ru"),
+        ("Який дохід компанії у цьому звіті?", "uk"),
+        ("この報告書の会社の売上はいくらですか", "ja"),
+        ("本报告中公司的收入是多少", "zh"),
+        ("ما هي إيرادات الشركة في هذا التقرير؟", "ar"),
+        ("درآمد شرکت در این گزارش چیست؟", "fa"),
+    ],
+)
+def test_detect_language(text, lang):
+    assert detect_language(text) == lang
+
+
+@pytest.mark.parametrize("text", ["", "12345 !!", "Revenue 2023", "ERR-404"])
+def test_short_or_ambiguous_text_is_unknown(text):
+    assert detect_language(text) == UNKNOWN
+
+
+def test_chunk_language_falls_back_to_previous_chunk():
+    assert chunk_language("Table 3: 2021 2022 2023", previous="fr") == "fr"
+    assert chunk_language("Table 3: 2021 2022 2023") == UNKNOWN
+    assert chunk_language("Ceci est la suite du rapport annuel.", previous="en") == "fr"
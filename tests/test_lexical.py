@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from mrc.lexical import LexicalIndex, build_lexical_index, rrf_merge, tokenize
+
+
+@pytest.mark.parametrize(
+    "text, tokens",
+    [
+        ("See ERR-404 in v1.2.3", ["see", "err-404", "err", "404", "in", "v1.2.3", "v1", "2", "3"]),
+        ("ＦＵＬＬ Straße", ["full", "strasse"]),
+        ("東京都に行く", ["東京", "京都", "都に", "に行", "行く"]),
+        # Combining marks stay inside the word.
+        ("हिन्दी भाषा", ["हिन्दी", "भाषा"]),
+        ("x" * 60 + " ok", ["ok"]),
+    ],
+)
+def test_tokenize(text, tokens):
+    assert tokenize(text) == tokens
+
+
+def _index(tmp_path):
+    rows = [
+        ("a", "the error code ERR-404 means not found", "en"),
+        ("b", "the error log of the server", "en"),
+        ("c", "le code d'erreur ERR-404 signifie introuvable", "fr"),
+        ("d", "cooking with tomatoes", "en"),
+    ]
+    assert build_lexical_index(rows, tmp_path / "lexical") == 4
+    return LexicalIndex.open(tmp_path / "lexical")
+
+
+def test_search_ranks_and_filters_by_language(tmp_path):
+    index = _index(tmp_path)
+    hits = index.search("err-404 error", k=3)
+    assert [uid for uid, _ in hits] == ["a", "c", "b"]
+    assert hits[0][1] > hits[1][1] > hits[2][1] > 0
+    assert [uid for uid, _ in index.search("err-404", k=3, lang="fr")] == ["c"]
+    assert index.search("nothing matches", k=3) == []
+
+
+def test_index_from_another_tokenizer_is_ignored(tmp_path):
+    _index(tmp_path)
+    info = tmp_path / "lexical" / "info.json"
+    info.write_text(json.dumps({**json.loads(info.read_text()), "tokenizer": 0}))
+    assert LexicalIndex.open(tmp_path / "lexical") is None
+    assert LexicalIndex.open(tmp_path / "missing") is None
+
+
+def test_rrf_merge_rewards_agreement():
+    fused = rrf_merge([["a", "b", "c"], ["b", "c", "d"]], k=3)
+    assert [uid for uid, _ in fused] == ["b", "c", "a"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
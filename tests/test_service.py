@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from conftest import DIM, make_chunks
+
+from mrc import service, store
+from mrc.client import ServiceClient
+from mrc.embeddings import ModelInfo
+from mrc.service import MicroBatcher, RetrievalService, make_server
+
+FILES = {
+    "a.txt": "quarterly revenue report for europe",
+    "b.txt": "cooking recipe with fresh tomatoes",
+}
+
+
+@pytest.fixture
+def client(monkeypatch, encoder):
+    monkeypatch.setattr(service, "get_model", lambda name, runtime=None: encoder)
+    monkeypatch.setattr(
+        service, "warmup", lambda name, runtime=None: ModelInfo(name, 0.0, 0, warm=True)
+    )
+    store.rebuild_store(make_chunks(FILES), "stub", backend="numpy")
+    svc = RetrievalService("stub", max_wait_s=0.05)
+    svc.load()
+    server = make_server(svc, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield ServiceClient(f"http://127.0.0.1:{server.server_address[1]}"), svc
+    server.shutdown()
+    server.server_close()
+    svc.batcher.close()
+
+
+def test_concurrent_requests_share_batches(client):
+    cli, svc = client
+    assert cli.status()["ready"]
+    queries = ["revenue report", "cooking tomatoes"] * 4
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda q: cli.retrieve(q, top_k=1, backend="numpy"), queries))
+    assert [r[0]["source"] for r in results] == ["a.txt", "b.txt"] * 4
+    assert svc.batcher.items == len(queries)
+    assert svc.batcher.batches < len(queries)
+
+
+def test_bad_embedding_fails_only_its_request(client):
+    cli, _ = client
+
+    def call(emb):
+        return cli.retrieve("revenue report", top_k=1, backend="numpy", query_embedding=emb)
+
+    good = [0.0] * DIM
+    with ThreadPoolExecutor(6) as pool:
+        futures = [pool.submit(call, good) for _ in range(5)]
+        bad = pool.submit(call, [0.1] * 5)
+    with pytest.raises(RuntimeError, match="400"):
+        bad.result()
+    assert all(len(f.result()) == 1 for f in futures)
+
+
+def test_batcher_retries_a_failed_group_item_by_item():
+    def handler(key, items):
+        if "bad" in items:
+            raise ValueError("bad item")
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(handler, max_wait_s=0.2)
+    try:
+        futures = [batcher.submit(("k",), item) for item in ["a", "bad", "b"]]
+        assert futures[0].result(timeout=5)[0] == "A"
+        assert futures[2].result(timeout=5)[0] == "B"
+        with pytest.raises(ValueError):
+            futures[1].result(timeout=5)
+    finally:
+        batcher.close()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import pytest
+from conftest import make_chunks
+
+from mrc import store
+
+FILES = {f"f{i}.txt": f"document number {i} about topic{i}" for i in range(12)}
+
+
+@pytest.fixture(autouse=True)
+def sharded(monkeypatch):
+    monkeypatch.setattr(store, "SHARDS", 4)
+
+
+def test_chunks_fan_out_and_queries_merge_shards():
+    chunks = make_chunks(FILES)
+    assert store.rebuild_store(iter(chunks), "stub", backend="numpy") == len(chunks)
+
+    shards = store.list_shards("numpy")
+    assert len(shards) > 1
+    assert set(shards) == {store.shard_of(c) for c in chunks}
+
+    hits = store.retrieve("document number", "stub", top_k=len(chunks), backend="numpy")
+    assert len(hits) == len(chunks)
+    assert {h["shard"] for h in hits} == set(shards)
+    for h in hits:
+        assert h["shard"] == store.shard_of(h)
+
+
+def test_rollback_reverts_every_shard_of_the_last_build():
+    store.rebuild_store(make_chunks(FILES), "stub", backend="numpy")
+    assert store.rollback("numpy") is None
+    before = store.list_shards("numpy")
+
+    edited = {name: f"{text} revised" for name, text in FILES.items()}
+    store.update_store(make_chunks(edited), "stub", backend="numpy")
+    after = store.list_shards("numpy")
+    assert all(after[name] != vid for name, vid in before.items())
+    versions = store.list_versions("numpy")
+    assert len({v["build"] for v in versions if v["id"] in after.values()}) == 1
+
+    rolled = store.rollback("numpy")
+    assert sorted(rolled.split(",")) == sorted(f"{n}:{v}" for n, v in before.items())
+    assert store.list_shards("numpy") == before
+
+
+def test_shard_update_leaves_other_shards_alone():
+    store.rebuild_store(make_chunks(FILES), "stub", backend="numpy")
+    before = store.list_shards("numpy")
+    name = next(iter(before))
+    part = [c for c in make_chunks(FILES) if store.shard_of(c) == name]
+    for c in part:
+        c["text"] += " revised"
+
+    store.update_store(part, "stub", backend="numpy", shard=name)
+    after = store.list_shards("numpy")
+    assert after[name] != before[name]
+    assert {n: v for n, v in after.items() if n != name} == {
+        n: v for n, v in before.items() if n != name
+    }
+
+
+def test_empty_shard_is_not_rebuilt_on_update():
+    store.rebuild_store(make_chunks(FILES), "stub", backend="numpy")
+    store.rebuild_store([], "stub", backend="numpy", shard="empty")
+    before = store.list_shards("numpy")
+
+    diff = store.update_store(iter(make_chunks(FILES)), "stub", backend="numpy")
+    assert not diff.full_rebuild
+    assert diff.chunks_added == 0
+    assert store.list_shards("numpy") == before
+
+
+@pytest.mark.parametrize("mode", ["hybrid", "lexical"])
+def test_sharded_ranking_matches_unsharded(monkeypatch, mode):
+    # Shard "a" holds the relevant docs, shard "b" barely related ones: each
+    # shard's own BM25 / RRF scores would rank b's best next to a's.
+    # Docs of different lengths, so that no two scores tie.
+    files = {
+        f"a{i}.txt": "solar panel installation guide " + " ".join(f"w{j}" for j in range(i))
+        for i in range(4)
+    }
+    files.update({f"b{i}.txt": f"garden shed paint colours {i} solar" for i in range(4)})
+    chunks = make_chunks(files, per_file=1)
+    for c in chunks:
+        c["group"] = c["source"][0]
+    query = "solar panel installation"
+
+    monkeypatch.setattr(store, "SHARDS", 1)
+    store.rebuild_store(chunks, "stub", backend="numpy")
+    expected = store.retrieve(query, "stub", top_k=4, backend="numpy", mode=mode)
+    store.clear_store()
+
+    monkeypatch.setattr(store, "SHARDS", 2)
+    store.rebuild_store(chunks, "stub", backend="numpy")
+    assert set(store.list_shards("numpy")) == {"a", "b"}
+    hits = store.retrieve(query, "stub", top_k=4, backend="numpy", mode=mode)
+    assert [h["source"] for h in hits] == [h["source"] for h in expected]
+    assert all(h["source"].startswith("a") for h in hits)
+    if mode == "lexical":
+        # Same IDF; only the shards' average doc lengths differ.
+        for h, e in zip(hits, expected):
+            assert h["score"] == pytest.approx(e["score"], rel=0.25)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import pytest
+from conftest import make_chunks
+
+from mrc import store
+from mrc.dedup import dedup_chunks
+
+FILES = {
+    "a.txt": "quarterly revenue report for europe",
+    "b.txt": "cooking recipe with fresh tomatoes",
+    "c.txt": "hiking trail through the alps",
+}
+
+
+def _sources(hits):
+    return [h["source"] for h in hits]
+
+
+def test_noop_sync_embeds_and_writes_nothing(encoder):
+    diff = store.update_store(make_chunks(FILES), "stub", backend="numpy")
+    assert diff.full_rebuild
+    version, calls = store.index_version("numpy"), encoder.calls
+
+    diff = store.update_store(make_chunks(FILES), "stub", backend="numpy")
+    assert not diff.full_rebuild
+    assert diff.added_files == diff.changed_files == diff.removed_files == []
+    assert sorted(diff.unchanged_files) == sorted(FILES)
+    assert diff.chunks_added == diff.chunks_removed == 0
+    assert store.index_version("numpy") == version
+    assert encoder.calls == calls
+
+
+def test_sync_applies_edits_and_removals(encoder):
+    store.update_store(make_chunks(FILES), "stub", backend="numpy")
+    calls = encoder.calls
+
+    files = {**FILES, "a.txt": "annual revenue report for asia"}
+    del files["c.txt"]
+    diff = store.update_store(make_chunks(files), "stub", backend="numpy")
+    assert diff.changed_files == ["a.txt"]
+    assert diff.removed_files == ["c.txt"]
+    assert diff.chunks_added == 2 and diff.chunks_removed == 4
+    assert encoder.calls == calls + 2
+    hits = store.retrieve("hiking trail alps", "stub", top_k=6, backend="numpy")
+    assert "c.txt" not in _sources(hits)
+
+
+def test_sync_keeps_files_that_failed_to_parse():
+    store.update_store(make_chunks(FILES), "stub", backend="numpy")
+    files = {k: v for k, v in FILES.items() if k != "b.txt"}
+    diff = store.update_store(make_chunks(files), "stub", backend="numpy", keep={"b.txt"})
+    assert diff.removed_files == []
+    hits = store.retrieve("cooking recipe tomatoes", "stub", top_k=1, backend="numpy")
+    assert _sources(hits) == ["b.txt"]
+
+
+def test_rebuild_promotes_and_rollback_restores():
+    store.rebuild_store(make_chunks({"a.txt": "first edition text"}), "stub", backend="numpy")
+    first = store.index_version("numpy")
+    store.rebuild_store(make_chunks({"b.txt": "second edition text"}), "stub", backend="numpy")
+    second = store.index_version("numpy")
+    assert second != first
+    assert _sources(store.retrieve("edition", "stub", top_k=1, backend="numpy")) == ["b.txt"]
+
+    assert store.rollback("numpy") == first
+    assert store.index_version("numpy") == first
+    assert _sources(store.retrieve("edition", "stub", top_k=1, backend="numpy")) == ["a.txt"]
+    assert [v["id"] for v in store.list_versions("numpy")] == [second, first]
+    # Nothing older than the first version.
+    assert store.rollback("numpy") is None
+
+
+def test_failed_build_keeps_live_version():
+    store.rebuild_store(make_chunks(FILES), "stub", backend="numpy")
+    version = store.index_version("numpy")
+
+    def broken():
+        yield from make_chunks({"d.txt": "half written"})
+        raise RuntimeError("parser crashed")
+
+    with pytest.raises(RuntimeError):
+        store.rebuild_store(broken(), "stub", backend="numpy")
+    assert store.index_version("numpy") == version
+    assert [v["id"] for v in store.list_versions("numpy")] == [version]
+
+
+@pytest.mark.parametrize("shards", [1, 4])
+def test_near_duplicates_are_aliases(monkeypatch, encoder, shards):
+    monkeypatch.setattr(store, "SHARDS", shards)
+    text = "the quarterly revenue report shows strong growth in europe and asia"
+    names = ["alpha.txt", "beta.txt", "gamma.txt", "delta.txt", "eps.txt"]
+    chunks = [{"source": n, "chunk_id": 0, "text": text, "lang": "en"} for n in names]
+    chunks.append({"source": "zeta.txt", "chunk_id": 0, "text": "cooking with tomatoes"})
+
+    store.rebuild_store(list(dedup_chunks(chunks)), "stub", backend="numpy")
+    assert encoder.calls == 2
+
+    hits = store.retrieve("quarterly revenue report", "stub", top_k=1, backend="numpy")
+    assert _sources(hits) == ["alpha.txt"]
+    assert sorted(a["source"] for a in hits[0]["aliases"]) == sorted(names[1:])
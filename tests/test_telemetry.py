@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+
+from mrc import telemetry
+
+
+class FakeMlflowClient:
+    """In-memory tracking server; `fail_metrics` log_batch calls raise."""
+
+    runs: dict = {}
+    fail_metrics = 0
+
+    def __init__(self, tracking_uri=None) -> None:
+        pass
+
+    def get_experiment_by_name(self, name):
+        return SimpleNamespace(experiment_id="0")
+
+    def create_run(self, experiment_id, start_time=None, tags=None, run_name=None):
+        run_id = str(len(self.runs))
+        self.runs[run_id] = {"status": "RUNNING", "params": [], "metrics": []}
+        return SimpleNamespace(info=SimpleNamespace(run_id=run_id))
+
+    def log_batch(self, run_id, metrics=(), params=()):
+        if metrics and FakeMlflowClient.fail_metrics:
+            FakeMlflowClient.fail_metrics -= 1
+            raise ConnectionError("tracking server down")
+        self.runs[run_id]["params"] += params
+        self.runs[run_id]["metrics"] += metrics
+
+    def set_terminated(self, run_id, status="FINISHED", end_time=None):
+        self.runs[run_id]["status"] = status
+
+    def delete_run(self, run_id):
+        self.runs[run_id]["status"] = "DELETED"
+
+
+@pytest.fixture
+def sink(monkeypatch, tmp_path):
+    FakeMlflowClient.runs = {}
+    FakeMlflowClient.fail_metrics = 0
+    monkeypatch.setattr(telemetry, "MlflowClient", FakeMlflowClient)
+    sink = telemetry.MlflowSink(flush_interval_s=60, spill_path=tmp_path / "spill.jsonl")
+    yield sink
+    sink.close()
+
+
+def _live(runs):
+    return [r for r in runs.values() if r["status"] != "DELETED"]
+
+
+def test_events_with_the_same_params_share_a_run(sink):
+    for i in range(3):
+        sink.log("chat", {"backend": "groq", "top_k": 6}, {"latency_s": i, "ttft_s": None})
+    sink.log("index", {"embedding_model": "e5"}, {"doc_count": 4})
+    assert sink.flush(timeout=5)
+
+    runs = _live(FakeMlflowClient.runs)
+    assert len(runs) == 2 and all(r["status"] == "FINISHED" for r in runs)
+    chat = next(r for r in runs if len(r["metrics"]) == 3)
+    assert [m.step for m in chat["metrics"]] == [0, 1, 2]
+    assert sorted(p.key for p in chat["params"]) == ["backend", "top_k"]
+    assert sink.logged == 4
+
+
+def test_failed_batch_leaves_no_partial_run(sink):
+    FakeMlflowClient.fail_metrics = 1
+    sink.log("chat", {"backend": "groq"}, {"latency_s": 1.0})
+    assert sink.flush(timeout=5)
+    assert sink.spilled == 1 and sink.logged == 0
+    assert _live(FakeMlflowClient.runs) == []
+
+    # The spilled event is logged once with the next batch.
+    assert sink.flush(timeout=5)
+    runs = _live(FakeMlflowClient.runs)
+    assert len(runs) == 1 and runs[0]["status"] == "FINISHED"
+    assert len(runs[0]["metrics"]) == 1
+    assert sink.logged == 1
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import os
+
+from mrc import textcache
+from mrc.textcache import TextCache
+
+
+def test_round_trip_and_parser_tag(tmp_path):
+    cache = TextCache(tmp_path / "cache")
+    digest = textcache.hash_bytes(b"raw pdf bytes")
+    assert cache.get(digest, "pdf-v1") is None
+    cache.put(digest, "pdf-v1", "extracted text é")
+    assert cache.get(digest, "pdf-v1") == "extracted text é"
+    assert cache.get(digest, "pdf-v2") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_unchanged_file_is_not_rehashed(tmp_path, monkeypatch):
+    doc = tmp_path / "doc.txt"
+    doc.write_text("first version")
+    cache = TextCache(tmp_path / "cache")
+    digest = cache.digest_of(doc)
+    assert digest == textcache.hash_file(doc)
+    cache.flush()
+
+    hashed = []
+    monkeypatch.setattr(textcache, "hash_file", lambda p: hashed.append(p) or "x")
+    assert TextCache(tmp_path / "cache").digest_of(doc) == digest
+    assert hashed == []
+
+    doc.write_text("second, longer version")
+    assert TextCache(tmp_path / "cache").digest_of(doc) == "x"
+    assert hashed == [doc]
+
+
+def test_flush_evicts_least_recently_used(tmp_path):
+    cache = TextCache(tmp_path / "cache")
+    blobs = []
+    for i in range(4):
+        digest = textcache.hash_bytes(str(i).encode())
+        cache.put(digest, "txt", os.urandom(512).hex())
+        blob = cache._blob(digest, "txt")
+        os.utime(blob, (i, i))
+        blobs.append((digest, blob))
+    cache.get(blobs[0][0], "txt")  # used most recently
+    # Trimming to EVICT_TO of this takes two of the four blobs.
+    cache.max_bytes = int(sum(blob.stat().st_size for _, blob in blobs) * 0.75)
+
+    cache.flush()
+    assert [blob.exists() for _, blob in blobs] == [True, False, False, True]